@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,13 +49,18 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
-    
+    'clinic.middleware.MetricsMiddleware',
+    'clinic.middleware.ReplicaRoutingMiddleware',
+    'clinic.idempotency.IdempotencyMiddleware',
+    'clinic.admission.AdmissionMiddleware',
+
 
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'clinic.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -88,6 +95,46 @@ DATABASES = {
     }
 }
 
+# Optional read replicas: aliases in CLINIC_DB_REPLICAS serve GET requests
+# (see clinic.db_router). CLINIC_DB_REPLICA_PATHS takes comma-separated SQLite
+# files to try this locally; fill them with `manage.py sync_replicas`.
+CLINIC_DB_REPLICAS = []
+for _i, _path in enumerate(filter(None, os.environ.get('CLINIC_DB_REPLICA_PATHS', '').split(',')), 1):
+    DATABASES[f'replica{_i}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    CLINIC_DB_REPLICAS.append(f'replica{_i}')
+
+DATABASE_ROUTERS = ['clinic.db_router.ReadReplicaRouter']
+
+# After a write, the client's reads stay on the primary this long.
+CLINIC_DB_STICKY_SECONDS = 5
+
+# Caches: 'reference' holds dentists, treatments and drugs (see
+# clinic.refcache). It is per process unless CLINIC_REFERENCE_CACHE_DIR names a
+# directory shared by all workers; per-process entries expire after
+# CLINIC_REFERENCE_LOCAL_SECONDS so other workers pick up changes.
+_REFERENCE_CACHE_DIR = os.environ.get('CLINIC_REFERENCE_CACHE_DIR')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reference': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': _REFERENCE_CACHE_DIR,
+        'TIMEOUT': 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    } if _REFERENCE_CACHE_DIR else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'clinic-reference',
+        'TIMEOUT': 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+CLINIC_REFERENCE_LOCAL_SECONDS = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,3 +177,130 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_ALL_ORIGINS = True
+
+# Appointment change stream (/api/events/appointments/)
+CLINIC_EVENTS_BUFFER_SIZE = 1000
+CLINIC_EVENTS_HEARTBEAT_SECONDS = 15
+CLINIC_EVENTS_MAX_STREAM_SECONDS = 300
+# Under WSGI every open stream holds a worker thread, so streams end sooner
+# and clients resume with Last-Event-ID.
+CLINIC_EVENTS_WSGI_STREAM_SECONDS = 30
+
+# Operational endpoints (/api/profiles/, ...) accept Django staff sessions or
+# this token in the X-Admin-Token header. Empty disables token access.
+CLINIC_ADMIN_TOKEN = os.environ.get('CLINIC_ADMIN_TOKEN', '')
+
+# Per-request profiling: admins send "X-Clinic-Profile: 1" to profile a request.
+# A fraction of all requests can also be sampled and kept when slow.
+CLINIC_PROFILE_DIR = BASE_DIR / 'profiles'
+CLINIC_PROFILE_SAMPLE_RATE = float(os.environ.get('CLINIC_PROFILE_SAMPLE_RATE', '0'))
+CLINIC_PROFILE_SLOW_MS = 1000
+CLINIC_PROFILE_INTERVAL = 0.005
+CLINIC_PROFILE_MAX_ARTIFACTS = 200
+
+# OCR worker processes for multi-page / multi-file uploads (None = CPU count)
+CLINIC_OCR_WORKERS = None
+# OCR engine: 'auto' (tesserocr if installed, else pytesseract), 'tesserocr' or 'pytesseract'
+CLINIC_OCR_BACKEND = os.environ.get('CLINIC_OCR_BACKEND', 'auto')
+# Warm tesserocr API objects kept per process for inline (single-image) requests
+CLINIC_OCR_ENGINE_POOL_SIZE = 2
+CLINIC_OCR_LANG = 'eng'
+CLINIC_OCR_TESSDATA = None
+# Load Pillow and the OCR engine at startup instead of on the first OCR request;
+# set CLINIC_OCR_WARMUP=1 on workers that serve OCR traffic
+CLINIC_OCR_WARMUP = os.environ.get('CLINIC_OCR_WARMUP') == '1'
+
+# /api/process/nlp/batch/: batches of at least the threshold use a process pool
+CLINIC_NLP_BATCH_MAX = 1000
+CLINIC_NLP_WORKERS = None
+CLINIC_NLP_PARALLEL_THRESHOLD = 256
+
+# Admission control for the processing endpoints (see clinic.admission). Per
+# process: `concurrency` requests per endpoint run at once and up to `queue`
+# more wait CLINIC_ADMISSION_WAIT_SECONDS for a slot; the rest get 429.
+CLINIC_ADMISSION_LIMITS = {
+    'process-ocr': {'concurrency': 2, 'queue': 4},
+    'process-acr': {'concurrency': 2, 'queue': 4},
+    'process-document': {'concurrency': 2, 'queue': 4},
+    'process-nlp': {'concurrency': 4, 'queue': 8},
+    'process-nlp-batch': {'concurrency': 1, 'queue': 2},
+}
+CLINIC_ADMISSION_WAIT_SECONDS = 10
+CLINIC_ADMISSION_RETRY_AFTER = 5
+# Per-client token bucket over the same endpoints (None disables it)
+CLINIC_CLIENT_RATE = 1.0
+CLINIC_CLIENT_BURST = 60
+# Behind a reverse proxy, the META key holding the client address it appends
+# (e.g. 'HTTP_X_FORWARDED_FOR'); otherwise REMOTE_ADDR identifies the client
+CLINIC_CLIENT_IP_HEADER = os.environ.get('CLINIC_CLIENT_IP_HEADER') or None
+# Larger uploads to those endpoints are refused, before the body is read when
+# Content-Length declares it and otherwise once that much has been read
+CLINIC_MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+# Extracted medication names must match a Drug row at least this well
+CLINIC_DRUG_MATCH_MIN_CONFIDENCE = 0.75
+
+# Completed appointments older than this move to the archive tables
+# (manage.py archive_appointments).
+CLINIC_ARCHIVE_AFTER_DAYS = 730
+
+# Background jobs (manage.py run_scheduler, see clinic.scheduler)
+CLINIC_SCHEDULER_BATCH_SIZE = 500
+# Set to a number of days to mark appointments still upcoming that long after
+# their date as no-shows; None leaves their status to the dentist, who is
+# notified the day after (flag_unfinished)
+CLINIC_NO_SHOW_AFTER_DAYS = None
+# Reminders are queued for appointments from tomorrow through this many days
+CLINIC_REMINDER_DAYS_AHEAD = 1
+CLINIC_NOTIFICATION_SENDER = 'clinic.notifications.LocalSender'
+# LocalSender also appends each message here as a JSON line when set
+CLINIC_NOTIFICATION_LOG = os.environ.get('CLINIC_NOTIFICATION_LOG')
+CLINIC_NOTIFICATION_MAX_ATTEMPTS = 5
+
+# Utilization report (clinic.utilization, needs NumPy): default period in
+# days, length of one appointment slot and how long a computed report is cached.
+CLINIC_UTILIZATION_DAYS = 90
+CLINIC_APPOINTMENT_SLOT_MINUTES = 30
+CLINIC_UTILIZATION_CACHE_SECONDS = 300
+
+# Upper bound on the occurrences of one recurring series (clinic.series)
+CLINIC_SERIES_MAX_OCCURRENCES = 104
+
+# POSTs to these routes honour an Idempotency-Key header (clinic.idempotency).
+# Responses are replayed for TTL seconds; a duplicate waits up to WAIT seconds
+# for the first request, whose claim lapses after LOCK seconds if it dies.
+CLINIC_IDEMPOTENT_ROUTES = (
+    'appointment-list', 'appointment-series', 'medicalrecord-list', 'payment-list',
+    'patient-signup', 'dentist-signup',
+    'process-ocr', 'process-acr', 'process-nlp', 'process-nlp-batch', 'process-document',
+)
+CLINIC_IDEMPOTENCY_TTL_SECONDS = 24 * 3600
+CLINIC_IDEMPOTENCY_WAIT_SECONDS = 10
+CLINIC_IDEMPOTENCY_LOCK_SECONDS = 300
+
+# Logging: clinic loggers write JSON lines from a background thread so slow
+# stdout pipes never block request workers. Text previews of OCR/dictation are
+# logged at DEBUG; set CLINIC_LOG_LEVEL=INFO (the default with DEBUG off) to
+# keep patient text out of production logs. `manage.py test` only shows errors,
+# so test output stays readable; tests that check logs use assertLogs.
+_TESTING = sys.argv[1:2] == ['test']
+CLINIC_LOG_LEVEL = os.environ.get('CLINIC_LOG_LEVEL', 'ERROR' if _TESTING else 'DEBUG' if DEBUG else 'INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'async_json': {
+            'class': 'clinic.log.AsyncStreamHandler',
+            'stream': 'ext://sys.stdout',
+            'queue_size': 10000,
+        },
+    },
+    'loggers': {
+        'clinic': {
+            'handlers': ['async_json'],
+            'level': CLINIC_LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
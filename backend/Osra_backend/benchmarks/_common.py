@@ -0,0 +1,71 @@
+"""Shared helpers for the benchmark scripts in this directory."""
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BACKEND_DIR / 'benchmarks' / 'results'
+
+
+def setup_django():
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Osra_backend.settings')
+    import django
+    django.setup()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(samples):
+    """p50/p95/p99/mean in milliseconds for a list of durations in seconds."""
+    ordered = sorted(samples)
+    ms = [s * 1000 for s in ordered]
+    return {
+        'n': len(ms),
+        'mean_ms': round(sum(ms) / len(ms), 4) if ms else 0.0,
+        'p50_ms': round(percentile(ms, 50), 4),
+        'p95_ms': round(percentile(ms, 95), 4),
+        'p99_ms': round(percentile(ms, 99), 4),
+    }
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return round(rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024, 1)
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def write_results(name, payload):
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    path = RESULTS_DIR / f'{name}-{stamp}.json'
+    payload = {
+        'benchmark': name,
+        'timestamp': stamp,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        **payload,
+    }
+    path.write_text(json.dumps(payload, indent=2))
+    return path
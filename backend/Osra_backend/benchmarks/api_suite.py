@@ -0,0 +1,156 @@
+"""
+Drives every router endpoint and processing view against the configured
+database and reports p50/p95/p99 latency, queries per request and RSS.
+
+Populate the database first, e.g.:
+    python manage.py migrate
+    python manage.py generate_clinic_data --patients 100000 --appointments 1000000 --records 500000
+
+Then run from backend/Osra_backend:
+    python benchmarks/api_suite.py --repeat 50
+    python benchmarks/api_suite.py --compare benchmarks/results/api_suite-<stamp>.json
+
+Results are written to benchmarks/results/api_suite-<timestamp>.json.
+"""
+import argparse
+import io
+import json
+import time
+
+from _common import max_rss_mb, setup_django, summarize, write_results
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from clinic.urls import router  # noqa: E402
+
+NOTE = "Diagnosis: Pulpitis\nHistory: Pain on lower left molar for 3 days\nNote: Prescribed Amoxicillin 500mg"
+
+
+def sample_png():
+    try:
+        from PIL import Image, ImageDraw
+    except ImportError:
+        return b'not-an-image'
+    img = Image.new('RGB', (600, 160), color='white')
+    ImageDraw.Draw(img).text((10, 10), "Prescription\nAmoxicillin 500mg\nIbuprofen 400mg", fill='black')
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def processing_cases():
+    png = sample_png()
+    return [
+        ('process-ocr', 'post', '/api/process/ocr/',
+         lambda: {'data': {'file': SimpleUploadedFile('rx_scan.png', png, content_type='image/png')}}),
+        ('process-acr', 'post', '/api/process/acr/',
+         lambda: {'data': json.dumps({'text': NOTE}), 'content_type': 'application/json'}),
+        ('process-nlp', 'post', '/api/process/nlp/',
+         lambda: {'data': json.dumps({'text': NOTE}), 'content_type': 'application/json'}),
+        ('process-document', 'post', '/api/process/document/',
+         lambda: {'data': {'file': SimpleUploadedFile('rx_scan.png', png, content_type='image/png')}}),
+    ]
+
+
+def router_cases(sample):
+    cases = []
+    for prefix, viewset, basename in router.registry:
+        model = viewset.queryset.model
+        cases.append((f'{prefix}-list', 'get', f'/api/{prefix}/', dict))
+        pks = list(model.objects.order_by('?').values_list('pk', flat=True)[:sample])
+        if pks:
+            cycle = iter(pks * 1000)
+            cases.append((f'{prefix}-detail', 'get', lambda prefix=prefix, cycle=cycle: f'/api/{prefix}/{next(cycle)}/', dict))
+    return cases
+
+
+class QueryCounter:
+    # connection.queries_log is capped at 9000 entries, so count directly.
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_case(client, method, url, kwargs_factory, repeat):
+    samples, queries = [], []
+    status_codes = set()
+    rss_before = max_rss_mb()
+    for _ in range(repeat):
+        target = url() if callable(url) else url
+        kwargs = kwargs_factory()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            resp = getattr(client, method)(target, **kwargs)
+            samples.append(time.perf_counter() - start)
+        queries.append(counter.count)
+        status_codes.add(resp.status_code)
+    result = summarize(samples)
+    result.update({
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+        'status_codes': sorted(status_codes),
+        'max_rss_mb': max_rss_mb(),
+        'rss_growth_mb': round(max_rss_mb() - rss_before, 1),
+    })
+    return result
+
+
+def compare(current, previous_path):
+    previous = json.loads(open(previous_path).read())['endpoints']
+    print(f"\n{'endpoint':35} {'p95 before':>12} {'p95 now':>12} {'change':>8}")
+    for name, row in current.items():
+        if name in previous:
+            before, now = previous[name]['p95_ms'], row['p95_ms']
+            change = f"{(now - before) / before * 100:+.1f}%" if before else 'n/a'
+            print(f"{name:35} {before:12.2f} {now:12.2f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20, help='Requests per detail/processing endpoint.')
+    parser.add_argument('--list-repeat', type=int, default=3,
+                        help='Requests per list endpoint (unpaginated lists are slow at scale).')
+    parser.add_argument('--skip-lists', action='store_true')
+    parser.add_argument('--only', help='Comma-separated endpoint names to run.')
+    parser.add_argument('--compare', help='Previous results JSON to compare p95 against.')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    # Measure the endpoints themselves, not the per-client rate limit.
+    settings.CLINIC_CLIENT_RATE = None
+    client = Client()
+    cases = router_cases(args.repeat) + processing_cases()
+    only = set(args.only.split(',')) if args.only else None
+    endpoints = {}
+    for name, method, url, kwargs_factory in cases:
+        if only and name not in only:
+            continue
+        is_list = name.endswith('-list')
+        if is_list and args.skip_lists:
+            continue
+        repeat = args.list_repeat if is_list else args.repeat
+        endpoints[name] = row = run_case(client, method, url, kwargs_factory, repeat)
+        print(f"{name:35} p50={row['p50_ms']:9.2f}ms p95={row['p95_ms']:9.2f}ms "
+              f"p99={row['p99_ms']:9.2f}ms q={row['queries_mean']:7.1f} rss={row['max_rss_mb']}MB")
+
+    dataset = {
+        prefix: viewset.queryset.model.objects.count() for prefix, viewset, _ in router.registry
+    }
+    path = write_results('api_suite', {'dataset': dataset, 'endpoints': endpoints, 'max_rss_mb': max_rss_mb()})
+    print(f"\nresults written to {path}")
+    if args.compare:
+        compare(endpoints, args.compare)
+
+
+if __name__ == '__main__':
+    main()
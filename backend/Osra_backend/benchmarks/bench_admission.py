@@ -0,0 +1,170 @@
+"""
+Load test: CRUD latency while processing endpoints are flooded, with and
+without admission control.
+
+Serves the app from a threaded WSGI server (one thread per connection, like a
+threaded gunicorn worker), then for each mode:
+  1. measures GET latency of a few CRUD endpoints on an idle server,
+  2. starts --flood client threads posting to a processing endpoint
+     back to back and measures the same CRUD requests again.
+
+Run from backend/Osra_backend against a populated database:
+    python benchmarks/bench_admission.py [--flood 16] [--endpoint nlp-batch] [--seconds 10]
+
+The NLP batch endpoint is the default flood target because it is CPU-bound
+without external binaries; use --endpoint ocr when Tesseract is installed.
+"""
+import argparse
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from _common import setup_django, summarize, write_results
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+
+from clinic import admission  # noqa: E402
+from clinic.models import Appointment, Dentist, Patient  # noqa: E402
+
+from bench_nlp_batch import make_notes  # noqa: E402
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve():
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def request(url, body=None, content_type=None):
+    req = urllib.request.Request(url, data=body, method='POST' if body is not None else 'GET')
+    if content_type:
+        req.add_header('Content-Type', content_type)
+    try:
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+
+
+def multipart(name, filename, payload, content_type):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+               f'Content-Type: {content_type}\r\n\r\n'.encode())
+    body.write(payload)
+    body.write(f'\r\n--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+def flood_request(endpoint, notes):
+    if endpoint == 'ocr':
+        from api_suite import sample_png
+        body, content_type = multipart('file', 'rx_scan.png', sample_png(), 'image/png')
+        return '/api/process/ocr/', body, content_type
+    return '/api/process/nlp/batch/', json.dumps({'notes': make_notes(notes)}).encode(), 'application/json'
+
+
+def crud_paths():
+    paths = []
+    dentist = Dentist.objects.values_list('pk', flat=True).first()
+    patient = Patient.objects.values_list('pk', flat=True).first()
+    appointment = Appointment.objects.values_list('pk', flat=True).first()
+    if dentist:
+        paths.append(f'/api/dentists/{dentist}/')
+    if patient:
+        paths.append(f'/api/patients/{patient}/')
+    if appointment:
+        paths.append(f'/api/appointments/{appointment}/')
+    if not paths:
+        raise SystemExit("Populate the database first (manage.py generate_clinic_data)")
+    return paths
+
+
+def probe(base, paths, seconds):
+    samples = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for path in paths:
+            started = time.perf_counter()
+            request(base + path)
+            samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def run_mode(base, paths, args, flood):
+    admission.buckets.clear()
+    idle = probe(base, paths, args.seconds / 2)
+    path, body, content_type = flood
+    statuses = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def flooder():
+        while not stop.is_set():
+            code = request(base + path, body, content_type)
+            with lock:
+                statuses[code] = statuses.get(code, 0) + 1
+            if code == 429:
+                # A well-behaved client backs off briefly before retrying.
+                stop.wait(0.05)
+
+    threads = [threading.Thread(target=flooder, daemon=True) for _ in range(args.flood)]
+    for t in threads:
+        t.start()
+    time.sleep(0.5)
+    loaded = probe(base, paths, args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return {'idle': idle, 'flooded': loaded, 'flood_statuses': {str(k): v for k, v in sorted(statuses.items())}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--flood', type=int, default=16, help='Concurrent flooding clients.')
+    parser.add_argument('--endpoint', choices=['nlp-batch', 'ocr'], default='nlp-batch')
+    parser.add_argument('--notes', type=int, default=200, help='Notes per NLP batch request.')
+    parser.add_argument('--seconds', type=float, default=10, help='Measurement time per flooded phase.')
+    args = parser.parse_args()
+
+    settings.ALLOWED_HOSTS = ['127.0.0.1']
+    # One host plays every client here, so the per-client bucket would
+    # throttle the flood before the concurrency limit is exercised.
+    settings.CLINIC_CLIENT_RATE = None
+    limits = settings.CLINIC_ADMISSION_LIMITS
+    server, base = serve()
+    paths = crud_paths()
+    flood = flood_request(args.endpoint, args.notes)
+    results = {}
+    try:
+        for mode, mode_limits in (('unlimited', {}), ('admission', limits)):
+            settings.CLINIC_ADMISSION_LIMITS = mode_limits
+            results[mode] = row = run_mode(base, paths, args, flood)
+            print(f"{mode:10} idle p50={row['idle']['p50_ms']:.1f}ms p95={row['idle']['p95_ms']:.1f}ms | "
+                  f"flooded p50={row['flooded']['p50_ms']:.1f}ms p95={row['flooded']['p95_ms']:.1f}ms "
+                  f"p99={row['flooded']['p99_ms']:.1f}ms | flood statuses {row['flood_statuses']}")
+    finally:
+        server.shutdown()
+    path = write_results('admission', {'flood': args.flood, 'endpoint': args.endpoint, 'notes': args.notes,
+                                       'limits': limits, 'results': results})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Fuzzy drug lookup latency and recall on a synthetic catalogue.
+
+Run from backend/Osra_backend:
+    python benchmarks/bench_drug_index.py [--drugs 20000] [--lookups 5000]
+"""
+import argparse
+import random
+import string
+import time
+
+from _common import setup_django, summarize, write_results
+
+setup_django()
+
+from clinic.drug_index import DrugIndex  # noqa: E402
+
+SYLLABLES = ['am', 'ox', 'ic', 'il', 'lin', 'met', 'ro', 'ni', 'da', 'zole', 'pro', 'fen', 'cet', 'mol',
+             'clin', 'my', 'cin', 'az', 'thro', 'dol', 'pra', 'zo', 'lam', 'ter', 'bu', 'xan', 'vir', 'tan']
+
+
+def make_catalogue(count, rng):
+    names = set()
+    while len(names) < count:
+        names.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 5))).capitalize())
+    return list(enumerate(sorted(names), 1))
+
+
+def corrupt(name, rng):
+    chars = list(name.lower())
+    op = rng.choice(['sub', 'del', 'ins', 'ocr'])
+    i = rng.randrange(len(chars))
+    if op == 'sub':
+        chars[i] = rng.choice(string.ascii_lowercase)
+    elif op == 'del':
+        del chars[i]
+    elif op == 'ins':
+        chars.insert(i, rng.choice(string.ascii_lowercase))
+    else:
+        chars = [{'o': '0', 'l': '1', 's': '5'}.get(c, c) for c in chars]
+    return ''.join(chars)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drugs', type=int, default=20000)
+    parser.add_argument('--lookups', type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    catalogue = make_catalogue(args.drugs, rng)
+    started = time.perf_counter()
+    index = DrugIndex(catalogue)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    queries = [(drug_id, corrupt(name, rng)) for drug_id, name in rng.sample(catalogue, args.lookups)]
+    samples, correct = [], 0
+    for drug_id, query in queries:
+        started = time.perf_counter()
+        match = index.lookup(query)
+        samples.append(time.perf_counter() - started)
+        correct += bool(match and match.drug_id == drug_id)
+
+    # Most words in an OCR'd prescription are not drugs; misses must be cheap too.
+    misses = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 14)))
+              for _ in range(args.lookups)]
+    miss_samples = []
+    for query in misses:
+        started = time.perf_counter()
+        index.lookup(query)
+        miss_samples.append(time.perf_counter() - started)
+
+    stats = summarize(samples)
+    miss_stats = summarize(miss_samples)
+    recall = correct / len(queries)
+    print(f"catalogue={args.drugs} build={build_ms:.0f}ms recall={recall:.3f}")
+    print(f"typo lookups:  p50={stats['p50_ms']:.3f}ms p99={stats['p99_ms']:.3f}ms")
+    print(f"non-drug words: p50={miss_stats['p50_ms']:.3f}ms p99={miss_stats['p99_ms']:.3f}ms")
+    path = write_results('drug_index', {'drugs': args.drugs, 'build_ms': round(build_ms, 1),
+                                        'lookup': stats, 'miss_lookup': miss_stats, 'recall': round(recall, 4)})
+    print(f"results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Streaming CSV export throughput and worker memory.
+
+Populate the database first (see api_suite.py), then run from
+backend/Osra_backend:
+    python benchmarks/bench_export.py [--models appointments payments] [--gzip]
+
+Resident memory is sampled while the response is consumed; with streaming it
+should stay flat regardless of table size.
+"""
+import argparse
+import os
+import time
+
+from _common import max_rss_mb, setup_django, write_results
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from clinic.export import EXPORTS  # noqa: E402
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * PAGE_SIZE / (1024 * 1024), 1)
+    except OSError:
+        return max_rss_mb()
+
+
+def run(client, model, compress):
+    params = {'gzip': '1'} if compress else {}
+    rss_before = current_rss_mb()
+    rss_peak = rss_before
+    started = time.perf_counter()
+    response = client.get(reverse('export-csv', args=[model]), params, HTTP_X_ADMIN_TOKEN=settings.CLINIC_ADMIN_TOKEN)
+    first_byte = None
+    size = lines = 0
+    for i, chunk in enumerate(response.streaming_content):
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+        if not compress:
+            lines += chunk.count(b'\n')
+        if i % 50 == 0:
+            rss_peak = max(rss_peak, current_rss_mb())
+    response.close()
+    elapsed = time.perf_counter() - started
+    rows = max(lines - 1, 0) if not compress else None
+    return {
+        'model': model,
+        'rows': rows,
+        'bytes': size,
+        'seconds': round(elapsed, 3),
+        'first_byte_ms': round((first_byte or 0) * 1000, 1),
+        'rows_per_s': round(rows / elapsed) if rows else None,
+        'rss_before_mb': rss_before,
+        'rss_peak_mb': rss_peak,
+        'rss_growth_mb': round(rss_peak - rss_before, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', default=list(EXPORTS), choices=list(EXPORTS))
+    parser.add_argument('--gzip', action='store_true')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    settings.CLINIC_ADMIN_TOKEN = settings.CLINIC_ADMIN_TOKEN or 'bench-token'
+    client = Client()
+    # Warm imports and URL resolution so RSS growth reflects the export only.
+    client.get(reverse('export-csv', args=['patients']), HTTP_X_ADMIN_TOKEN=settings.CLINIC_ADMIN_TOKEN).close()
+    results = []
+    for model in args.models:
+        result = run(client, model, args.gzip)
+        results.append(result)
+        print(f"{model:15} rows={result['rows']} size={result['bytes'] / 1e6:.1f}MB "
+              f"time={result['seconds']}s first_byte={result['first_byte_ms']}ms "
+              f"rss {result['rss_before_mb']} -> peak {result['rss_peak_mb']} MB")
+    path = write_results('export', {'gzip': args.gzip, 'results': results, 'max_rss_mb': max_rss_mb()})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
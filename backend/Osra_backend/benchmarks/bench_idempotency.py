@@ -0,0 +1,109 @@
+"""
+Idempotency keys: what a retried processing request costs, and how concurrent
+duplicates are handled.
+
+Serves the app from a threaded WSGI server (see bench_admission.py) and
+posts NLP batches to /api/process/nlp/batch/:
+  1. --clients concurrent POSTs with the same Idempotency-Key, as a client
+     retrying over a flaky connection would send; the batch should run once
+     and every other request should receive the replayed response;
+  2. --repeat sequential retries of a finished key against fresh keys.
+
+Run from backend/Osra_backend:
+    python benchmarks/bench_idempotency.py [--clients 8] [--notes 200] [--repeat 20]
+
+Keys are random and the rows they create expire like any others.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from _common import setup_django, summarize, write_results
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+
+from bench_admission import serve  # noqa: E402
+from bench_nlp_batch import make_notes  # noqa: E402
+
+PATH = '/api/process/nlp/batch/'
+
+
+def post(url, body, key):
+    req = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json', 'Idempotency-Key': key,
+    })
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            resp.read()
+            status, replayed = resp.status, resp.headers.get('Idempotent-Replayed') == 'true'
+    except urllib.error.HTTPError as e:
+        e.read()
+        status, replayed = e.code, False
+    return status, replayed, time.perf_counter() - started
+
+
+def concurrent_duplicates(base, body, clients):
+    key = uuid.uuid4().hex
+    results = []
+    lock = threading.Lock()
+    start = threading.Barrier(clients)
+
+    def client():
+        start.wait()
+        outcome = post(base + PATH, body, key)
+        with lock:
+            results.append(outcome)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {
+        'executed': sum(1 for status, replayed, _ in results if status == 200 and not replayed),
+        'replayed': sum(1 for _, replayed, _ in results if replayed),
+        'statuses': sorted(status for status, _, _ in results),
+        'latency': summarize([elapsed for _, _, elapsed in results]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent duplicates of one request.')
+    parser.add_argument('--notes', type=int, default=200, help='Notes per NLP batch.')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    settings.ALLOWED_HOSTS = ['127.0.0.1']
+    settings.CLINIC_CLIENT_RATE = None
+    server, base = serve()
+    body = json.dumps({'notes': make_notes(args.notes)}).encode()
+    try:
+        duplicates = concurrent_duplicates(base, body, args.clients)
+        fresh, retried = [], []
+        for _ in range(args.repeat):
+            key = uuid.uuid4().hex
+            fresh.append(post(base + PATH, body, key)[2])
+            retried.append(post(base + PATH, body, key)[2])
+    finally:
+        server.shutdown()
+
+    results = {'concurrent_duplicates': duplicates, 'first_request': summarize(fresh), 'retry': summarize(retried)}
+    print(f"{args.clients} concurrent duplicates: executed {duplicates['executed']}, "
+          f"replayed {duplicates['replayed']}, statuses {duplicates['statuses']}")
+    for name in ('first_request', 'retry'):
+        row = results[name]
+        print(f"{name:14} p50 {row['p50_ms']:8.2f}ms  p95 {row['p95_ms']:8.2f}ms")
+    path = write_results('idempotency', {'clients': args.clients, 'notes': args.notes, 'results': results})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Bulk CSV import throughput through the HTTP endpoint.
+
+Run from backend/Osra_backend (after ``python manage.py migrate``):
+    python benchmarks/bench_import.py [--rows 100000] [--model patients]
+
+The import runs inside a transaction that is rolled back, so the database is
+left unchanged.
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+
+from _common import max_rss_mb, setup_django, write_results
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.db import transaction  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+FIRST = ['Ahmed', 'Sara', 'Omar', 'Mona', 'Youssef', 'Nour', 'Karim', 'Laila']
+LAST = ['Mohsen', 'Hassan', 'Ibrahim', 'Saleh', 'Fathy', 'Nabil']
+
+
+def write_csv(path, model, rows, rng):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        if model == 'patients':
+            writer.writerow(['first_name', 'last_name', 'gender', 'address', 'phone', 'email', 'date_of_birth', 'allergies'])
+            for i in range(rows):
+                writer.writerow([rng.choice(FIRST), rng.choice(LAST), rng.choice(['Male', 'Female']),
+                                 f'{rng.randrange(1, 200)} Nile St, Cairo', f'011{rng.randrange(10**7, 10**8)}',
+                                 f'import{i}@bench.osra', f'19{rng.randrange(40, 99)}-0{rng.randrange(1, 9)}-1{rng.randrange(0, 9)}',
+                                 rng.choice(['', '', 'Penicillin', 'Latex'])])
+        else:
+            writer.writerow(['name', 'description', 'dosage', 'price'])
+            for i in range(rows):
+                writer.writerow([f'{model[:-1].title()} {i}', 'Imported', '1 unit', f'{rng.randrange(1, 500)}.00'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--model', choices=['patients', 'drugs', 'treatments'], default='patients')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    # As in production; DEBUG keeps every SQL statement in connection.queries.
+    settings.DEBUG = False
+    settings.CLINIC_ADMIN_TOKEN = settings.CLINIC_ADMIN_TOKEN or 'bench-token'
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f'{args.model}.csv')
+        write_csv(path, args.model, args.rows, rng)
+        size_mb = os.path.getsize(path) / 1e6
+        rss_before = max_rss_mb()
+        started = time.perf_counter()
+        with transaction.atomic():
+            with open(path, 'rb') as f:
+                response = Client().post(reverse('import-csv', args=[args.model]), {'file': f},
+                                         HTTP_X_ADMIN_TOKEN=settings.CLINIC_ADMIN_TOKEN)
+            transaction.set_rollback(True)
+        elapsed = time.perf_counter() - started
+    report = response.json()
+    result = {
+        'model': args.model, 'rows': args.rows, 'file_mb': round(size_mb, 1), 'seconds': round(elapsed, 2),
+        'rows_per_s': round(args.rows / elapsed), 'created': report.get('created'), 'failed': report.get('failed'),
+        'rss_before_mb': rss_before, 'max_rss_mb': max_rss_mb(),
+    }
+    print(f"{args.model}: {args.rows} rows ({size_mb:.1f}MB) in {elapsed:.2f}s = {result['rows_per_s']:,} rows/s, "
+          f"created={result['created']} failed={result['failed']} max RSS {rss_before} -> {result['max_rss_mb']} MB")
+    print(f"Results written to {write_results('import', result)}")
+
+
+if __name__ == '__main__':
+    main()
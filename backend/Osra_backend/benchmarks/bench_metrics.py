@@ -0,0 +1,71 @@
+"""
+Measures the overhead of MetricsMiddleware and the metric primitives.
+
+Run from backend/Osra_backend:
+    python benchmarks/bench_metrics.py [--requests 2000]
+"""
+import argparse
+import time
+
+from _common import setup_django, summarize, timed, write_results
+
+setup_django()
+
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from clinic import metrics  # noqa: E402
+
+
+def bench_primitives(n):
+    hist = metrics.Histogram('bench_hist', 'bench', ('route', 'method'))
+    counter = metrics.Counter('bench_counter', 'bench', ('route',))
+    start = time.perf_counter()
+    for i in range(n):
+        hist.observe(0.01, 'api/patients/', 'GET')
+    observe_ns = (time.perf_counter() - start) / n * 1e9
+    start = time.perf_counter()
+    for i in range(n):
+        counter.inc('api/patients/')
+    inc_ns = (time.perf_counter() - start) / n * 1e9
+    return {'histogram_observe_ns': round(observe_ns, 1), 'counter_inc_ns': round(inc_ns, 1)}
+
+
+def bench_requests(n):
+    setup_test_environment()
+    client = Client()
+    # /api/ (the router root) touches no database, so the comparison isolates
+    # the middleware itself rather than SQLite noise.
+    url = '/api/'
+    without = [m for m in settings.MIDDLEWARE if m != 'clinic.middleware.MetricsMiddleware']
+    results = {}
+    for label, middleware in (('without_metrics', without), ('with_metrics', settings.MIDDLEWARE)):
+        with override_settings(MIDDLEWARE=middleware):
+            timed(lambda: client.get(url), 200)  # warm-up
+            results[label] = summarize(timed(lambda: client.get(url), n))
+    base = results['without_metrics']['mean_ms']
+    results['overhead_ms'] = round(results['with_metrics']['mean_ms'] - base, 4)
+    results['overhead_pct'] = round(results['overhead_ms'] / base * 100, 2) if base else 0.0
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--ops', type=int, default=200000)
+    args = parser.parse_args()
+
+    payload = {'primitives': bench_primitives(args.ops), 'requests': bench_requests(args.requests)}
+    path = write_results('metrics_overhead', payload)
+    print(f"histogram.observe: {payload['primitives']['histogram_observe_ns']} ns/op")
+    print(f"counter.inc:       {payload['primitives']['counter_inc_ns']} ns/op")
+    req = payload['requests']
+    print(f"request mean without metrics: {req['without_metrics']['mean_ms']} ms")
+    print(f"request mean with metrics:    {req['with_metrics']['mean_ms']} ms")
+    print(f"overhead: {req['overhead_ms']} ms ({req['overhead_pct']}%)")
+    print(f"results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Clinical note parsing throughput (notes/second), inline vs process pool.
+
+Run from backend/Osra_backend:
+    python benchmarks/bench_nlp_batch.py [--notes 1000] [--workers 4]
+"""
+import argparse
+import os
+import random
+import time
+
+from _common import setup_django, write_results
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+
+from clinic.extraction import extract_clinical_entities_batch  # noqa: E402
+
+TEMPLATE = (
+    "Chief Complaint: {c}\nDiagnosis: {d}\nHistory: {h}\nAllergies: {a}\n"
+    "Medications: {m}\nTreatment Plan:\n- {p}\n- Review in two weeks\nNote: {n}\n"
+)
+
+
+def make_notes(count, seed=7):
+    rng = random.Random(seed)
+    pick = rng.choice
+    return [
+        TEMPLATE.format(
+            c=pick(['pain, swelling', 'bleeding gums', 'sensitivity to cold']),
+            d=pick(['Pulpitis', 'Gingivitis', 'Periodontitis', 'Dental abscess']),
+            h=pick(['Diabetic.', 'Hypertension, controlled.', 'No significant history.']) * rng.randint(1, 20),
+            a=pick(['Penicillin', 'Latex, sulfa', 'None known']),
+            m=pick(['Metformin 500mg', 'Lisinopril 10mg, Aspirin 81mg', 'None']),
+            p=pick(['Root canal', 'Scaling and root planing', 'Extraction']),
+            n='Patient informed of risks. ' * rng.randint(1, 30),
+        )
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--notes', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    settings.CLINIC_NLP_WORKERS = args.workers
+    notes = make_notes(args.notes)
+    results = {}
+    for label, threshold in (('inline', len(notes) + 1), ('pool', 0)):
+        extract_clinical_entities_batch(notes[:50], parallel_threshold=threshold)  # warm-up
+        started = time.perf_counter()
+        _, workers = extract_clinical_entities_batch(notes, parallel_threshold=threshold)
+        elapsed = time.perf_counter() - started
+        results[label] = {'workers': workers, 'seconds': round(elapsed, 4),
+                          'notes_per_second': round(len(notes) / elapsed, 1)}
+        print(f"{label:7} workers={workers:2} {results[label]['notes_per_second']:>10} notes/s")
+    path = write_results('nlp_batch', {'notes': len(notes), 'results': results})
+    print(f"results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
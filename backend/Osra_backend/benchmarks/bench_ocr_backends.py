@@ -0,0 +1,92 @@
+"""
+Compares per-image OCR latency of the available engines on a fixed image set.
+
+Run from backend/Osra_backend:
+    python benchmarks/bench_ocr_backends.py [--images path/to/dir] [--rounds 5]
+
+Without --images a deterministic set of rendered prescription images is used.
+"""
+import argparse
+import time
+from pathlib import Path
+
+from _common import setup_django, summarize, write_results
+
+setup_django()
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from clinic import ocr_backends  # noqa: E402
+
+LINES = [
+    "CITY CLINIC - MEDICAL SERVICES",
+    "DIAGNOSIS: Chronic Sinusitis",
+    "PRESCRIPTION: Amoxicillin 500mg",
+    "Ibuprofen 400mg twice daily after meals",
+    "Chlorhexidine 0.12% mouthwash",
+    "DATE: OCT 26, 2023",
+]
+
+
+def synthetic_images():
+    images = []
+    for i, (w, h) in enumerate([(600, 200), (1200, 400), (1654, 2339)]):
+        img = Image.new('RGB', (w, h), color='white')
+        draw = ImageDraw.Draw(img)
+        for n, line in enumerate(LINES[: 2 + i * 2]):
+            draw.text((20, 20 + n * 30), line, fill='black')
+        images.append((f'synthetic_{w}x{h}', img))
+    return images
+
+
+def load_images(directory):
+    images = []
+    for path in sorted(Path(directory).iterdir()):
+        if path.suffix.lower() in {'.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp'}:
+            with Image.open(path) as img:
+                images.append((path.name, img.convert('RGB')))
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', help='Directory of images to OCR.')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    images = load_images(args.images) if args.images else synthetic_images()
+    results = {}
+    for name in ('pytesseract', 'tesserocr'):
+        try:
+            started = time.perf_counter()
+            backend = ocr_backends.create_backend(name)
+            backend.warm()
+            init_ms = (time.perf_counter() - started) * 1000
+            backend.image_to_text(images[0][1])  # probe: the engine binary/data may be missing
+        except Exception as e:
+            print(f"{name}: unavailable ({type(e).__name__}: {e})")
+            results[name] = {'available': False, 'error': str(e)}
+            continue
+        samples = []
+        try:
+            for _ in range(args.rounds):
+                for _, img in images:
+                    started = time.perf_counter()
+                    backend.image_to_text(img)
+                    samples.append(time.perf_counter() - started)
+        finally:
+            backend.close()
+        results[name] = {'available': True, 'init_ms': round(init_ms, 2), 'per_image': summarize(samples)}
+        row = results[name]['per_image']
+        print(f"{name:12} init={init_ms:8.1f}ms p50={row['p50_ms']:8.2f}ms p95={row['p95_ms']:8.2f}ms")
+
+    if all(results.get(n, {}).get('available') for n in ('pytesseract', 'tesserocr')):
+        a = results['pytesseract']['per_image']['mean_ms']
+        b = results['tesserocr']['per_image']['mean_ms']
+        print(f"tesserocr speed-up: {a / b:.2f}x")
+    path = write_results('ocr_backends', {'images': [n for n, _ in images], 'rounds': args.rounds, 'backends': results})
+    print(f"results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Recurring series: one POST /api/appointments/series/ against the same
+occurrences booked one POST /api/appointments/ at a time.
+
+Each run books --weeks weekly visits at 10:00 for a random dentist and patient
+of the populated database; the series skips occurrences that clash with
+existing bookings, the one-by-one path does not check. Every run happens
+inside a transaction that is rolled back, so the database is left unchanged.
+
+Run from backend/Osra_backend against a populated database:
+    python benchmarks/bench_series.py [--weeks 52] [--repeat 20]
+"""
+import argparse
+import json
+import random
+from datetime import date, timedelta
+
+from _common import setup_django, summarize, timed, write_results
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from clinic.models import Dentist, Patient  # noqa: E402
+
+
+class Rollback(Exception):
+    pass
+
+
+def rolled_back(fn):
+    def run():
+        try:
+            with transaction.atomic():
+                fn()
+                raise Rollback
+        except Rollback:
+            pass
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    settings.DEBUG = False
+    settings.CLINIC_CLIENT_RATE = None
+    rng = random.Random(3)
+    dentists = list(Dentist.objects.values_list('pk', flat=True))
+    patients = list(Patient.objects.values_list('pk', flat=True)[:1000])
+    if not dentists or not patients:
+        raise SystemExit("Populate the database first (manage.py generate_clinic_data)")
+    client = Client()
+    start = date.today() + timedelta(days=1)
+    series_url = reverse('appointment-series')
+    single_url = reverse('appointment-list')
+
+    def body():
+        return {'patient': rng.choice(patients), 'dentist': rng.choice(dentists), 'start_date': start.isoformat(),
+                'appointment_time': '10:00', 'frequency': 'weekly', 'count': args.weeks, 'skip_conflicts': True}
+
+    def series():
+        response = client.post(series_url, json.dumps(body()), content_type='application/json')
+        assert response.status_code == 201, response.content
+
+    def one_by_one():
+        rule = body()
+        for week in range(args.weeks):
+            response = client.post(single_url, json.dumps({
+                'patient': rule['patient'], 'dentist': rule['dentist'], 'status': 'upcoming',
+                'appointment_date': (start + timedelta(weeks=week)).isoformat(), 'appointment_time': '10:00',
+            }), content_type='application/json')
+            assert response.status_code == 201, response.content
+
+    results = {}
+    for name, fn in (('series', series), ('one_by_one', one_by_one)):
+        with CaptureQueriesContext(connection) as queries:
+            rolled_back(fn)()
+        results[name] = {'queries': len(queries), **summarize(timed(rolled_back(fn), args.repeat))}
+        row = results[name]
+        print(f"{name:11} {args.weeks} occurrences: p50 {row['p50_ms']:8.2f}ms  p95 {row['p95_ms']:8.2f}ms  "
+              f"({row['queries']} queries)")
+    path = write_results('series', {'weeks': args.weeks, 'results': results})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Startup cost: wall time of a cold boot and import time per module.
+
+Each scenario runs in a fresh interpreter with ``-X importtime``; the slowest
+modules (cumulative and self time) and every clinic module are reported, plus
+what each optional capability would cost if it were imported eagerly.
+
+Run from backend/Osra_backend:
+    python benchmarks/bench_startup.py [--repeat 5] [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from _common import BACKEND_DIR, summarize, write_results
+
+BOOT = (
+    "import os, django; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Osra_backend.settings'); "
+    "django.setup(); from django.urls import get_resolver; get_resolver().url_patterns"
+)
+
+SCENARIOS = {
+    # What every worker pays before serving its first request.
+    'wsgi_boot': ([sys.executable, '-c', BOOT], {}),
+    'wsgi_boot_ocr_warmup': ([sys.executable, '-c', BOOT], {'CLINIC_OCR_WARMUP': '1'}),
+    # What every management command pays.
+    'manage_check': ([sys.executable, 'manage.py', 'check'], {}),
+}
+
+
+def parse_importtime(stderr):
+    """``{module: (self_us, cumulative_us)}`` from ``-X importtime`` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run(cmd, extra_env):
+    env = dict(os.environ, **extra_env)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'Osra_backend.settings')
+    return subprocess.run([cmd[0], '-X', 'importtime'] + cmd[1:], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def wall_times(cmd, extra_env, repeat):
+    samples = []
+    env = dict(os.environ, **extra_env)
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(cmd, cwd=BACKEND_DIR, env=env, capture_output=True, check=True)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def capability_costs():
+    sys.path.insert(0, str(BACKEND_DIR))
+    from clinic.capabilities import CAPABILITIES
+
+    costs = {}
+    for name, spec in CAPABILITIES.items():
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {spec.module}'],
+                              capture_output=True, text=True)
+        if proc.returncode:
+            costs[name] = None
+            continue
+        top = spec.module.split('.', 1)[0]
+        modules = parse_importtime(proc.stderr)
+        costs[name] = round(max(modules.get(spec.module, (0, 0))[1], modules.get(top, (0, 0))[1]) / 1000, 1)
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Cold starts timed per scenario.')
+    parser.add_argument('--top', type=int, default=15, help='Slowest modules listed per scenario.')
+    args = parser.parse_args()
+
+    results = {}
+    for name, (cmd, extra_env) in SCENARIOS.items():
+        modules = parse_importtime(run(cmd, extra_env).stderr)
+        wall = wall_times(cmd, extra_env, args.repeat)
+        by_cumulative = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)
+        by_self = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)
+        clinic = {m: round(c / 1000, 2) for m, (_, c) in sorted(modules.items()) if m.split('.')[0] == 'clinic'}
+        results[name] = {
+            'wall': wall,
+            'modules_imported': len(modules),
+            'top_cumulative_ms': {m: round(c / 1000, 2) for m, (_, c) in by_cumulative[:args.top]},
+            'top_self_ms': {m: round(s / 1000, 2) for m, (s, _) in by_self[:args.top]},
+            'clinic_cumulative_ms': clinic,
+        }
+        print(f"\n{name}: p50 {wall['p50_ms']:.0f}ms  p95 {wall['p95_ms']:.0f}ms  ({len(modules)} modules)")
+        for module, (self_us, cumulative_us) in by_self[:args.top]:
+            print(f"  {module:50} self {self_us / 1000:7.2f}ms  cumulative {cumulative_us / 1000:8.2f}ms")
+        slowest = sorted(clinic.items(), key=lambda item: item[1], reverse=True)[:5]
+        print("  clinic modules: " + ', '.join(f"{m} {ms:.1f}ms" for m, ms in slowest))
+
+    costs = capability_costs()
+    print("\nOptional capabilities (loaded lazily), import cost if eager:")
+    for name, ms in costs.items():
+        print(f"  {name:12} {'not installed' if ms is None else f'{ms}ms'}")
+    path = write_results('startup', {'scenarios': results, 'capability_import_ms': costs})
+    print(f"\nResults written to {path}")
+
+
+if __name__ == '__main__':
+    main()
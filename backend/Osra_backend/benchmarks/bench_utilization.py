@@ -0,0 +1,149 @@
+"""
+Utilization report: NumPy (clinic.utilization) against a plain Python loop
+over Appointment rows.
+
+By default a scratch in-memory database is migrated and filled with
+--appointments synthetic rows (dentists x working days x half-hour slots);
+--existing reads the configured database instead. Both implementations
+compute the same aggregates and their totals are checked against each other.
+
+Run from backend/Osra_backend (needs NumPy):
+    python benchmarks/bench_utilization.py [--appointments 1000000] [--repeat 3]
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+from _common import max_rss_mb, setup_django, summarize, timed, write_results
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models import Max, Min  # noqa: E402
+
+from clinic import utilization  # noqa: E402
+from clinic.models import Appointment, Dentist, Patient  # noqa: E402
+
+STATUSES = (('completed', 85), ('canceled', 10), ('no-show', 5))
+
+
+def populate(appointments, dentists, seed=7):
+    rng = random.Random(seed)
+    Dentist.objects.bulk_create([
+        Dentist(first_name=f'D{i}', last_name='Bench', specialty='General', phone=str(i)) for i in range(dentists)
+    ])
+    patient = Patient.objects.create(first_name='P', last_name='Bench', gender='F', address='x', phone='0')
+    dentist_ids = list(Dentist.objects.values_list('pk', flat=True))
+    slots = [f'{h:02d}:{m:02d}:00' for h in range(9, 17) for m in (0, 30)]
+    statuses, weights = zip(*STATUSES)
+    table = Appointment._meta.db_table
+    sql = (f'INSERT INTO {table} (patient_id, dentist_id, appointment_date, appointment_time, status, notes) '
+           f'VALUES (%s, %s, %s, %s, %s, %s)')
+    day = date(2020, 1, 6)
+    rows = []
+    with connection.cursor() as cursor:
+        while appointments > 0:
+            if day.weekday() < 6:
+                for dentist in dentist_ids:
+                    booked = rng.sample(slots, rng.randint(6, 14))
+                    for slot in booked[:appointments]:
+                        rows.append((patient.pk, dentist, day.isoformat(), slot,
+                                     rng.choices(statuses, weights)[0], ''))
+                    appointments -= min(len(booked), appointments)
+                    if appointments <= 0:
+                        break
+            day += timedelta(days=1)
+            if len(rows) >= 50_000 or appointments <= 0:
+                cursor.executemany(sql, rows)
+                rows = []
+
+
+def naive(start, end, today, slot_minutes):
+    """The same report with a Python loop over model instances."""
+    heat = defaultdict(int)
+    per_day = defaultdict(list)
+    totals = defaultdict(lambda: defaultdict(int))
+    qs = Appointment.objects.filter(appointment_date__gte=start, appointment_date__lte=end)
+    for a in qs.iterator(chunk_size=5000):
+        counts = totals[a.dentist_id]
+        counts['appointments'] += 1
+        if a.status in utilization.CANCELED:
+            counts['canceled'] += 1
+            continue
+        heat[a.dentist_id, a.appointment_date.weekday(), a.appointment_time.hour] += 1
+        per_day[a.dentist_id, a.appointment_date].append(a.appointment_time.hour * 60 + a.appointment_time.minute)
+        if a.appointment_date < today:
+            counts['due'] += 1
+            counts['no_shows'] += a.status == utilization.NO_SHOW
+    weekdays = [0] * 7
+    day = start
+    while day <= end:
+        weekdays[day.weekday()] += 1
+        day += timedelta(days=1)
+    occupancy = {key: n / (weekdays[key[1]] * 60 / slot_minutes) for key, n in heat.items()}
+    gaps = defaultdict(list)
+    for (dentist, _), minutes in per_day.items():
+        minutes.sort()
+        gaps[dentist].extend(max(b - a - slot_minutes, 0) for a, b in zip(minutes, minutes[1:]))
+    all_gaps = [g for values in gaps.values() for g in values]
+    return {
+        'appointments': sum(c['appointments'] for c in totals.values()),
+        'canceled': sum(c['canceled'] for c in totals.values()),
+        'no_shows': sum(c['no_shows'] for c in totals.values()),
+        'avg_gap_minutes': round(sum(all_gaps) / len(all_gaps), 4) if all_gaps else None,
+        'cells': len(occupancy),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--appointments', type=int, default=1_000_000, help='Synthetic rows to generate.')
+    parser.add_argument('--dentists', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--existing', action='store_true', help='Use the configured database as is.')
+    args = parser.parse_args()
+
+    if not args.existing:
+        connection.creation.create_test_db(verbosity=0)
+        started = time.perf_counter()
+        populate(args.appointments, args.dentists)
+        print(f"Generated {args.appointments} appointments in {time.perf_counter() - started:.1f}s")
+    bounds = Appointment.objects.aggregate(start=Min('appointment_date'), end=Max('appointment_date'))
+    start, end = bounds['start'], bounds['end']
+    today = end - (end - start) / 10
+    slot_minutes = getattr(settings, 'CLINIC_APPOINTMENT_SLOT_MINUTES', 30)
+    rows = Appointment.objects.count()
+
+    naive_result = naive(start, end, today, slot_minutes)
+    columns = utilization.load(start, end)
+    report = utilization.summarize(columns, start, end, today, slot_minutes)
+    for key in ('appointments', 'canceled', 'no_shows', 'avg_gap_minutes'):
+        assert naive_result[key] == report['totals'][key], (key, naive_result[key], report['totals'][key])
+
+    results = {
+        'naive_loop': summarize(timed(lambda: naive(start, end, today, slot_minutes), args.repeat)),
+        'numpy_load': summarize(timed(lambda: utilization.load(start, end), args.repeat)),
+        'numpy_compute': summarize(timed(lambda: utilization.summarize(columns, start, end, today, slot_minutes),
+                                         args.repeat)),
+    }
+    cache.clear()
+    results['report_cold'] = summarize(timed(lambda: (cache.clear(), utilization.report(start, end, today)),
+                                             args.repeat))
+    results['report_cached'] = summarize(timed(lambda: utilization.report(start, end, today), 100))
+    for name, row in results.items():
+        print(f"{name:14} p50 {row['p50_ms']:10.2f}ms  p95 {row['p95_ms']:10.2f}ms")
+    speedup = results['naive_loop']['p50_ms'] / results['report_cold']['p50_ms']
+    print(f"{rows} appointments, {start}..{end}: NumPy report {speedup:.1f}x faster than the loop "
+          f"(max RSS {max_rss_mb()} MB)")
+    path = write_results('utilization', {'appointments': rows, 'start': start.isoformat(), 'end': end.isoformat(),
+                                         'speedup': round(speedup, 1), 'max_rss_mb': max_rss_mb(),
+                                         'results': results})
+    print(f"Results written to {path}")
+
+
+if __name__ == '__main__':
+    main()
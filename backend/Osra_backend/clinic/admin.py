@@ -6,10 +6,13 @@ admin.site.register(Dentist)
 admin.site.register(Appointment)
 admin.site.register(Treatment)
 admin.site.register(Drug)
+admin.site.register(DrugClass)
+admin.site.register(DrugClassMember)
 admin.site.register(MedicalRecord)
 admin.site.register(AppointmentTreatment)
 admin.site.register(TreatmentDrug)
 admin.site.register(Invoice)
 admin.site.register(Payment)
-
-
+admin.site.register(ScheduledJob)
+admin.site.register(NotificationOutbox)
+admin.site.register(IdempotencyKey)
@@ -0,0 +1,278 @@
+"""
+Admission control for the expensive processing endpoints (OCR, ACR, NLP,
+document pipeline).
+
+Three checks run before such a request reaches its view, cheapest first:
+
+* Upload cap: a declared Content-Length above CLINIC_MAX_UPLOAD_BYTES is
+  refused with 413 before any of the body is read or parsed. The body stream
+  is also capped, so a request whose length was understated gets 413 as soon
+  as it is read past the limit.
+* Per-client token bucket: each client may start CLINIC_CLIENT_BURST
+  processing requests at once and CLINIC_CLIENT_RATE more per second. The
+  client is its address, taken from CLINIC_CLIENT_IP_HEADER when the app runs
+  behind a proxy, otherwise REMOTE_ADDR.
+* Per-endpoint concurrency: at most ``concurrency`` requests to an endpoint
+  run at once and at most ``queue`` more wait, for up to
+  CLINIC_ADMISSION_WAIT_SECONDS, for a slot. A streamed response keeps its
+  slot until the stream is finished or closed.
+
+Anything over a limit gets 429 with a Retry-After hint right away, so a flood
+of uploads can occupy at most the configured number of worker threads and the
+rest of the API keeps its latency. Limits are per process, like the workers
+they protect.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+from . import metrics
+
+REJECTED = metrics.registry.counter(
+    'clinic_admission_rejected_total', 'Processing requests refused by admission control.',
+    ('route', 'reason'),
+)
+WAIT = metrics.registry.histogram(
+    'clinic_admission_wait_seconds', 'Time admitted processing requests waited for a slot.',
+    ('route',),
+)
+
+# Idle buckets are dropped once there are this many clients.
+MAX_BUCKETS = 10000
+
+
+class Gate:
+    """A counting semaphore with a bounded number of waiters."""
+
+    def __init__(self, concurrency, queue):
+        self.concurrency = concurrency
+        self.queue = queue
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+
+    def acquire(self, timeout):
+        """True once a slot is held; False if the queue is full or ``timeout`` passes."""
+        with self._cond:
+            if self._running < self.concurrency:
+                self._running += 1
+                return True
+            if self._waiting >= self.queue:
+                return False
+            self._waiting += 1
+            try:
+                if not self._cond.wait_for(lambda: self._running < self.concurrency, timeout):
+                    return False
+                self._running += 1
+                return True
+            finally:
+                self._waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify()
+
+
+class TokenBuckets:
+    """Per-key token buckets refilled continuously at ``rate`` per second."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now=None):
+        """Take one token for ``key``; return 0, or the seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                if len(self._buckets) > MAX_BUCKETS:
+                    self._prune(now, rate, burst)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+    def _prune(self, now, rate, burst):
+        # A bucket that has refilled completely is the same as no bucket.
+        for key, (tokens, stamp) in list(self._buckets.items()):
+            if tokens + (now - stamp) * rate >= burst:
+                del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+buckets = TokenBuckets()
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def gate_for(route):
+    limits = getattr(settings, 'CLINIC_ADMISSION_LIMITS', {}).get(route)
+    if not limits:
+        return None
+    key = (route, limits['concurrency'], limits['queue'])
+    with _gates_lock:
+        gate = _gates.get(key)
+        if gate is None:
+            gate = _gates[key] = Gate(limits['concurrency'], limits['queue'])
+    return gate
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class _CappedStream:
+    """A request body stream that raises UploadTooLarge past ``limit`` bytes."""
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.read_bytes = 0
+
+    def _count(self, data):
+        self.read_bytes += len(data)
+        if self.read_bytes > self.limit:
+            raise UploadTooLarge(self.limit)
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            # Never pull more than one byte past the limit into memory.
+            size = self.limit - self.read_bytes + 1
+        return self._count(self.stream.read(size))
+
+    def readline(self, size=-1):
+        if size is None or size < 0:
+            size = self.limit - self.read_bytes + 1
+        return self._count(self.stream.readline(size))
+
+    def close(self):
+        self.stream.close()
+
+
+def cap_upload(request, max_bytes):
+    """Limit how much of ``request``'s body can be read; call before reading it."""
+    if not isinstance(request._stream, _CappedStream):
+        request._stream = _CappedStream(request._stream, max_bytes)
+
+
+def client_address(request):
+    header = getattr(settings, 'CLINIC_CLIENT_IP_HEADER', None)
+    if header:
+        # Proxies append to X-Forwarded-For, so the last entry is the address
+        # our own proxy saw; earlier ones are whatever the client sent.
+        address = request.META.get(header, '').rsplit(',', 1)[-1].strip()
+        if address:
+            return address
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _reject(route, reason, status, message, retry_after=None):
+    REJECTED.inc(route, reason)
+    response = JsonResponse({"error": message}, status=status)
+    if retry_after is not None:
+        response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def too_large(route, max_bytes):
+    return _reject(route, 'too_large', 413, f"Upload exceeds {max_bytes} bytes")
+
+
+class _ReleasingStream:
+    """Streaming content that releases a gate slot once, when exhausted or closed."""
+
+    def __init__(self, content, release):
+        self._iterator = iter(content)
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            try:
+                getattr(self._iterator, 'close', lambda: None)()
+            finally:
+                release()
+
+
+def route_name(request):
+    try:
+        return resolve(request.path_info).url_name
+    except Resolver404:
+        return None
+
+
+class AdmissionMiddleware:
+    """Applies the admission checks to routes listed in CLINIC_ADMISSION_LIMITS."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        limits = getattr(settings, 'CLINIC_ADMISSION_LIMITS', {})
+        if request.method != 'POST' or not limits:
+            return self.get_response(request)
+        route = route_name(request)
+        gate = gate_for(route)
+        if gate is None:
+            return self.get_response(request)
+
+        max_bytes = getattr(settings, 'CLINIC_MAX_UPLOAD_BYTES', None)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if max_bytes:
+            if length > max_bytes:
+                return too_large(route, max_bytes)
+            cap_upload(request, max_bytes)
+
+        rate = getattr(settings, 'CLINIC_CLIENT_RATE', None)
+        if rate:
+            burst = getattr(settings, 'CLINIC_CLIENT_BURST', 1)
+            wait = buckets.take(client_address(request), rate, burst)
+            if wait:
+                return _reject(route, 'rate_limited', 429, "Too many processing requests; slow down", wait)
+
+        timeout = getattr(settings, 'CLINIC_ADMISSION_WAIT_SECONDS', 10)
+        started = time.perf_counter()
+        if not gate.acquire(timeout):
+            return _reject(route, 'saturated', 429, "Processing is at capacity; retry shortly",
+                           getattr(settings, 'CLINIC_ADMISSION_RETRY_AFTER', 5))
+        WAIT.observe(time.perf_counter() - started, route)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            gate.release()
+            raise
+        if response.streaming and not response.is_async:
+            # The work happens as the body is sent; hold the slot until then.
+            response.streaming_content = _ReleasingStream(response.streaming_content, gate.release)
+        else:
+            gate.release()
+        return response
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, UploadTooLarge):
+            return too_large(route_name(request), exception.args[0])
+        return None
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ClinicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinic'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        if getattr(settings, 'CLINIC_OCR_WARMUP', False):
+            from . import ocr
+            ocr.warm_up()
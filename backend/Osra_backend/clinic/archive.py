@@ -0,0 +1,77 @@
+"""
+Hot/cold split of appointment history.
+
+Completed appointments older than CLINIC_ARCHIVE_AFTER_DAYS move, together with
+their treatment lines and medical records, into the Archived* tables, one
+primary-key chunk per transaction. Appointments that have an invoice stay hot
+because invoices and payments reference them. Notifications already queued
+for an archived appointment stay in the outbox with the link cleared. List endpoints read only the hot
+tables unless asked for ``?include_archived=1``, which UNIONs the archive in.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from . import signals
+from .models import (
+    Appointment, AppointmentTreatment, ArchivedAppointment, ArchivedAppointmentTreatment,
+    ArchivedMedicalRecord, MedicalRecord,
+)
+
+ARCHIVABLE_STATUSES = ('completed',)
+
+
+def default_cutoff():
+    return date.today() - timedelta(days=getattr(settings, 'CLINIC_ARCHIVE_AFTER_DAYS', 730))
+
+
+def archivable(cutoff):
+    return Appointment.objects.filter(
+        status__in=ARCHIVABLE_STATUSES, appointment_date__lt=cutoff, invoice__isnull=True,
+    )
+
+
+def _copy(instance, archive_model, **overrides):
+    values = {f.attname: getattr(instance, f.attname) for f in archive_model._meta.concrete_fields}
+    values.update(overrides)
+    return archive_model(**values)
+
+
+def archive_chunk(cutoff, after_pk=0, chunk_size=1000):
+    """Move one chunk of archivable appointments. Returns ``(moved, records, last_pk)``."""
+    with transaction.atomic():
+        appointments = list(
+            archivable(cutoff).filter(pk__gt=after_pk).order_by('pk')
+            # The invoice check is an outer join; lock only the appointment rows.
+            .select_for_update(of=('self',))[:chunk_size]
+        )
+        if not appointments:
+            return 0, 0, after_pk
+        ids = [a.pk for a in appointments]
+        lines = list(AppointmentTreatment.objects.filter(appointment_id__in=ids))
+        records = list(MedicalRecord.objects.filter(appointment_id__in=ids))
+
+        ArchivedAppointment.objects.bulk_create([_copy(a, ArchivedAppointment) for a in appointments])
+        ArchivedAppointmentTreatment.objects.bulk_create([_copy(line, ArchivedAppointmentTreatment) for line in lines])
+        ArchivedMedicalRecord.objects.bulk_create([_copy(r, ArchivedMedicalRecord) for r in records])
+
+        AppointmentTreatment.objects.filter(pk__in=[line.pk for line in lines]).delete()
+        MedicalRecord.objects.filter(pk__in=[r.pk for r in records]).delete()
+        # Archiving is not a change dashboards need to hear about.
+        with signals.appointment_events_muted():
+            Appointment.objects.filter(pk__in=ids).delete()
+        return len(ids), len(records), ids[-1]
+
+
+def with_archived(hot, cold, ordering):
+    """UNION ALL of a hot queryset and its archive counterpart, ordered.
+
+    Both sides must already be filtered; the result only supports ordering,
+    slicing and counting. Rows come back as instances of the hot model.
+    """
+    return hot.order_by().union(cold.order_by(), all=True).order_by(*ordering)
+
+
+def include_archived(request):
+    return request.query_params.get('include_archived', '').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,88 @@
+"""
+Registry of optional, import-heavy dependencies: OCR engines, imaging, PDF
+rasterization, NumPy for the utilization report and the outbound HTTP client.
+
+Nothing here is imported until a request needs it, so ``manage.py`` commands
+and worker boots that never OCR a page do not pay for it. ``available()``
+only asks the import system whether a module could be found and caches the
+answer; ``load()`` imports it on first use, records how long that took and
+raises MissingDependency (an ImportError) when it is not installed.
+"""
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+from collections import namedtuple
+
+Capability = namedtuple('Capability', 'module description')
+
+CAPABILITIES = {
+    'imaging': Capability('PIL.Image', 'Pillow, to decode uploaded images'),
+    'pdf': Capability('pdf2image', 'pdf2image (with poppler), to rasterize PDF pages'),
+    'pytesseract': Capability('pytesseract', 'OCR through the tesseract binary'),
+    'tesserocr': Capability('tesserocr', 'OCR through libtesseract bindings'),
+    'numpy': Capability('numpy', 'NumPy, to compute the utilization report'),
+    'http': Capability('urllib.request', 'outbound HTTP client for the disease search proxy'),
+}
+
+
+class MissingDependency(ImportError):
+    pass
+
+
+_available = {}
+_import_ms = {}
+_lock = threading.Lock()
+
+
+def _spec(name):
+    try:
+        return CAPABILITIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown capability {name!r}")
+
+
+def available(name):
+    """Whether ``name`` can be imported, without importing it."""
+    module = _spec(name).module
+    if module in sys.modules:
+        return True
+    cached = _available.get(name)
+    if cached is None:
+        try:
+            cached = importlib.util.find_spec(module.split('.', 1)[0]) is not None
+        except (ImportError, ValueError):
+            cached = False
+        _available[name] = cached
+    return cached
+
+
+def load(name):
+    """Import and return the module behind capability ``name``."""
+    spec = _spec(name)
+    # sys.modules is the cache; after the first import this is a dict lookup.
+    module = sys.modules.get(spec.module)
+    if module is not None:
+        return module
+    with _lock:
+        started = time.perf_counter()
+        try:
+            module = importlib.import_module(spec.module)
+        except ImportError as e:
+            _available[name] = False
+            raise MissingDependency(f"{spec.description} is not installed: {e}") from e
+        _import_ms.setdefault(name, round((time.perf_counter() - started) * 1000, 2))
+    return module
+
+
+def status():
+    """``{name: {'available', 'loaded', 'import_ms'}}`` for every capability."""
+    return {
+        name: {
+            'available': available(name),
+            'loaded': spec.module in sys.modules,
+            'import_ms': _import_ms.get(name),
+        }
+        for name, spec in CAPABILITIES.items()
+    }
@@ -0,0 +1,145 @@
+"""
+Prescription safety checks against a patient's allergies and current medications.
+
+Patient.allergies / Patient.medications are parsed into normalised terms when
+the patient is saved (see Patient.save), and the DrugClass table is held in
+memory as a term -> classes map that is rebuilt lazily after any class change.
+A check is therefore a handful of set lookups per prescribed drug and never
+touches the free text.
+"""
+import re
+import threading
+
+_SPLIT = re.compile(r'[,;\n/+&]|\band\b|\bwith\b', re.IGNORECASE)
+_WORD = re.compile(r'[a-z]+')
+_NONE = re.compile(r'^(none|nil|no|n ?a|nkda|nkma|no known( drug| medication)? allerg(y|ies)|not? applicable)$')
+# Words that qualify a term rather than name a substance.
+_QUALIFIERS = frozenset({
+    'allergy', 'allergies', 'allergic', 'to', 'sensitivity', 'intolerance', 'intolerant', 'reaction',
+    'drug', 'drugs', 'mg', 'mcg', 'g', 'ml', 'iu', 'tab', 'tabs', 'tablet', 'tablets', 'cap', 'caps',
+    'capsule', 'capsules', 'daily', 'od', 'bd', 'bid', 'tid', 'qid', 'prn', 'mouthwash', 'gel',
+    'injection', 'mild', 'severe', 'suspected',
+})
+MAX_PHRASE_WORDS = 3
+
+
+def _words(text):
+    return [w for w in _WORD.findall(text.lower()) if w not in _QUALIFIERS]
+
+
+def normalize_term(text):
+    return ' '.join(_words(text))
+
+
+def term_variants(text):
+    """The normalised phrase plus its leading one- and two-word prefixes."""
+    words = _words(text)[:MAX_PHRASE_WORDS]
+    return {' '.join(words[:n]) for n in range(1, len(words) + 1) if len(words[0]) >= 3}
+
+
+def parse_terms(text):
+    """Split free text such as "Penicillin, sulfa drugs" into sorted normalised terms."""
+    terms = set()
+    for part in _SPLIT.split(text or ''):
+        if _NONE.match(' '.join(_WORD.findall(part.lower()))):
+            continue
+        terms |= term_variants(part)
+    return sorted(terms)
+
+
+class ClassMap:
+    def __init__(self, classes, members, contraindications):
+        """``classes`` is ``(id, name)``, ``members`` is ``(class_id, name)`` and
+        ``contraindications`` is ``(class_id, class_id)``."""
+        names = dict(classes)
+        term_classes = {}
+        for class_id, name in names.items():
+            term_classes.setdefault(normalize_term(name), set()).add(name)
+        for class_id, member in members:
+            term_classes.setdefault(normalize_term(member), set()).add(names[class_id])
+        self.term_classes = {term: frozenset(v) for term, v in term_classes.items() if term}
+        contraindicated = {}
+        for a, b in contraindications:
+            contraindicated.setdefault(names[a], set()).add(names[b])
+            contraindicated.setdefault(names[b], set()).add(names[a])
+        self.contraindicated = {name: frozenset(v) for name, v in contraindicated.items()}
+
+    def classes_for(self, terms):
+        found = set()
+        for term in terms:
+            found |= self.term_classes.get(term, frozenset())
+        return found
+
+
+_map = None
+_version = 0
+_built_version = -1
+_lock = threading.Lock()
+
+
+def invalidate():
+    global _version
+    with _lock:
+        _version += 1
+
+
+def get_class_map():
+    """The process-wide ClassMap, rebuilt after DrugClass changes."""
+    global _map, _built_version
+    with _lock:
+        if _map is not None and _built_version == _version:
+            return _map
+        version = _version
+    from .models import DrugClass, DrugClassMember
+    class_map = ClassMap(
+        DrugClass.objects.values_list('id', 'name'),
+        DrugClassMember.objects.values_list('drug_class_id', 'name'),
+        DrugClass.contraindicated_with.through.objects.values_list('from_drugclass_id', 'to_drugclass_id'),
+    )
+    with _lock:
+        _map, _built_version = class_map, version
+    return class_map
+
+
+def check_prescription(allergy_terms, medication_terms, drugs, class_map=None):
+    """Check each of ``drugs`` against a patient's precomputed terms.
+
+    Returns one dict per drug with its classes and a list of alerts
+    (``allergy``, ``allergy_class``, ``interaction`` or ``duplicate``).
+    """
+    class_map = class_map or get_class_map()
+    allergies = set(allergy_terms)
+    medications = set(medication_terms)
+    allergy_classes = class_map.classes_for(allergies)
+    medication_classes = class_map.classes_for(medications)
+    interacting = {}
+    for med_class in medication_classes:
+        for other in class_map.contraindicated.get(med_class, ()):
+            interacting.setdefault(other, set()).add(med_class)
+
+    results = []
+    for drug in drugs:
+        variants = term_variants(drug)
+        classes = class_map.classes_for(variants)
+        alerts = []
+        for term in sorted(variants & allergies):
+            alerts.append({'type': 'allergy', 'severity': 'high', 'matched': term,
+                           'reason': f"Patient is allergic to {term}"})
+        if not alerts:
+            for drug_class in sorted(classes & allergy_classes):
+                alerts.append({'type': 'allergy_class', 'severity': 'high', 'matched': drug_class,
+                               'reason': f"Patient has an allergy in the {drug_class} class"})
+        for drug_class in sorted(classes):
+            for med_class in sorted(interacting.get(drug_class, ())):
+                alerts.append({'type': 'interaction', 'severity': 'medium', 'matched': med_class,
+                               'reason': f"{drug_class} are contraindicated with current {med_class}"})
+        duplicates = variants & medications
+        if duplicates:
+            alerts.append({'type': 'duplicate', 'severity': 'low', 'matched': max(duplicates, key=len),
+                           'reason': "Patient already takes this medication"})
+        else:
+            for drug_class in sorted(classes & medication_classes):
+                alerts.append({'type': 'duplicate', 'severity': 'low', 'matched': drug_class,
+                               'reason': f"Patient already takes a drug in the {drug_class} class"})
+        results.append({'drug': drug, 'classes': sorted(classes), 'safe': not alerts, 'alerts': alerts})
+    return results
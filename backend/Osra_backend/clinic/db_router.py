@@ -0,0 +1,56 @@
+"""
+Optional read-replica routing.
+
+ReplicaRoutingMiddleware marks safe (GET/HEAD/OPTIONS) requests as
+replica-readable and picks one replica alias from CLINIC_DB_REPLICAS for the
+whole request; ReadReplicaRouter then sends that request's reads there. Writes,
+and every query outside such a request (unsafe methods, management commands,
+tests), use ``default``. After a client writes, a short-lived cookie pins its
+reads to the primary so it sees its own changes despite replication lag.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_read_alias = contextvars.ContextVar('clinic_read_alias', default=None)
+
+
+def replicas():
+    return getattr(settings, 'CLINIC_DB_REPLICAS', None) or []
+
+
+@contextmanager
+def read_from(alias):
+    """Route reads in this block to ``alias`` (None means the primary)."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def current_read_alias():
+    return _read_alias.get()
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication.
+        return False if db in replicas() else None
+
+
+def choose_replica():
+    aliases = replicas()
+    return random.choice(aliases) if aliases else None
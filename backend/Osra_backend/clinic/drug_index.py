@@ -0,0 +1,228 @@
+"""
+Approximate matching of OCR'd medication names against the Drug table.
+
+Names are normalised (lower-case, common OCR confusions such as 0->o folded).
+Single-edit typos, by far the most common OCR error, are answered from a
+deletion-neighbourhood map: two strings are within one edit only if they share
+a one-character deletion (or one is a deletion of the other), so a handful of
+dict probes suffice. Larger budgets fall back to a trigram index keyed by
+length, scanning only the rarest postings the q-gram lemma allows and running
+a bounded Levenshtein on the survivors. The index is rebuilt lazily after any
+Drug row is saved or deleted.
+"""
+import re
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+Q = 3
+_PAD = '#' * (Q - 1)
+_OCR_CONFUSIONS = str.maketrans({'0': 'o', '1': 'l', '5': 's', '8': 'b', '|': 'l', '$': 's', '@': 'a'})
+_NON_ALPHA = re.compile(r'[^a-z ]+')
+
+DrugMatch = namedtuple('DrugMatch', 'drug_id name distance confidence')
+
+
+def normalize(name):
+    folded = name.lower().translate(_OCR_CONFUSIONS)
+    return ' '.join(_NON_ALPHA.sub(' ', folded).split())
+
+
+def trigrams(norm):
+    """Multiset of padded trigrams; the q-gram lemma counts repeats."""
+    padded = f'{_PAD}{norm}{_PAD}'
+    return Counter(padded[i:i + Q] for i in range(len(padded) - Q + 1))
+
+
+def default_max_distance(length):
+    if length <= 4:
+        return 0
+    if length <= 8:
+        return 1
+    if length <= 12:
+        return 2
+    return 3
+
+
+def deletions(norm):
+    return {norm[:i] + norm[i + 1:] for i in range(len(norm))}
+
+
+def bounded_levenshtein(a, b, limit):
+    """Edit distance between ``a`` and ``b``, or ``limit + 1`` if it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            cost = 0 if ca == cb else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if current[j] < row_min:
+                row_min = current[j]
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class DrugIndex:
+    def __init__(self, drugs):
+        """``drugs`` is an iterable of ``(id, name)``."""
+        self._keys = []         # normalised key per entry
+        self._grams = []        # trigram multiset per entry
+        self._entries = []      # (drug_id, display name) per entry
+        self._exact = {}
+        # (trigram, key length) -> [entry index, ...]
+        self._postings = defaultdict(list)
+        # one-character deletion of a key -> entry index, or list of them
+        self._deletes = {}
+        aliases = []
+        for drug_id, name in drugs:
+            norm = normalize(name)
+            if not norm:
+                continue
+            self._add(norm, drug_id, name)
+            # Also index the first word so "Amoxicillin" finds
+            # "Amoxicillin Clavulanate" when OCR only caught the first token.
+            first = norm.split(' ', 1)[0]
+            if first != norm and len(first) >= 4:
+                aliases.append((first, drug_id, name))
+        # Aliases go in after every full name, so they never shadow a drug
+        # whose whole name is that word.
+        for key, drug_id, name in aliases:
+            self._add(key, drug_id, name)
+
+    def _add(self, key, drug_id, name):
+        if key in self._exact:
+            return
+        idx = len(self._keys)
+        grams = trigrams(key)
+        self._keys.append(key)
+        self._grams.append(grams)
+        self._entries.append((drug_id, name))
+        self._exact[key] = idx
+        for gram in grams:
+            self._postings[(gram, len(key))].append(idx)
+        for variant in deletions(key):
+            existing = self._deletes.get(variant)
+            if existing is None:
+                self._deletes[variant] = idx
+            elif isinstance(existing, list):
+                existing.append(idx)
+            elif existing != idx:
+                self._deletes[variant] = [existing, idx]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, candidate, max_distance=None):
+        """Best DrugMatch for ``candidate`` within the edit budget, or None."""
+        norm = normalize(candidate)
+        if not norm:
+            return None
+        idx = self._exact.get(norm)
+        if idx is not None:
+            drug_id, name = self._entries[idx]
+            return DrugMatch(drug_id, name, 0, 1.0)
+        k = default_max_distance(len(norm)) if max_distance is None else max_distance
+        if k == 0:
+            return None
+        idx = self._within_one_edit(norm)
+        if idx is not None:
+            return self._match(norm, idx, 1)
+        if k == 1:
+            return None
+
+        grams = trigrams(norm)
+        length = len(norm)
+        lengths = range(max(1, length - k), length + k + 1)
+        postings = []
+        for gram, count in grams.items():
+            lists = [self._postings.get((gram, n), ()) for n in lengths]
+            postings.append((sum(len(p) for p in lists), count, lists))
+        # q-gram lemma: each edit destroys at most Q trigrams, so a match
+        # shares at least ``needed`` of our trigrams, counted with
+        # multiplicity. By pigeonhole it must then appear in one of the
+        # rarest lists, taken until the trigrams left out occur fewer than
+        # ``needed`` times; only those are scanned for candidates.
+        needed = length + Q - 1 - Q * k
+        if needed > 0:
+            postings.sort(key=lambda p: p[0])
+            left_out = 0
+            while postings and left_out + postings[-1][1] < needed:
+                left_out += postings.pop()[1]
+        candidates = set()
+        for _, _, lists in postings:
+            for p in lists:
+                candidates.update(p)
+
+        best = None
+        for idx in candidates:
+            key = self._keys[idx]
+            if sum((grams & self._grams[idx]).values()) < max(len(key), length) + Q - 1 - Q * k:
+                continue
+            distance = bounded_levenshtein(norm, key, k)
+            if distance <= k and (best is None or distance < best[0]):
+                best = (distance, idx)
+        if best is None:
+            return None
+        return self._match(norm, best[1], best[0])
+
+    def _within_one_edit(self, norm):
+        # Insertion into a key: the query minus one char is a key.
+        # Deletion from a key: the query is one of the key's deletions.
+        # Substitution: query and key share a deletion at the same position.
+        hit = self._deletes.get(norm)
+        if hit is not None:
+            return hit if isinstance(hit, int) else hit[0]
+        for variant in deletions(norm):
+            idx = self._exact.get(variant)
+            if idx is not None:
+                return idx
+            hit = self._deletes.get(variant)
+            if hit is None:
+                continue
+            for idx in ([hit] if isinstance(hit, int) else hit):
+                # Sharing a deletion at different positions can mean a
+                # transposition (distance 2); confirm.
+                if bounded_levenshtein(norm, self._keys[idx], 1) == 1:
+                    return idx
+        return None
+
+    def _match(self, norm, idx, distance):
+        drug_id, name = self._entries[idx]
+        confidence = round(1 - distance / max(len(norm), len(self._keys[idx])), 3)
+        return DrugMatch(drug_id, name, distance, confidence)
+
+
+_index = None
+_version = 0
+_built_version = None
+_lock = threading.Lock()
+
+
+def invalidate():
+    global _version
+    with _lock:
+        _version += 1
+
+
+def get_index():
+    """The process-wide index over Drug.name, rebuilt after Drug changes.
+
+    The reference cache's drug version is part of the key, so with a shared
+    cache backend a change made in another worker also triggers a rebuild.
+    """
+    global _index, _built_version
+    from . import refcache
+    shared = refcache.version('drugs')
+    with _lock:
+        if _index is not None and _built_version == (_version, shared):
+            return _index
+        version = (_version, shared)
+    from .models import Drug
+    index = DrugIndex(Drug.objects.values_list('id', 'name').iterator())
+    with _lock:
+        _index, _built_version = index, version
+    return index
@@ -0,0 +1,109 @@
+"""
+In-process fan-out of appointment change events.
+
+Every published event is appended once to a bounded ring buffer and tagged
+with a monotonically increasing sequence number. Subscribers only keep a
+cursor into that buffer, so memory does not grow with the number of
+connected clients and publishing is O(1) regardless of how many streams are
+open. Clients that fall further behind than the buffer can hold receive a
+``reset`` event telling them to reload.
+"""
+import asyncio
+import json
+import threading
+import weakref
+from collections import deque
+
+from django.conf import settings
+
+
+class EventBroker:
+    def __init__(self, max_events=1000):
+        self._events = deque(maxlen=max_events)
+        self._seq = 0
+        self._cond = threading.Condition()
+        # One asyncio.Event per running loop (not per subscriber) so a publish
+        # wakes every ASGI stream with a single call_soon_threadsafe per loop.
+        self._loop_events = weakref.WeakKeyDictionary()
+
+    @property
+    def last_id(self):
+        return self._seq
+
+    def publish(self, event_type, payload, dentist_ids=()):
+        """Record an event and wake all waiting subscribers.
+
+        ``payload`` is encoded to JSON exactly once here; streams reuse the
+        encoded string for every client.
+        """
+        with self._cond:
+            self._seq += 1
+            self._events.append((
+                self._seq,
+                event_type,
+                frozenset(d for d in dentist_ids if d is not None),
+                json.dumps(payload, default=str),
+            ))
+            self._cond.notify_all()
+            loops = list(self._loop_events.items())
+        for loop, event in loops:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Loop already closed; the weak reference will drop it.
+                pass
+        return self._seq
+
+    def events_since(self, cursor, dentist_id=None):
+        """Return ``(new_cursor, events)`` for everything after ``cursor``.
+
+        ``events`` is a list of ``(id, type, data)``. If ``cursor`` has already
+        been evicted from the buffer a single ``reset`` event is returned.
+        """
+        with self._cond:
+            if cursor >= self._seq:
+                return cursor, []
+            oldest = self._events[0][0] if self._events else self._seq + 1
+            if cursor < oldest - 1:
+                return self._seq, [(self._seq, 'reset', '{}')]
+            # Events are contiguous, so the start offset can be computed.
+            start = cursor - oldest + 1
+            pending = [self._events[i] for i in range(start, len(self._events))]
+            new_cursor = self._seq
+        out = [
+            (seq, event_type, data)
+            for seq, event_type, dentists, data in pending
+            if dentist_id is None or dentist_id in dentists
+        ]
+        return new_cursor, out
+
+    def wait(self, cursor, timeout):
+        """Block until an event newer than ``cursor`` exists or ``timeout``."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._seq > cursor, timeout)
+
+    async def wait_async(self, cursor, timeout):
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._seq > cursor:
+                return True
+            event = self._loop_events.get(loop)
+            if event is None:
+                event = self._loop_events[loop] = asyncio.Event()
+            event.clear()
+            # Re-check under the lock: a publish between the check and clear
+            # would otherwise be missed until the next timeout.
+            if self._seq > cursor:
+                return True
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._seq > cursor
+
+
+broker = EventBroker(max_events=getattr(settings, 'CLINIC_EVENTS_BUFFER_SIZE', 1000))
+
+
+def format_sse(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
@@ -0,0 +1,131 @@
+"""
+Streaming CSV exports of the large clinic tables.
+
+Rows come from ``values_list().iterator()``, which fetches in chunks (a
+server-side cursor on PostgreSQL) without building model instances or
+filling the queryset cache. They are encoded a block at a time and handed to a
+StreamingHttpResponse, optionally gzip-compressed on the fly, so worker memory
+stays flat however many rows are exported.
+"""
+import csv
+import io
+import zlib
+from collections import namedtuple
+from datetime import date
+
+from .models import Appointment, Invoice, MedicalRecord, Patient, Payment
+
+ITERATOR_CHUNK_SIZE = 2000
+ROWS_PER_BLOCK = 500
+
+Export = namedtuple('Export', 'queryset columns filters')
+
+_DATE_RANGE = ('date_from', 'date_to')
+
+EXPORTS = {
+    # Passwords are never exported.
+    'patients': Export(
+        Patient.objects.all(),
+        ['id', 'first_name', 'last_name', 'date_of_birth', 'gender', 'address', 'phone', 'email',
+         'diseases', 'allergies', 'medications', 'outstanding_balance'],
+        {'gender': 'gender', 'has_balance': 'outstanding_balance__gt'},
+    ),
+    'appointments': Export(
+        Appointment.objects.all(),
+        ['id', 'patient_id', 'patient__first_name', 'patient__last_name', 'dentist_id', 'dentist__last_name',
+         'appointment_date', 'appointment_time', 'status', 'notes'],
+        {'patient': 'patient_id', 'dentist': 'dentist_id', 'status': 'status',
+         'date_from': 'appointment_date__gte', 'date_to': 'appointment_date__lte'},
+    ),
+    'medicalrecords': Export(
+        MedicalRecord.objects.all(),
+        ['id', 'patient_id', 'appointment_id', 'record_date', 'diagnosis', 'prescribed_drugs',
+         'treatment_notes', 'dental_issues', 'treatment_plan'],
+        {'patient': 'patient_id', 'dentist': 'appointment__dentist_id',
+         'date_from': 'record_date__date__gte', 'date_to': 'record_date__date__lte'},
+    ),
+    'invoices': Export(
+        Invoice.objects.all(),
+        ['id', 'appointment_id', 'appointment__patient_id', 'date_issued', 'total_amount', 'amount_paid',
+         'balance', 'payment_status'],
+        {'patient': 'appointment__patient_id', 'status': 'payment_status',
+         'date_from': 'date_issued__gte', 'date_to': 'date_issued__lte', 'open': 'balance__gt'},
+    ),
+    'payments': Export(
+        Payment.objects.all(),
+        ['id', 'invoice_id', 'invoice__appointment__patient_id', 'payment_date', 'amount_paid'],
+        {'invoice': 'invoice_id', 'patient': 'invoice__appointment__patient_id',
+         'date_from': 'payment_date__gte', 'date_to': 'payment_date__lte'},
+    ),
+}
+# Flags whose value selects "greater than zero" rather than being compared.
+_FLAGS = {'has_balance', 'open'}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def build_queryset(name, params):
+    """Filtered ``values_list`` queryset for export ``name`` from query ``params``."""
+    try:
+        spec = EXPORTS[name]
+    except KeyError:
+        raise ExportError(f"Unknown export {name!r}; choose from {', '.join(EXPORTS)}")
+    lookups = {}
+    for param, lookup in spec.filters.items():
+        value = params.get(param)
+        if value in (None, ''):
+            continue
+        if param in _FLAGS:
+            if value.lower() in ('1', 'true', 'yes'):
+                lookups[lookup] = 0
+            continue
+        if param in _DATE_RANGE:
+            try:
+                value = date.fromisoformat(value)
+            except ValueError:
+                raise ExportError(f"{param} must be YYYY-MM-DD")
+        elif lookup.endswith('_id') and not value.isdigit():
+            raise ExportError(f"{param} must be an integer")
+        lookups[lookup] = value
+    # Header names drop the join path: patient__first_name -> patient_first_name.
+    header = [column.replace('__', '_') for column in spec.columns]
+    return header, spec.queryset.filter(**lookups).order_by('pk').values_list(*spec.columns)
+
+
+def iter_csv(header, rows):
+    """Yield CSV text a block of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    pending = 1
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= ROWS_PER_BLOCK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def iter_encoded(chunks, compress=False):
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+    # wbits=31 writes a gzip header and trailer.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(name, params, compress=False):
+    header, queryset = build_queryset(name, params)
+    return iter_encoded(iter_csv(header, queryset.iterator(chunk_size=ITERATOR_CHUNK_SIZE)), compress)
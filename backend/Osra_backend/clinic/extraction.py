@@ -0,0 +1,235 @@
+"""
+Text extractors shared by the processing endpoints and the document pipeline.
+"""
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Heuristic 1: [Name] [dosage: e.g., 500 mg or 10 mg or 1g]
+DOSE_PATTERN = re.compile(r"([A-Z][a-zA-Z0-9-]+)\s+(\d+\s*(?:mg|mcg|g|ml|units))\b", re.IGNORECASE)
+# Heuristic 2: [Name] followed by 'tablet', 'capsule', 'tab', 'cap'
+FORM_PATTERN = re.compile(r"([A-Z][a-zA-Z0-9-]+)\s+\b(tablet|capsule|tab|cap|pill|syrup)\b", re.IGNORECASE)
+# Heuristic 3: Common meds lookup (simple seed list)
+COMMON_MEDS = ['Panadol', 'Advil', 'Aspirin', 'Lipitor', 'Metformin', 'Amoxicillin', 'Augmentin']
+COMMON_MED_DOSES = {
+    cm: re.compile(fr"{cm}.*?(\d+\s*(?:mg|g|ml))", re.IGNORECASE) for cm in COMMON_MEDS
+}
+# Words the heuristics pick up as "names" that are never medications.
+NOT_MEDICATIONS = {
+    'prescription', 'diagnosis', 'date', 'take', 'one', 'two', 'three', 'daily', 'tablet', 'tablets',
+    'capsule', 'capsules', 'dose', 'dosage', 'total', 'patient', 'clinic', 'rx', 'sig', 'each', 'per',
+    'every', 'twice', 'once', 'then', 'and', 'with', 'after', 'before', 'meals', 'for', 'of', 'the',
+}
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9|$@][A-Za-z0-9|$@-]{3,}")
+
+# Section label aliases, keyed by canonical section name.
+SECTION_LABELS = {
+    'diagnosis': ['diagnosis', 'diagnoses', 'dx', 'condition', 'impression', 'assessment'],
+    'history': ['history', 'medical history', 'hpi'],
+    'symptoms': ['symptoms', 'complaints', 'chief complaint', 'presenting complaint'],
+    'allergies': ['allergies', 'allergy', 'known allergies'],
+    'medications': ['medications', 'current medications', 'meds', 'prescription', 'rx'],
+    'plan': ['plan', 'treatment plan', 'recommendation', 'recommendations', 'follow up', 'follow-up'],
+    'notes': ['note', 'notes', 'observation', 'observations'],
+}
+_LABEL_TO_SECTION = {alias: name for name, aliases in SECTION_LABELS.items() for alias in aliases}
+# One alternation over every alias (longest first so "treatment plan" wins
+# over "plan"); a single finditer pass finds every labelled section.
+SECTION_PATTERN = re.compile(
+    r"(?<![A-Za-z])(" + '|'.join(
+        re.escape(a).replace(r'\ ', r'\s+') for a in sorted(_LABEL_TO_SECTION, key=len, reverse=True)
+    ) + r")[ \t]*:",
+    re.IGNORECASE,
+)
+# Bullets and list numbers count only at the start of a line ("2.5 mg" is not one).
+ITEM_SPLIT = re.compile(r"\s*(?:^\s*(?:[-*\u2022]|\d+[.)](?=\s))|\n|;)\s*", re.MULTILINE)
+LIST_SECTIONS = {'symptoms', 'allergies', 'medications'}
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def extract_medications(text, index=None, min_confidence=0.75):
+    """Naive medication extraction heuristics.
+
+    Returns a list of ``{'medication': ..., 'dosage': ...}`` dicts. When a
+    non-empty DrugIndex is given, each candidate is normalised to a catalogue
+    drug (adding ``drug_id``, ``raw_name`` and ``confidence``), unmatched
+    candidates are dropped, and remaining words are checked against the
+    catalogue to catch names the patterns missed.
+    """
+    meds = []
+    for m in DOSE_PATTERN.finditer(text):
+        meds.append({'medication': m.group(1), 'dosage': m.group(2)})
+
+    for m in FORM_PATTERN.finditer(text):
+        name = m.group(1)
+        # avoid duplicates
+        if not any(med['medication'].lower() == name.lower() for med in meds):
+            meds.append({'medication': name, 'dosage': f"1 {m.group(2)}"})
+
+    lowered = text.lower()
+    for cm, dose_pattern in COMMON_MED_DOSES.items():
+        if cm.lower() in lowered:
+            if not any(med['medication'].lower() == cm.lower() for med in meds):
+                # Try to find dose near it
+                dose_match = dose_pattern.search(text)
+                dose = dose_match.group(1) if dose_match else "dosage as directed"
+                meds.append({'medication': cm, 'dosage': dose})
+
+    meds = [m for m in meds if m['medication'].lower() not in NOT_MEDICATIONS]
+    if index is None or not len(index):
+        return meds
+    return _normalize_medications(text, meds, index, min_confidence)
+
+
+def _normalize_medications(text, meds, index, min_confidence):
+    normalized, seen = [], set()
+    for med in meds:
+        match = index.lookup(med['medication'])
+        if match is None or match.confidence < min_confidence or match.drug_id in seen:
+            continue
+        seen.add(match.drug_id)
+        normalized.append({
+            'medication': match.name, 'dosage': med['dosage'], 'drug_id': match.drug_id,
+            'raw_name': med['medication'], 'confidence': match.confidence,
+        })
+    found_raw = {m['raw_name'].lower() for m in normalized}
+    for token in TOKEN_PATTERN.findall(text):
+        lowered = token.lower()
+        if lowered in NOT_MEDICATIONS or lowered in found_raw:
+            continue
+        match = index.lookup(token)
+        if match is None or match.confidence < min_confidence or match.drug_id in seen:
+            continue
+        seen.add(match.drug_id)
+        dose_match = re.search(re.escape(token) + r".{0,20}?(\d+\s*(?:mg|mcg|g|ml|units))", text, re.IGNORECASE)
+        normalized.append({
+            'medication': match.name,
+            'dosage': dose_match.group(1) if dose_match else "dosage as directed",
+            'drug_id': match.drug_id, 'raw_name': token, 'confidence': match.confidence,
+        })
+    return normalized
+
+
+def _split_items(section, value):
+    items = [i.strip(' \t.,') for i in ITEM_SPLIT.split(value)]
+    if section in LIST_SECTIONS:
+        items = [part.strip(' \t.') for item in items for part in item.split(',')]
+    return [i for i in items if i]
+
+
+def parse_sections(text):
+    """Split a clinical note into all of its labelled sections in one pass.
+
+    A section's value runs from its label to the next label, so multi-line
+    values are kept. Returns ``{section: [item, ...]}`` with repeated labels
+    (e.g. two ``Diagnosis:`` lines) accumulated in order.
+    """
+    sections = {}
+    matches = list(SECTION_PATTERN.finditer(text))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        label = ' '.join(match.group(1).lower().split())
+        section = _LABEL_TO_SECTION[label]
+        items = _split_items(section, text[match.end():end])
+        if items:
+            sections.setdefault(section, []).extend(items)
+    return sections
+
+
+def summarize_sections(sections, text, limit=200):
+    if sections:
+        parts = [f"{name.title()}: {', '.join(items)}" for name, items in sections.items()]
+        summary = '; '.join(parts)
+    else:
+        summary = ' '.join(text.split())
+    return summary if len(summary) <= limit else summary[:limit - 3].rstrip() + '...'
+
+
+def extract_clinical_entities(text):
+    """Extracts labelled sections plus the first Diagnosis, History/Symptoms and Notes."""
+    sections = parse_sections(text)
+
+    def first(*names):
+        for name in names:
+            if sections.get(name):
+                return sections[name][0]
+        return ""
+
+    return {
+        'diagnosis': first('diagnosis'),
+        'history': first('history', 'symptoms'),
+        'notes': first('notes'),
+        'sections': sections,
+        'word_count': len(WORD_PATTERN.findall(text)),
+        'summary': summarize_sections(sections, text),
+    }
+
+
+STRUCTURED_VERSION = 2
+
+
+def structure_medical_record(diagnosis, prescribed_drugs, treatment_notes, index=None, min_confidence=0.75):
+    """Structured form of a MedicalRecord's free-text fields."""
+    sections = parse_sections(treatment_notes or '')
+    diagnoses = _split_items('diagnosis', diagnosis or '')
+    for item in sections.pop('diagnosis', []):
+        if item not in diagnoses:
+            diagnoses.append(item)
+    return {
+        'version': STRUCTURED_VERSION,
+        'diagnoses': diagnoses,
+        'medications': extract_medications(prescribed_drugs or '', index=index, min_confidence=min_confidence),
+        'sections': sections,
+    }
+
+
+_pool = None
+_pool_workers = 1
+_pool_lock = threading.Lock()
+
+
+def pool_size():
+    """Worker count of the batch pool: CLINIC_NLP_WORKERS, else one per CPU."""
+    from django.conf import settings
+    return getattr(settings, 'CLINIC_NLP_WORKERS', None) or os.cpu_count() or 1
+
+
+def _get_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool_workers = pool_size()
+            _pool = ProcessPoolExecutor(max_workers=_pool_workers)
+        return _pool, _pool_workers
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def extract_clinical_entities_batch(texts, parallel_threshold=256):
+    """Run extract_clinical_entities over many notes.
+
+    Returns the results and the number of workers that produced them. Small
+    batches run inline: regex work on a few notes is cheaper than pickling
+    them to another process. Larger batches are split into chunks across the
+    shared pool. If a worker dies the pool is dropped, so the next batch gets
+    a fresh one, and this batch runs inline.
+    """
+    if len(texts) < parallel_threshold or pool_size() == 1:
+        return [extract_clinical_entities(t) for t in texts], 1
+    pool, workers = _get_pool()
+    chunksize = max(1, len(texts) // (workers * 4))
+    try:
+        return list(pool.map(extract_clinical_entities, texts, chunksize=chunksize)), workers
+    except BrokenProcessPool:
+        _reset_pool()
+        logger.warning("NLP worker pool broke; running the batch inline", extra={'notes': len(texts)})
+        return [extract_clinical_entities(t) for t in texts], 1
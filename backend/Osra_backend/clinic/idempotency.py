@@ -0,0 +1,182 @@
+"""
+Idempotency-Key support for POSTs that create rows or run expensive
+processing (the routes in CLINIC_IDEMPOTENT_ROUTES).
+
+The first request with a given key claims it by inserting an IdempotencyKey
+row, runs the view and stores the response (status, headers and the
+zlib-compressed body) for CLINIC_IDEMPOTENCY_TTL_SECONDS. A retry with the same
+key and the same request (method, path and body, or the form fields and file
+contents of a multipart upload) gets the stored response back without the
+view running again, marked with ``Idempotent-Replayed: true``; the same key
+with a different request gets 422.
+
+Duplicates that arrive while the first request still runs wait for it, up to
+CLINIC_IDEMPOTENCY_WAIT_SECONDS, and then replay its response, or get 409 with
+Retry-After. The unique key column serializes them across workers. The
+middleware sits inside ReplicaRoutingMiddleware, so a replayed write still
+pins the client's reads to the primary. A claim
+whose request died lapses after CLINIC_IDEMPOTENCY_LOCK_SECONDS and may be
+taken over. Server errors, throttled and streamed responses are not stored,
+so a retry runs again. Expired rows are purged by the ``purge_idempotency_keys``
+scheduler job.
+"""
+import hashlib
+import time
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from . import metrics
+from .admission import UploadTooLarge, cap_upload, route_name, too_large
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+REQUESTS = metrics.registry.counter(
+    'clinic_idempotent_requests_total', 'POSTs carrying an Idempotency-Key, by outcome.',
+    ('route', 'result'),
+)
+
+# Not worth keeping: a retry should run the request again.
+_NOT_STORED = (413, 429)
+# Stored in their own column, recomputed, or specific to the first client.
+_UNSTORED_HEADERS = {'content-type', 'content-length', 'set-cookie', REPLAYED_HEADER.lower()}
+
+
+def fingerprint(request):
+    """SHA-256 over what makes two POSTs the same request."""
+    digest = hashlib.sha256(f"{request.method} {request.get_full_path()}\n".encode())
+    if request.content_type == 'multipart/form-data':
+        # Hash the parsed upload rather than request.body, which would hold a
+        # whole upload in memory; DRF reuses the parsed POST and FILES.
+        for name, values in sorted(request.POST.lists()):
+            digest.update(f"{name}={values!r}\n".encode())
+        for name, files in sorted(request.FILES.lists()):
+            for upload in files:
+                digest.update(f"{name}={upload.name}:{upload.size}\n".encode())
+                for chunk in upload.chunks():
+                    digest.update(chunk)
+                upload.seek(0)
+    else:
+        digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _claim(key, digest, route):
+    """``(row, True)`` once this request owns the key, else ``(current row or None, False)``."""
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=getattr(settings, 'CLINIC_IDEMPOTENCY_LOCK_SECONDS', 300))
+    row = IdempotencyKey.objects.filter(key=key).first()
+    if row is None:
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(key=key, fingerprint=digest, route=route,
+                                                     expires_at=expires_at), True
+        except IntegrityError:
+            # A concurrent duplicate inserted it first.
+            return None, False
+    if row.expires_at > now:
+        return row, False
+    # Expired (a stale response or an abandoned claim): the conditional
+    # update lets exactly one of several concurrent retries take it over.
+    taken = IdempotencyKey.objects.filter(pk=row.pk, expires_at=row.expires_at).update(
+        fingerprint=digest, route=route, status_code=None, content_type='', headers={}, body=b'',
+        expires_at=expires_at,
+    )
+    if not taken:
+        return None, False
+    row.fingerprint, row.route, row.status_code, row.expires_at = digest, route, None, expires_at
+    return row, True
+
+
+def _replay(row):
+    response = HttpResponse(zlib.decompress(bytes(row.body)), status=row.status_code, content_type=row.content_type)
+    for name, value in row.headers.items():
+        response[name] = value
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _store(row, response):
+    ttl = getattr(settings, 'CLINIC_IDEMPOTENCY_TTL_SECONDS', 24 * 3600)
+    IdempotencyKey.objects.filter(pk=row.pk, fingerprint=row.fingerprint, status_code__isnull=True).update(
+        status_code=response.status_code,
+        content_type=response.get('Content-Type', ''),
+        headers={name: value for name, value in response.items() if name.lower() not in _UNSTORED_HEADERS},
+        body=zlib.compress(response.content),
+        expires_at=timezone.now() + timedelta(seconds=ttl),
+    )
+
+
+def _release(row):
+    IdempotencyKey.objects.filter(pk=row.pk, fingerprint=row.fingerprint, status_code__isnull=True).delete()
+
+
+class IdempotencyMiddleware:
+    """Runs a keyed POST once and replays its response to retries."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = request.headers.get(HEADER)
+        if request.method != 'POST' or not key:
+            return self.get_response(request)
+        route = route_name(request)
+        if route not in getattr(settings, 'CLINIC_IDEMPOTENT_ROUTES', ()):
+            return self.get_response(request)
+        if len(key) > 255:
+            return JsonResponse({"error": f"{HEADER} must be at most 255 characters"}, status=400)
+        max_bytes = getattr(settings, 'CLINIC_MAX_UPLOAD_BYTES', None)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if max_bytes and length > max_bytes:
+            # Leave the refusal to admission control without reading the body.
+            return self.get_response(request)
+        if max_bytes:
+            cap_upload(request, max_bytes)
+        try:
+            digest = fingerprint(request)
+        except UploadTooLarge:
+            return too_large(route, max_bytes)
+        deadline = time.monotonic() + getattr(settings, 'CLINIC_IDEMPOTENCY_WAIT_SECONDS', 10)
+        pause = 0.02
+        while True:
+            row, owned = _claim(key, digest, route)
+            if owned:
+                break
+            # No row means another request claimed the key between our read
+            # and our insert (or update): wait for it like any other claim.
+            if row is not None and row.fingerprint != digest:
+                REQUESTS.inc(route, 'mismatch')
+                return JsonResponse({"error": f"{HEADER} was already used for a different request"}, status=422)
+            if row is not None and row.status_code is not None:
+                REQUESTS.inc(route, 'replayed')
+                return _replay(row)
+            if time.monotonic() >= deadline:
+                REQUESTS.inc(route, 'in_progress')
+                response = JsonResponse({"error": "A request with this key is still being processed"}, status=409)
+                response['Retry-After'] = str(getattr(settings, 'CLINIC_ADMISSION_RETRY_AFTER', 5))
+                return response
+            time.sleep(pause)
+            pause = min(pause * 2, 0.5)
+
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            _release(row)
+            raise
+        if response.streaming or response.status_code >= 500 or response.status_code in _NOT_STORED:
+            _release(row)
+            REQUESTS.inc(route, 'not_stored')
+        else:
+            _store(row, response)
+            REQUESTS.inc(route, 'executed')
+        return response
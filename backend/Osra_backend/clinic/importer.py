@@ -0,0 +1,187 @@
+"""
+Bulk CSV import of patients, drugs and treatments.
+
+The file is read as a stream with csv.DictReader and handled a chunk of rows
+at a time: each row is validated by the model's existing serializer, then the
+chunk is upserted on its natural key with one lookup query, one bulk_create
+and one bulk_update inside a transaction. Invalid rows are skipped and
+reported by row number; valid rows in the same chunk are still imported.
+"""
+import csv
+import io
+from collections import namedtuple
+from functools import partial
+
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+from . import drug_index, refcache
+from .models import Patient
+from .serializers import DrugSerializer, PatientSerializer, TreatmentSerializer
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+# ``prepare`` fills fields that Model.save() would derive (``derived``), since
+# bulk_create/bulk_update skip save(); ``after`` runs once rows were written.
+Import = namedtuple('Import', 'serializer key prepare derived after')
+
+
+def _drugs_changed():
+    drug_index.invalidate()
+    refcache.invalidate('drugs')
+
+
+IMPORTS = {
+    'patients': Import(PatientSerializer, 'email', Patient.refresh_clinical_terms,
+                       ('allergy_terms', 'medication_terms'), None),
+    'drugs': Import(DrugSerializer, 'name', None, (), _drugs_changed),
+    'treatments': Import(TreatmentSerializer, 'name', None, (), partial(refcache.invalidate, 'treatments')),
+}
+
+
+class CSVImportError(ValueError):
+    pass
+
+
+def _row_serializer(spec):
+    """A single serializer instance reused for every row.
+
+    The natural key's unique validator is dropped: an existing key means
+    update, not a validation error, and checking it per row would cost a
+    query each.
+    """
+    serializer = spec.serializer()
+    field = serializer.fields.get(spec.key)
+    if field is not None:
+        field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+    return serializer
+
+
+def _clean(row, fields):
+    """CSV has no null: blank cells become None where allowed, else are omitted."""
+    data = {}
+    for name, value in row.items():
+        if name is None or name not in fields:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        if value == '':
+            field = fields[name]
+            if field.allow_null:
+                value = None
+            elif not isinstance(field, serializers.CharField):
+                continue
+        data[name] = value
+    return data
+
+
+class ImportResult:
+    def __init__(self, model, dry_run):
+        self.model = model
+        self.dry_run = dry_run
+        self.rows = self.valid = self.created = self.updated = self.failed = 0
+        self.errors = []
+
+    def error(self, row, detail):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': detail})
+
+    def as_dict(self):
+        return {
+            'model': self.model,
+            'dry_run': self.dry_run,
+            'rows': self.rows,
+            'valid': self.valid,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def _write_chunk(spec, model, valid, result):
+    key = spec.key
+    # Later rows win when a key repeats within the chunk.
+    keyed, unkeyed = {}, []
+    for data in valid:
+        if data.get(key):
+            keyed[data[key]] = data
+        else:
+            unkeyed.append(data)
+    existing = {}
+    if keyed:
+        for obj in model.objects.filter(**{f'{key}__in': list(keyed)}).order_by('pk'):
+            existing.setdefault(getattr(obj, key), obj)
+
+    to_create, to_update, update_fields = [], [], set()
+    for value, data in keyed.items():
+        obj = existing.get(value)
+        if obj is None:
+            to_create.append(model(**data))
+            continue
+        for name, field_value in data.items():
+            setattr(obj, name, field_value)
+        update_fields.update(data)
+        to_update.append(obj)
+    to_create.extend(model(**data) for data in unkeyed)
+
+    if spec.prepare:
+        for obj in to_create + to_update:
+            spec.prepare(obj)
+        update_fields.update(spec.derived)
+    with transaction.atomic():
+        if to_create:
+            model.objects.bulk_create(to_create, batch_size=CHUNK_SIZE)
+        if to_update:
+            model.objects.bulk_update(to_update, sorted(update_fields), batch_size=CHUNK_SIZE)
+    result.created += len(to_create)
+    result.updated += len(to_update)
+
+
+def import_rows(name, rows, chunk_size=CHUNK_SIZE, dry_run=False):
+    """Import an iterable of dicts (e.g. a csv.DictReader) into ``name``."""
+    try:
+        spec = IMPORTS[name]
+    except KeyError:
+        raise CSVImportError(f"Unknown import {name!r}; choose from {', '.join(IMPORTS)}")
+    model = spec.serializer.Meta.model
+    serializer = _row_serializer(spec)
+    fields = {n: f for n, f in serializer.fields.items() if not f.read_only}
+    result = ImportResult(name, dry_run)
+
+    valid = []
+    # Rows are numbered as CSV records, the header being record 1.
+    for number, row in enumerate(rows, start=2):
+        result.rows += 1
+        try:
+            valid.append(serializer.run_validation(_clean(row, fields)))
+        except serializers.ValidationError as e:
+            result.error(number, e.detail)
+            continue
+        result.valid += 1
+        if len(valid) >= chunk_size:
+            if not dry_run:
+                _write_chunk(spec, model, valid, result)
+            valid = []
+    if valid and not dry_run:
+        _write_chunk(spec, model, valid, result)
+    if spec.after and not dry_run and (result.created or result.updated):
+        spec.after()
+    return result
+
+
+def import_csv(name, binary_file, **kwargs):
+    """Stream-parse an uploaded (binary) CSV file and import it."""
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.DictReader(text)
+        if not reader.fieldnames:
+            raise CSVImportError("CSV file is empty")
+        return import_rows(name, reader, **kwargs)
+    finally:
+        # Don't let the wrapper close the underlying upload.
+        text.detach()
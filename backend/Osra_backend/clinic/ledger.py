@@ -0,0 +1,86 @@
+"""
+Running balances for invoices and patients.
+
+Invoice.amount_paid / balance / payment_status and Patient.outstanding_balance
+are adjusted with F() deltas inside the transaction that inserts, changes or
+deletes a Payment (or changes an Invoice total), so reading what is owed never
+needs to aggregate the payments table. ``rebuild()`` recomputes everything
+from scratch for data written with bulk_create or raw SQL.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+# SQLite stores decimals as REAL, so accumulated deltas can drift by a tiny
+# fraction; amounts are whole cents, so half a cent of slack is exact enough.
+HALF_CENT = Decimal('0.005')
+
+
+def to_decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value or 0))
+
+
+def status_for(amount_paid, balance):
+    if balance < HALF_CENT:
+        return 'paid'
+    if amount_paid < HALF_CENT:
+        return 'unpaid'
+    return 'partial'
+
+
+def _status_after(paid_delta, total_delta):
+    # UPDATE evaluates the row's old values, so compare those against the
+    # deltas: this is status_for() of the updated row.
+    return Case(
+        When(balance__lt=paid_delta - total_delta + HALF_CENT, then=Value('paid')),
+        When(amount_paid__lt=-paid_delta + HALF_CENT, then=Value('unpaid')),
+        default=Value('partial'),
+    )
+
+
+def apply(invoice_id, paid_delta=0, total_delta=0, patient_only=False):
+    """Shift one invoice's totals (unless ``patient_only``) and its patient's balance."""
+    from .models import Invoice, Patient
+    balance_delta = total_delta - paid_delta
+    if not patient_only and (paid_delta or total_delta):
+        Invoice.objects.filter(pk=invoice_id).update(
+            amount_paid=F('amount_paid') + paid_delta,
+            balance=F('balance') + balance_delta,
+            payment_status=_status_after(paid_delta, total_delta),
+        )
+    if balance_delta:
+        Patient.objects.filter(appointment__invoice__id=invoice_id).update(
+            outstanding_balance=F('outstanding_balance') + balance_delta,
+        )
+
+
+def invoice_deleted(invoice):
+    from .models import Patient
+    # Cascaded payments are deleted (and credited back) first, so by now the
+    # invoice contributes its full total to the patient's balance.
+    total = getattr(invoice, '_loaded_total_amount', invoice.total_amount)
+    if total:
+        Patient.objects.filter(appointment__id=invoice.appointment_id).update(
+            outstanding_balance=F('outstanding_balance') - total,
+        )
+
+
+def rebuild():
+    """Recompute every ledger column from payments."""
+    from .models import Invoice, Patient, Payment
+    money = DecimalField(max_digits=12, decimal_places=2)
+    paid = (
+        Payment.objects.filter(invoice=OuterRef('pk')).order_by()
+        .values('invoice').annotate(total=Sum('amount_paid')).values('total')
+    )
+    Invoice.objects.update(amount_paid=Coalesce(Subquery(paid, output_field=money), Value(0), output_field=money))
+    Invoice.objects.update(balance=F('total_amount') - F('amount_paid'))
+    Invoice.objects.update(payment_status=_status_after(0, 0))
+    owed = (
+        Invoice.objects.filter(appointment__patient=OuterRef('pk')).order_by()
+        .values('appointment__patient').annotate(total=Sum('balance')).values('total')
+    )
+    Patient.objects.update(
+        outstanding_balance=Coalesce(Subquery(owed, output_field=money), Value(0), output_field=money),
+    )
@@ -0,0 +1,129 @@
+"""
+Structured, non-blocking logging for the clinic app.
+
+Request threads only put records on a bounded in-memory queue; a background
+QueueListener thread formats them as one JSON object per line and writes them
+to the stream. If the stream backs up and the queue fills, records are dropped
+(and counted in a metric) instead of stalling the worker.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import weakref
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from . import metrics
+
+DROPPED = metrics.registry.counter(
+    'clinic_log_records_dropped_total', 'Log records dropped because the log queue was full.',
+)
+
+# Attributes present on every LogRecord; anything else came from ``extra=``.
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Block for room: the default put_nowait loses the sentinel on a full
+        # queue and stop() would then wait forever.
+        self.queue.put(self._sentinel, timeout=5)
+
+
+_handlers = weakref.WeakSet()
+
+
+class AsyncStreamHandler(QueueHandler):
+    """QueueHandler that owns its listener thread and JSON stream handler.
+
+    A forked child (OCR/NLP pool workers, ``gunicorn --preload`` workers)
+    inherits the handler but not the listener thread, so each handler starts
+    a fresh queue and listener in the child; records the parent had queued
+    stay with the parent. Dropped records are counted in
+    ``clinic_log_records_dropped_total`` and reported when the handler stops.
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.target = logging.StreamHandler(stream)
+        self.target.setFormatter(JsonFormatter())
+        self.dropped = 0
+        self._start()
+        _handlers.add(self)
+        atexit.register(self.stop)
+
+    def _start(self):
+        self.listener = _Listener(self.queue, self.target)
+        self.listener.start()
+        self._pid = os.getpid()
+        self._running = True
+
+    def _after_fork(self):
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.dropped = 0
+        self._start()
+        # Pool workers leave through os._exit, which skips atexit.
+        from multiprocessing import util
+        util.Finalize(self, self.stop, exitpriority=100)
+
+    def stop(self):
+        """Flush queued records and stop the listener thread."""
+        if not self._running or os.getpid() != self._pid:
+            return
+        self._running = False
+        try:
+            self.listener.stop()
+        except queue.Full:
+            return
+        if self.dropped:
+            self.target.handle(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': 'Log records dropped on a full queue', 'dropped': self.dropped,
+            }))
+
+    def prepare(self, record):
+        # Resolve the message and traceback on the calling thread (args may be
+        # mutated later) but leave JSON formatting to the listener thread.
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            DROPPED.inc()
+
+
+def _restart_listeners():
+    for handler in list(_handlers):
+        handler._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listeners)
@@ -0,0 +1,47 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move completed appointments older than CLINIC_ARCHIVE_AFTER_DAYS (or --before), with "
+        "their treatment lines and medical records, into the archive tables. Each chunk is its "
+        "own transaction, so the command can be stopped and re-run at any time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive appointments dated before YYYY-MM-DD.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--limit', type=int, help='Stop after roughly this many appointments.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would move.')
+
+    def handle(self, *args, **opts):
+        try:
+            cutoff = date.fromisoformat(opts['before']) if opts['before'] else archive.default_cutoff()
+        except ValueError:
+            raise CommandError("--before must be YYYY-MM-DD")
+        if opts['dry_run']:
+            count = archive.archivable(cutoff).count()
+            self.stdout.write(f"{count} appointments dated before {cutoff} would be archived")
+            return
+
+        started = time.perf_counter()
+        moved = records = 0
+        last_pk = 0
+        limit = opts['limit']
+        while limit is None or moved < limit:
+            chunk, chunk_records, last_pk = archive.archive_chunk(cutoff, last_pk, opts['chunk_size'])
+            if not chunk:
+                break
+            moved += chunk
+            records += chunk_records
+            rate = moved / (time.perf_counter() - started)
+            self.stdout.write(f"{moved} appointments, {records} records archived ({rate:,.0f}/s)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} appointments and {records} medical records dated before {cutoff} "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,111 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from clinic import drug_index
+from clinic.extraction import structure_medical_record
+from clinic.models import MedicalRecord
+
+_worker_index = None
+_worker_min_confidence = 0.75
+
+
+def _init_worker(index, min_confidence):
+    global _worker_index, _worker_min_confidence
+    _worker_index, _worker_min_confidence = index, min_confidence
+
+
+def _structure_row(row):
+    pk, diagnosis, prescribed_drugs, treatment_notes = row
+    return pk, structure_medical_record(
+        diagnosis, prescribed_drugs, treatment_notes,
+        index=_worker_index, min_confidence=_worker_min_confidence,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract structured diagnoses, medications and note sections from historical "
+        "MedicalRecord free text. Streams records in primary-key chunks across a process "
+        "pool and checkpoints after every chunk, so it can be interrupted and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--checkpoint', default=str(settings.BASE_DIR / '.backfill_structured_records.json'),
+                            help='File storing the last processed primary key.')
+        parser.add_argument('--restart', action='store_true', help='Ignore any existing checkpoint.')
+        parser.add_argument('--all', action='store_true',
+                            help='Re-process records that already have structured data.')
+        parser.add_argument('--limit', type=int, help='Stop after this many records.')
+
+    def handle(self, *args, **opts):
+        checkpoint = Path(opts['checkpoint'])
+        state = {'last_pk': 0, 'processed': 0}
+        if checkpoint.exists() and not opts['restart']:
+            state.update(json.loads(checkpoint.read_text()))
+            self.stdout.write(f"Resuming after pk {state['last_pk']} ({state['processed']} done)")
+
+        queryset = MedicalRecord.objects.order_by('pk')
+        if not opts['all']:
+            queryset = queryset.filter(structured_at__isnull=True)
+        columns = ('pk', 'diagnosis', 'prescribed_drugs', 'treatment_notes')
+
+        index = drug_index.get_index()
+        min_confidence = getattr(settings, 'CLINIC_DRUG_MATCH_MIN_CONFIDENCE', 0.75)
+        workers = max(1, opts['workers'])
+        chunk_size = opts['chunk_size']
+        limit = opts['limit']
+
+        started = time.perf_counter()
+        done = 0
+        pool = None
+        if workers > 1:
+            # The drug index is pickled to each worker once, not per record.
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(index, min_confidence))
+        else:
+            _init_worker(index, min_confidence)
+        try:
+            while limit is None or done < limit:
+                size = chunk_size if limit is None else min(chunk_size, limit - done)
+                rows = list(queryset.filter(pk__gt=state['last_pk']).values_list(*columns)[:size])
+                if not rows:
+                    break
+                if pool is not None:
+                    results = pool.map(_structure_row, rows, chunksize=max(1, len(rows) // (workers * 4)))
+                else:
+                    results = map(_structure_row, rows)
+                now = timezone.now()
+                records = [
+                    MedicalRecord(pk=pk, structured_data=data, structured_at=now)
+                    for pk, data in results
+                ]
+                MedicalRecord.objects.bulk_update(records, ['structured_data', 'structured_at'], batch_size=500)
+
+                done += len(rows)
+                state['last_pk'] = rows[-1][0]
+                state['processed'] += len(rows)
+                checkpoint.write_text(json.dumps(state))
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"{done} records, last pk {state['last_pk']}, {done / elapsed:,.0f} records/s")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Back-filled {done} records in {elapsed:.1f}s ({rate:,.0f} records/s)"
+        ))
+        if limit is None or done < limit:
+            # Finished the table: the next run should start from the beginning
+            # and only pick up records created since.
+            checkpoint.unlink(missing_ok=True)
@@ -0,0 +1,181 @@
+import random
+import time
+from datetime import date, time as dtime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from clinic import refcache
+from clinic.contraindications import parse_terms
+from clinic.models import (
+    Appointment, AppointmentTreatment, Dentist, Drug, Invoice, MedicalRecord,
+    Patient, Payment, Treatment, TreatmentDrug,
+)
+
+FIRST_NAMES = ['Ahmed', 'Sara', 'Omar', 'Mona', 'Youssef', 'Nour', 'Karim', 'Laila', 'Hassan', 'Mariam',
+               'Ali', 'Salma', 'Mostafa', 'Hana', 'Tarek', 'Farah', 'Khaled', 'Dina', 'Amr', 'Yasmin']
+LAST_NAMES = ['Mohsen', 'Hassan', 'Ibrahim', 'Saleh', 'Fathy', 'Nabil', 'Adel', 'Mahmoud', 'Samir', 'Fouad',
+              'Kamal', 'Zaki', 'Shawky', 'Rashad', 'Lotfy']
+SPECIALTIES = ['General', 'Orthodontics', 'Endodontics', 'Periodontics', 'Prosthodontics', 'Pediatric']
+TREATMENTS = ['Cleaning', 'Filling', 'Root Canal', 'Extraction', 'Crown', 'Bridge', 'Implant', 'Whitening',
+              'Scaling', 'Braces Adjustment', 'Veneer', 'X-Ray', 'Fluoride Treatment', 'Sealant']
+DRUGS = [('Amoxicillin', '500mg'), ('Ibuprofen', '400mg'), ('Paracetamol', '500mg'), ('Metronidazole', '400mg'),
+         ('Clindamycin', '300mg'), ('Chlorhexidine', '0.12%'), ('Lidocaine', '2%'), ('Augmentin', '1g'),
+         ('Diclofenac', '50mg'), ('Azithromycin', '500mg'), ('Naproxen', '250mg'), ('Articaine', '4%')]
+DIAGNOSES = ['Dental caries', 'Gingivitis', 'Periodontitis', 'Pulpitis', 'Dental abscess', 'Malocclusion',
+             'Tooth fracture', 'Impacted wisdom tooth', 'Bruxism', 'Dentin hypersensitivity']
+ALLERGIES = ['', '', '', 'Penicillin', 'Latex', 'Sulfa drugs', 'Aspirin', 'Codeine']
+SLOTS = [dtime(h, m) for h in range(9, 17) for m in (0, 30)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic clinic data with bulk_create for load testing. "
+        "Example: generate_clinic_data --patients 100000 --appointments 1000000 --records 500000"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000)
+        parser.add_argument('--dentists', type=int, default=25)
+        parser.add_argument('--appointments', type=int, default=10000)
+        parser.add_argument('--records', type=int, default=5000,
+                            help='Medical records, attached to past appointments.')
+        parser.add_argument('--invoice-ratio', type=float, default=0.6,
+                            help='Fraction of completed appointments that get an invoice.')
+        parser.add_argument('--years', type=int, default=3, help='How far back appointments go.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **opts):
+        self.rng = random.Random(opts['seed'])
+        self.batch_size = opts['batch_size']
+        started = time.perf_counter()
+
+        treatments, drugs = self._catalog()
+        dentist_ids = self._dentists(opts['dentists'])
+        # bulk_create sends no signals.
+        refcache.invalidate(*refcache.GROUPS.values())
+        patient_ids = self._patients(opts['patients'], opts['seed'])
+        self._appointments(
+            opts['appointments'], opts['records'], opts['invoice_ratio'], opts['years'],
+            patient_ids, dentist_ids, treatments,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s"))
+
+    def _log(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(f"{label}: {count} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)")
+
+    def _catalog(self):
+        treatments = list(Treatment.objects.all())
+        if not treatments:
+            treatments = Treatment.objects.bulk_create(
+                Treatment(name=name, description=f"{name} procedure",
+                          cost=Decimal(self.rng.randrange(200, 5000)))
+                for name in TREATMENTS
+            )
+            treatments = list(Treatment.objects.all())
+        drugs = list(Drug.objects.all())
+        if not drugs:
+            Drug.objects.bulk_create(
+                Drug(name=name, description=f"{name} {dose}", dosage=dose,
+                     price=Decimal(self.rng.randrange(10, 300)))
+                for name, dose in DRUGS
+            )
+            drugs = list(Drug.objects.all())
+            TreatmentDrug.objects.bulk_create(
+                TreatmentDrug(treatment=t, drug=self.rng.choice(drugs), dosage_used=self.rng.choice(DRUGS)[1])
+                for t in treatments
+            )
+        return treatments, drugs
+
+    def _dentists(self, count):
+        started = time.perf_counter()
+        offset = Dentist.objects.count()
+        Dentist.objects.bulk_create(
+            (Dentist(
+                first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+                specialty=self.rng.choice(SPECIALTIES), phone=f"010{self.rng.randrange(10**7, 10**8)}",
+                email=f"dentist{offset + i}@synthetic.osra", password='password',
+            ) for i in range(count)),
+            batch_size=self.batch_size,
+        )
+        self._log('dentists', count, started)
+        return list(Dentist.objects.values_list('id', flat=True))
+
+    def _patients(self, count, seed):
+        started = time.perf_counter()
+        offset = Patient.objects.count()
+        today = date.today()
+        allergy_terms = {allergy: parse_terms(allergy) for allergy in ALLERGIES}
+        rows = (
+            Patient(
+                first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+                date_of_birth=today - timedelta(days=self.rng.randrange(5 * 365, 85 * 365)),
+                gender=self.rng.choice(['Male', 'Female']), address=f"{self.rng.randrange(1, 200)} Nile St, Cairo",
+                phone=f"011{self.rng.randrange(10**7, 10**8)}",
+                email=f"patient{offset + i}.{seed}@synthetic.osra", password='password',
+                allergies=allergy,
+                # bulk_create skips Patient.save(), which normally derives these.
+                allergy_terms=allergy_terms[allergy],
+            ) for i, allergy in enumerate(self.rng.choice(ALLERGIES) for _ in range(count))
+        )
+        Patient.objects.bulk_create(rows, batch_size=self.batch_size)
+        self._log('patients', count, started)
+        return list(Patient.objects.values_list('id', flat=True))
+
+    def _appointments(self, count, record_count, invoice_ratio, years, patient_ids, dentist_ids, treatments):
+        if not patient_ids or not dentist_ids:
+            return
+        started = time.perf_counter()
+        today = date.today()
+        span = years * 365
+        record_ratio = min(1.0, record_count / count) if count else 0
+        made = records = invoices = 0
+        rng = self.rng
+        while made < count:
+            n = min(self.batch_size, count - made)
+            batch = []
+            for _ in range(n):
+                day = today + timedelta(days=rng.randrange(-span, 60))
+                if day >= today:
+                    status = 'upcoming'
+                else:
+                    status = rng.choices(['completed', 'canceled', 'no-show'], weights=[85, 10, 5])[0]
+                batch.append(Appointment(
+                    patient_id=rng.choice(patient_ids), dentist_id=rng.choice(dentist_ids),
+                    appointment_date=day, appointment_time=rng.choice(SLOTS), status=status,
+                ))
+            with transaction.atomic():
+                Appointment.objects.bulk_create(batch)
+                completed = [a for a in batch if a.status == 'completed']
+                medical, lines, bills = [], [], []
+                for appt in completed:
+                    if records < record_count and rng.random() < record_ratio * len(batch) / max(len(completed), 1):
+                        medical.append(MedicalRecord(
+                            patient_id=appt.patient_id, appointment_id=appt.pk,
+                            diagnosis=rng.choice(DIAGNOSES),
+                            prescribed_drugs=f"{rng.choice(DRUGS)[0]} {rng.choice(DRUGS)[1]}",
+                            treatment_notes='Synthetic record. Follow up in two weeks.',
+                        ))
+                        records += 1
+                    if rng.random() < invoice_ratio:
+                        treatment = rng.choice(treatments)
+                        lines.append(AppointmentTreatment(appointment_id=appt.pk, treatment=treatment, quantity=1))
+                        # bulk_create skips the ledger; these are paid in full.
+                        bills.append(Invoice(appointment_id=appt.pk, total_amount=treatment.cost,
+                                             amount_paid=treatment.cost, balance=0, payment_status='paid'))
+                MedicalRecord.objects.bulk_create(medical)
+                AppointmentTreatment.objects.bulk_create(lines)
+                Invoice.objects.bulk_create(bills)
+                Payment.objects.bulk_create(
+                    Payment(invoice_id=inv.pk, amount_paid=inv.total_amount) for inv in bills
+                )
+                invoices += len(bills)
+            made += n
+            if made % (self.batch_size * 20) == 0:
+                self._log('appointments (progress)', made, started)
+        self._log('appointments', made, started)
+        self.stdout.write(f"medical records: {records}, invoices: {invoices}")
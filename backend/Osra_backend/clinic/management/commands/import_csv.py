@@ -0,0 +1,42 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clinic import importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-import patients, drugs or treatments from a CSV file with a header row. "
+        "Rows are validated with the API serializers and upserted on email (patients) "
+        "or name (drugs, treatments). Example: import_csv patients branch2.csv --report errors.json"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(importer.IMPORTS))
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=importer.CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Validate only; write nothing.')
+        parser.add_argument('--report', help='Write the full JSON report (including row errors) here.')
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        try:
+            with open(opts['path'], 'rb') as f:
+                result = importer.import_csv(opts['model'], f, chunk_size=opts['chunk_size'], dry_run=opts['dry_run'])
+        except (OSError, UnicodeDecodeError, csv.Error, importer.CSVImportError) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+        report = result.as_dict()
+        if opts['report']:
+            with open(opts['report'], 'w') as f:
+                json.dump(report, f, indent=2, default=str)
+        for error in report['errors'][:10]:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'], default=str)}")
+        summary = (
+            f"{result.rows} rows in {elapsed:.1f}s ({result.rows / elapsed if elapsed else 0:,.0f} rows/s): "
+            f"{result.created} created, {result.updated} updated, {result.failed} failed"
+        )
+        self.stdout.write(self.style.WARNING(summary) if result.failed else self.style.SUCCESS(summary))
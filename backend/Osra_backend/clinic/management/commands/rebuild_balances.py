@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from clinic import ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Invoice.amount_paid/balance/payment_status and Patient.outstanding_balance "
+        "from the payments table. Only needed after writing payments with bulk_create or raw SQL."
+    )
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            ledger.rebuild()
+        self.stdout.write(self.style.SUCCESS("Balances rebuilt"))
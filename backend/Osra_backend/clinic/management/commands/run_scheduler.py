@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from clinic import scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the background jobs (no-show sweep, unfinished-appointment flags, reminders, "
+        "notification delivery) as they fall due. Job state lives in the ScheduledJob table, "
+        "so several runners can share a database and a restarted runner picks up where it left off."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run whatever is due, then exit.')
+        parser.add_argument('--job', action='append', default=[], dest='jobs',
+                            help='Run this job now even if not due (repeatable); implies --once.')
+        parser.add_argument('--poll', type=float, default=30,
+                            help='Longest sleep between checks, in seconds.')
+
+    def handle(self, *args, **opts):
+        unknown = set(opts['jobs']) - set(scheduler.JOBS)
+        if unknown:
+            raise CommandError(f"Unknown job(s) {', '.join(sorted(unknown))}; choose from {', '.join(scheduler.JOBS)}")
+        once = opts['once'] or bool(opts['jobs'])
+        try:
+            while True:
+                close_old_connections()
+                for name, (status, result) in scheduler.run_due(force=opts['jobs']).items():
+                    style = self.style.SUCCESS if status == 'ok' else self.style.ERROR
+                    self.stdout.write(style(f"{name}: {status} {result}"))
+                if once:
+                    return
+                next_run = scheduler.next_due()
+                wait = opts['poll'] if next_run is None else (next_run - timezone.now()).total_seconds()
+                time.sleep(min(max(wait, 1), opts['poll']))
+        except KeyboardInterrupt:
+            self.stdout.write("Scheduler stopped")
@@ -0,0 +1,35 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto each SQLite replica in CLINIC_DB_REPLICAS. "
+        "Stands in for replication when trying read-replica routing locally."
+    )
+
+    def handle(self, *args, **opts):
+        primary = settings.DATABASES['default']
+        if not settings.CLINIC_DB_REPLICAS:
+            raise CommandError("No replicas configured; set CLINIC_DB_REPLICA_PATHS")
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("sync_replicas only copies SQLite databases")
+        source = sqlite3.connect(str(primary['NAME']))
+        try:
+            for alias in settings.CLINIC_DB_REPLICAS:
+                replica = settings.DATABASES[alias]
+                if replica['ENGINE'] != 'django.db.backends.sqlite3':
+                    raise CommandError(f"{alias} is not a SQLite database")
+                connections[alias].close()
+                target = sqlite3.connect(str(replica['NAME']))
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"{alias}: copied to {replica['NAME']}")
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS("Replicas in sync"))
@@ -0,0 +1,195 @@
+"""
+Minimal Prometheus-style metrics for the clinic API.
+
+Writes never take a lock: each thread updates its own shard (a plain dict
+reached through ``threading.local``) and shards are only merged when
+``/api/metrics`` is scraped. The GIL makes the individual dict/list updates
+atomic, so the only synchronisation is registering a new shard the first time
+a thread touches a metric. Shards of threads that have finished are folded
+into a base shard then and at every scrape, so thread-per-request servers do
+not grow the list.
+"""
+import threading
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._base = {}
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._fold_finished()
+                self._shards.append((threading.current_thread(), values))
+            return values
+
+    def _fold_finished(self):
+        # Caller holds the lock. A finished thread never writes again, so its
+        # shard can be merged into the base without racing the writer.
+        live = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                live.append((thread, values))
+                continue
+            for key, value in list(values.items()):
+                self._base[key] = self._merge(self._base.get(key), value)
+        self._shards = live
+
+    def _snapshot(self):
+        with self._lock:
+            self._fold_finished()
+            shards = [dict(self._base)] + [values for _, values in self._shards]
+        return [dict(s) for s in shards]
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        body = ','.join(f'{k}="{_escape(v)}"' for k, v in pairs)
+        return '{' + body + '}'
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}',
+        ]
+        lines.extend(self._render_samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    @staticmethod
+    def _merge(total, value):
+        return (total or 0) + value
+
+    def inc(self, *labelvalues, amount=1):
+        values = self._shard()
+        values[labelvalues] = values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return sum(s.get(labelvalues, 0) for s in self._snapshot())
+
+    def _render_samples(self):
+        totals = {}
+        for shard in self._snapshot():
+            for key, v in shard.items():
+                totals[key] = totals.get(key, 0) + v
+        return [f'{self.name}{self._labels(k)} {_num(v)}' for k, v in sorted(totals.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    @staticmethod
+    def _merge(total, entry):
+        # A new list: scrapes read base entries without the lock.
+        return list(entry) if total is None else [a + b for a, b in zip(total, entry)]
+
+    def observe(self, value, *labelvalues):
+        values = self._shard()
+        entry = values.get(labelvalues)
+        if entry is None:
+            # [per-bucket counts..., +Inf count, sum]
+            entry = values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def count(self, *labelvalues):
+        return sum(sum(s[labelvalues][:-1]) for s in self._snapshot() if labelvalues in s)
+
+    def _render_samples(self):
+        totals = {}
+        for shard in self._snapshot():
+            for key, entry in shard.items():
+                acc = totals.setdefault(key, [0] * len(entry[:-1]) + [0.0])
+                for i, v in enumerate(entry):
+                    acc[i] += v
+        lines = []
+        for key, entry in sorted(totals.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), entry[:-1]):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else _num(bound)
+                lines.append(f'{self.name}_bucket{self._labels(key, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{self._labels(key)} {_num(entry[-1])}')
+            lines.append(f'{self.name}_count{self._labels(key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _num(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    'clinic_http_request_duration_seconds', 'Request latency by route.',
+    ('route', 'method', 'status'),
+)
+REQUEST_QUERIES = registry.histogram(
+    'clinic_http_request_queries', 'SQL queries executed per request.',
+    ('route', 'method'), buckets=COUNT_BUCKETS,
+)
+REQUEST_QUERY_SECONDS = registry.histogram(
+    'clinic_http_request_query_seconds', 'Time spent in SQL per request.',
+    ('route', 'method'),
+)
+RESPONSE_SIZE = registry.histogram(
+    'clinic_http_response_size_bytes', 'Response body size by route.',
+    ('route', 'method'), buckets=SIZE_BUCKETS,
+)
+OCR_STAGE_DURATION = registry.histogram(
+    'clinic_ocr_stage_duration_seconds', 'Duration of document processing stages.',
+    ('endpoint', 'stage'),
+)
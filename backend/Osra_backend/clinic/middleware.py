@@ -0,0 +1,98 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import db_router, metrics
+
+
+class _QueryTimer:
+    """``connection.execute_wrapper`` hook counting queries and SQL time."""
+
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Records per-route latency, SQL usage and response size."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = _QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(queries))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        # Use the route pattern, not the raw path, to keep label cardinality bounded.
+        route = match.route if match else 'unmatched'
+        method = request.method
+        metrics.REQUEST_DURATION.observe(elapsed, route, method, str(response.status_code))
+        metrics.REQUEST_QUERIES.observe(queries.count, route, method)
+        metrics.REQUEST_QUERY_SECONDS.observe(queries.seconds, route, method)
+        if not response.streaming:
+            metrics.RESPONSE_SIZE.observe(len(response.content), route, method)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Serves safe requests from a read replica unless the client is pinned
+    to the primary by a recent write (or asks for it with X-Read-Primary)."""
+
+    cookie_name = 'clinic_primary_until'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _pinned(self, request):
+        if request.headers.get('X-Read-Primary') == '1':
+            return True
+        try:
+            return float(request.COOKIES.get(self.cookie_name, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def __call__(self, request):
+        if request.method not in self.safe_methods:
+            response = self.get_response(request)
+            sticky = getattr(settings, 'CLINIC_DB_STICKY_SECONDS', 5)
+            if sticky and db_router.replicas():
+                response.set_cookie(self.cookie_name, f"{time.time() + sticky:.3f}", max_age=sticky,
+                                    httponly=True, samesite='Lax')
+            return response
+        alias = None if self._pinned(request) else db_router.choose_replica()
+        with db_router.read_from(alias):
+            response = self.get_response(request)
+        if alias and response.streaming and not response.is_async:
+            # Streaming bodies (e.g. CSV exports) query after the view returns.
+            response.streaming_content = self._read_from(alias, response.streaming_content)
+        return response
+
+    @staticmethod
+    def _read_from(alias, content):
+        iterator = iter(content)
+        while True:
+            with db_router.read_from(alias):
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+            yield chunk
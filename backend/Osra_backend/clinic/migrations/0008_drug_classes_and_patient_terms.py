@@ -0,0 +1,122 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:50
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Common dental prescribing classes; clinics extend these through the admin.
+DRUG_CLASSES = {
+    'Penicillins': ['Penicillin', 'Amoxicillin', 'Ampicillin', 'Augmentin', 'Amoxicillin Clavulanate',
+                    'Co-amoxiclav', 'Flucloxacillin', 'Dicloxacillin', 'Phenoxymethylpenicillin'],
+    'Cephalosporins': ['Cephalexin', 'Cefalexin', 'Cefadroxil', 'Cefuroxime', 'Cefazolin', 'Ceftriaxone', 'Cefixime'],
+    'Macrolides': ['Azithromycin', 'Clarithromycin', 'Erythromycin'],
+    'Lincosamides': ['Clindamycin'],
+    'Nitroimidazoles': ['Metronidazole', 'Tinidazole'],
+    'Tetracyclines': ['Doxycycline', 'Tetracycline', 'Minocycline'],
+    'Sulfonamides': ['Sulfa', 'Sulfamethoxazole', 'Co-trimoxazole', 'Cotrimoxazole', 'Bactrim'],
+    'NSAIDs': ['Ibuprofen', 'Diclofenac', 'Naproxen', 'Ketorolac', 'Ketoprofen', 'Celecoxib',
+               'Mefenamic Acid', 'Aspirin', 'Acetylsalicylic Acid'],
+    'Opioids': ['Codeine', 'Tramadol', 'Morphine', 'Oxycodone', 'Hydrocodone'],
+    'Benzodiazepines': ['Diazepam', 'Midazolam', 'Alprazolam', 'Lorazepam'],
+    'Amide local anesthetics': ['Lidocaine', 'Lignocaine', 'Articaine', 'Mepivacaine', 'Bupivacaine', 'Prilocaine'],
+    'Ester local anesthetics': ['Benzocaine', 'Procaine', 'Tetracaine'],
+    'Anticoagulants': ['Warfarin', 'Heparin', 'Enoxaparin', 'Apixaban', 'Rivaroxaban', 'Dabigatran'],
+    'Antiplatelets': ['Clopidogrel', 'Aspirin', 'Ticagrelor'],
+}
+CONTRAINDICATIONS = [
+    ('NSAIDs', 'Anticoagulants'),
+    ('NSAIDs', 'Antiplatelets'),
+    ('Nitroimidazoles', 'Anticoagulants'),
+    ('Macrolides', 'Anticoagulants'),
+    ('Opioids', 'Benzodiazepines'),
+]
+
+# A frozen copy of clinic.contraindications.parse_terms() as of this migration.
+_SPLIT = re.compile(r'[,;\n/+&]|\band\b|\bwith\b', re.IGNORECASE)
+_WORD = re.compile(r'[a-z]+')
+_NONE = re.compile(r'^(none|nil|no|n ?a|nkda|nkma|no known( drug| medication)? allerg(y|ies)|not? applicable)$')
+_QUALIFIERS = frozenset({
+    'allergy', 'allergies', 'allergic', 'to', 'sensitivity', 'intolerance', 'intolerant', 'reaction',
+    'drug', 'drugs', 'mg', 'mcg', 'g', 'ml', 'iu', 'tab', 'tabs', 'tablet', 'tablets', 'cap', 'caps',
+    'capsule', 'capsules', 'daily', 'od', 'bd', 'bid', 'tid', 'qid', 'prn', 'mouthwash', 'gel',
+    'injection', 'mild', 'severe', 'suspected',
+})
+
+
+def parse_terms(text):
+    terms = set()
+    for part in _SPLIT.split(text or ''):
+        if _NONE.match(' '.join(_WORD.findall(part.lower()))):
+            continue
+        words = [w for w in _WORD.findall(part.lower()) if w not in _QUALIFIERS][:3]
+        terms |= {' '.join(words[:n]) for n in range(1, len(words) + 1) if len(words[0]) >= 3}
+    return sorted(terms)
+
+
+def seed_drug_classes(apps, schema_editor):
+    DrugClass = apps.get_model('clinic', 'DrugClass')
+    DrugClassMember = apps.get_model('clinic', 'DrugClassMember')
+    classes = {name: DrugClass.objects.get_or_create(name=name)[0] for name in DRUG_CLASSES}
+    DrugClassMember.objects.bulk_create(
+        [DrugClassMember(drug_class=classes[name], name=member)
+         for name, members in DRUG_CLASSES.items() for member in members],
+        ignore_conflicts=True,
+    )
+    for a, b in CONTRAINDICATIONS:
+        classes[a].contraindicated_with.add(classes[b])
+
+
+def index_patient_terms(apps, schema_editor):
+    Patient = apps.get_model('clinic', 'Patient')
+    batch = []
+    for patient in Patient.objects.only('id', 'allergies', 'medications').iterator(chunk_size=2000):
+        patient.allergy_terms = parse_terms(patient.allergies)
+        patient.medication_terms = parse_terms(patient.medications)
+        batch.append(patient)
+        if len(batch) >= 2000:
+            Patient.objects.bulk_update(batch, ['allergy_terms', 'medication_terms'])
+            batch = []
+    Patient.objects.bulk_update(batch, ['allergy_terms', 'medication_terms'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0007_medicalrecord_structured_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='allergy_terms',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='medication_terms',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.CreateModel(
+            name='DrugClass',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('description', models.TextField(blank=True, default='')),
+                ('contraindicated_with', models.ManyToManyField(blank=True, to='clinic.drugclass')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DrugClassMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150)),
+                ('drug_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='clinic.drugclass')),
+            ],
+            options={
+                'unique_together': {('drug_class', 'name')},
+            },
+        ),
+        migrations.RunPython(seed_drug_classes, migrations.RunPython.noop),
+        migrations.RunPython(index_patient_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:53
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+# A frozen copy of clinic.ledger.rebuild() as of this migration.
+HALF_CENT = Decimal('0.005')
+
+
+def rebuild_balances(apps, schema_editor):
+    Invoice = apps.get_model('clinic', 'Invoice')
+    Patient = apps.get_model('clinic', 'Patient')
+    Payment = apps.get_model('clinic', 'Payment')
+    money = models.DecimalField(max_digits=12, decimal_places=2)
+    paid = (
+        Payment.objects.filter(invoice=OuterRef('pk')).order_by()
+        .values('invoice').annotate(total=Sum('amount_paid')).values('total')
+    )
+    Invoice.objects.update(amount_paid=Coalesce(Subquery(paid, output_field=money), Value(0), output_field=money))
+    Invoice.objects.update(balance=F('total_amount') - F('amount_paid'))
+    Invoice.objects.update(payment_status=Case(
+        When(balance__lt=HALF_CENT, then=Value('paid')),
+        When(amount_paid__lt=HALF_CENT, then=Value('unpaid')),
+        default=Value('partial'),
+    ))
+    owed = (
+        Invoice.objects.filter(appointment__patient=OuterRef('pk')).order_by()
+        .values('appointment__patient').annotate(total=Sum('balance')).values('total')
+    )
+    Patient.objects.update(
+        outstanding_balance=Coalesce(Subquery(owed, output_field=money), Value(0), output_field=money),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0008_drug_classes_and_patient_terms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='outstanding_balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='payment_status',
+            field=models.CharField(choices=[('unpaid', 'Unpaid'), ('partial', 'Partially paid'), ('paid', 'Paid')], default='unpaid', max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('balance__gt', 0)), fields=['date_issued'], name='invoice_open_idx'),
+        ),
+        migrations.RunPython(rebuild_balances, migrations.RunPython.noop),
+    ]
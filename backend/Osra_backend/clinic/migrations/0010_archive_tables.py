@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0009_running_balances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('appointment_date', models.DateField()),
+                ('appointment_time', models.TimeField()),
+                ('status', models.CharField(max_length=50)),
+                ('notes', models.TextField(blank=True)),
+                ('dentist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_appointments', to='clinic.dentist')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_appointments', to='clinic.patient')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedAppointmentTreatment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField()),
+                ('notes', models.TextField(blank=True)),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='treatments', to='clinic.archivedappointment')),
+                ('treatment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='clinic.treatment')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedMedicalRecord',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('diagnosis', models.TextField()),
+                ('prescribed_drugs', models.TextField()),
+                ('treatment_notes', models.TextField()),
+                ('dental_issues', models.TextField(blank=True, default='')),
+                ('treatment_plan', models.TextField(blank=True, default='')),
+                ('record_date', models.DateTimeField()),
+                ('structured_data', models.JSONField(blank=True, default=dict)),
+                ('structured_at', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='medical_records', to='clinic.archivedappointment')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_medical_records', to='clinic.patient')),
+            ],
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 
 class Patient(models.Model):
@@ -15,7 +15,24 @@ class Patient(models.Model):
     diseases = models.TextField(blank=True, default="")
     allergies = models.TextField(blank=True, default="")
     medications = models.TextField(blank=True, default="")
+    # Normalised terms parsed from the two fields above on save, so
+    # prescription checks never re-parse the free text.
+    allergy_terms = models.JSONField(default=list, blank=True)
+    medication_terms = models.JSONField(default=list, blank=True)
+    # Sum of Invoice.balance over the patient's invoices, kept by clinic.ledger.
+    outstanding_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    def refresh_clinical_terms(self):
+        from .contraindications import parse_terms
+        self.allergy_terms = parse_terms(self.allergies)
+        self.medication_terms = parse_terms(self.medications)
+
+    def save(self, *args, **kwargs):
+        self.refresh_clinical_terms()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'allergy_terms', 'medication_terms'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -52,7 +69,37 @@ class Drug(models.Model):
         return self.name
 
 
+class DrugClass(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    description = models.TextField(blank=True, default="")
+    # Classes that should not be prescribed together, e.g. NSAIDs and anticoagulants.
+    contraindicated_with = models.ManyToManyField('self', blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class DrugClassMember(models.Model):
+    """A drug name (generic or brand) belonging to a DrugClass."""
+    drug_class = models.ForeignKey(DrugClass, on_delete=models.CASCADE, related_name='members')
+    name = models.CharField(max_length=150)
+
+    class Meta:
+        unique_together = ('drug_class', 'name')
+
+    def __str__(self):
+        return f"{self.name} ({self.drug_class})"
+
+
 class Appointment(models.Model):
+    # Status values. The app sets the first three; imported data may also
+    # spell canceled 'cancelled', and older rows may be 'no-show'.
+    UPCOMING = 'upcoming'
+    COMPLETED = 'completed'
+    CANCELED = 'canceled'
+    CANCELED_STATUSES = (CANCELED, 'cancelled')
+    NO_SHOW = 'no-show'
+
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
     dentist = models.ForeignKey(Dentist, on_delete=models.CASCADE)
     appointment_date = models.DateField()
@@ -60,6 +107,22 @@ class Appointment(models.Model):
     status = models.CharField(max_length=50)
     notes = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            # Range scans by status over dates (see clinic.scheduler).
+            models.Index(fields=['status', 'appointment_date'], name='appointment_status_date_idx'),
+            # A dentist's bookings on given days (see clinic.series).
+            models.Index(fields=['dentist', 'appointment_date'], name='appointment_dentist_date_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored dentist so change events reach both dashboards
+        # when an appointment is reassigned.
+        instance._loaded_dentist_id = instance.__dict__.get('dentist_id')
+        return instance
+
     def __str__(self):
         return f"{self.patient} - {self.appointment_date}"
 
@@ -73,6 +136,9 @@ class MedicalRecord(models.Model):
     dental_issues = models.TextField(blank=True, default="")
     treatment_plan = models.TextField(blank=True, default="")
     record_date = models.DateTimeField(auto_now_add=True)
+    # Derived from the free-text fields by extraction (see backfill_structured_records)
+    structured_data = models.JSONField(default=dict, blank=True)
+    structured_at = models.DateTimeField(null=True, blank=True)
 
 class AppointmentTreatment(models.Model):
     appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE)
@@ -90,10 +156,50 @@ class TreatmentDrug(models.Model):
 
 
 class Invoice(models.Model):
+    STATUS_CHOICES = [('unpaid', 'Unpaid'), ('partial', 'Partially paid'), ('paid', 'Paid')]
+    LEDGER_FIELDS = ('amount_paid', 'balance', 'payment_status')
+
     appointment = models.OneToOneField(Appointment, on_delete=models.CASCADE)
     date_issued = models.DateField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    payment_status = models.CharField(max_length=50)
+    # Maintained by clinic.ledger in the same transaction as each Payment change.
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    payment_status = models.CharField(max_length=50, choices=STATUS_CHOICES, default='unpaid')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_issued'], condition=models.Q(balance__gt=0), name='invoice_open_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_total_amount = instance.__dict__.get('total_amount')
+        return instance
+
+    def save(self, *args, **kwargs):
+        from . import ledger
+        self.total_amount = ledger.to_decimal(self.total_amount)
+        self.amount_paid = ledger.to_decimal(self.amount_paid)
+        with transaction.atomic():
+            if self._state.adding:
+                self.balance = self.total_amount - self.amount_paid
+                self.payment_status = ledger.status_for(self.amount_paid, self.balance)
+                super().save(*args, **kwargs)
+                ledger.apply(self.pk, total_delta=self.balance, patient_only=True)
+            else:
+                # Never write the ledger columns from memory: payments may
+                # have moved them since this instance was loaded.
+                update_fields = kwargs.pop('update_fields', None)
+                if update_fields is None:
+                    update_fields = [f.name for f in self._meta.concrete_fields
+                                     if not f.primary_key and f.name not in self.LEDGER_FIELDS]
+                super().save(*args, update_fields=update_fields, **kwargs)
+                old_total = getattr(self, '_loaded_total_amount', self.total_amount)
+                ledger.apply(self.pk, total_delta=self.total_amount - old_total)
+                self.refresh_from_db(fields=self.LEDGER_FIELDS)
+            self._loaded_total_amount = self.total_amount
 
 
 class Payment(models.Model):
@@ -101,8 +207,116 @@ class Payment(models.Model):
     payment_date = models.DateField(auto_now_add=True)
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded = (instance.__dict__.get('invoice_id'), instance.__dict__.get('amount_paid'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        from . import ledger
+        self.amount_paid = ledger.to_decimal(self.amount_paid)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            old_invoice, old_amount = getattr(self, '_loaded', (None, 0))
+            if old_invoice is not None and old_invoice != self.invoice_id:
+                ledger.apply(old_invoice, paid_delta=-old_amount)
+                old_amount = 0
+            ledger.apply(self.invoice_id, paid_delta=self.amount_paid - old_amount)
+            self._loaded = (self.invoice_id, self.amount_paid)
+
+
+
 
 
+# Cold storage for old completed appointments (see the archive_appointments
+# command). Columns mirror the hot tables in the same order, keeping the
+# original ids, so list endpoints can UNION them in with ?include_archived=1.
+
+class ArchivedAppointment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='archived_appointments')
+    dentist = models.ForeignKey(Dentist, on_delete=models.CASCADE, related_name='archived_appointments')
+    appointment_date = models.DateField()
+    appointment_time = models.TimeField()
+    status = models.CharField(max_length=50)
+    notes = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.patient} - {self.appointment_date} (archived)"
+
+
+class ArchivedMedicalRecord(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='archived_medical_records')
+    appointment = models.ForeignKey(ArchivedAppointment, on_delete=models.SET_NULL, null=True,
+                                    related_name='medical_records')
+    diagnosis = models.TextField()
+    prescribed_drugs = models.TextField()
+    treatment_notes = models.TextField()
+    dental_issues = models.TextField(blank=True, default="")
+    treatment_plan = models.TextField(blank=True, default="")
+    record_date = models.DateTimeField()
+    structured_data = models.JSONField(default=dict, blank=True)
+    structured_at = models.DateTimeField(null=True, blank=True)
+
+
+class ArchivedAppointmentTreatment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    appointment = models.ForeignKey(ArchivedAppointment, on_delete=models.CASCADE, related_name='treatments')
+    treatment = models.ForeignKey(Treatment, on_delete=models.CASCADE, related_name='+')
+    quantity = models.IntegerField()
+    notes = models.TextField(blank=True)
+
+
+# Background jobs (see clinic.scheduler and the run_scheduler command).
+
+class ScheduledJob(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    enabled = models.BooleanField(default=True)
+    interval_seconds = models.PositiveIntegerField()
+    next_run_at = models.DateTimeField()
+    # A runner holds the job until this time; an expired lease can be taken over.
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+    last_status = models.CharField(max_length=20, blank=True)
+    last_result = models.JSONField(default=dict, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class NotificationOutbox(models.Model):
+    KIND_CHOICES = [('reminder', 'Appointment reminder'), ('unfinished', 'Appointment not completed')]
+    STATUS_CHOICES = [('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Kept when the appointment is archived or deleted: the row records what was sent.
+    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, null=True, related_name='notifications')
+    # The appointment date the notice is about, so a rescheduled visit gets a new one.
+    appointment_date = models.DateField()
+    channel = models.CharField(max_length=10)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'appointment', 'appointment_date'], name='outbox_once_per_date'),
+        ]
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(status='pending'), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} to {self.recipient} ({self.status})"
 
 
 class Admin(models.Model):
@@ -112,3 +326,25 @@ class Admin(models.Model):
 
     def __str__(self):
         return self.name
+
+
+# Idempotent POSTs (see clinic.idempotency).
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=255, unique=True)
+    # SHA-256 of method, path and body; a reused key must repeat the request.
+    fingerprint = models.CharField(max_length=64)
+    route = models.CharField(max_length=100)
+    # Null while the first request is still running.
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    # Other response headers worth replaying, e.g. Location.
+    headers = models.JSONField(default=dict, blank=True)
+    # zlib-compressed response body.
+    body = models.BinaryField(default=b'')
+    created_at = models.DateTimeField(auto_now_add=True)
+    # End of the replay window, or of the claim while the request runs.
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.route})"
@@ -0,0 +1,105 @@
+"""
+Delivery of queued NotificationOutbox rows.
+
+Jobs only ever insert into the outbox; delivery happens separately, in
+primary-key batches over the pending rows, through the sender named by
+CLINIC_NOTIFICATION_SENDER. A failed send is retried on later runs until
+CLINIC_NOTIFICATION_MAX_ATTEMPTS, then marked failed.
+
+LocalSender is the offline stand-in: it logs each message and, if
+CLINIC_NOTIFICATION_LOG is set, appends it to that file as a JSON line.
+"""
+import json
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class Sender:
+    def send(self, notification):
+        """Deliver one NotificationOutbox row; raise on failure."""
+        raise NotImplementedError
+
+
+class LocalSender(Sender):
+    """Delivers nowhere: logs, optionally appends to a file, remembers the last few."""
+
+    def __init__(self, path=None, keep=1000):
+        self.path = path
+        self.sent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def send(self, notification):
+        message = {
+            'id': notification.pk,
+            'kind': notification.kind,
+            'channel': notification.channel,
+            'to': notification.recipient,
+            'subject': notification.subject,
+            'body': notification.body,
+        }
+        logger.info("Notification sent", extra={
+            'notification': notification.pk, 'kind': notification.kind, 'channel': notification.channel,
+        })
+        with self._lock:
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(message) + '\n')
+            self.sent.append(message)
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_sender():
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            cls = import_string(getattr(settings, 'CLINIC_NOTIFICATION_SENDER', 'clinic.notifications.LocalSender'))
+            _sender = cls(path=getattr(settings, 'CLINIC_NOTIFICATION_LOG', None)) if cls is LocalSender else cls()
+        return _sender
+
+
+def set_sender(sender):
+    """Install ``sender`` as the process-wide sender (used by tests)."""
+    global _sender
+    with _sender_lock:
+        _sender = sender
+
+
+def deliver_pending(now, batch_size=500, sender=None):
+    """Send every pending notification. Returns ``{'sent': n, 'retrying': n, 'failed': n}``."""
+    from .models import NotificationOutbox
+
+    sender = sender or get_sender()
+    max_attempts = getattr(settings, 'CLINIC_NOTIFICATION_MAX_ATTEMPTS', 5)
+    counts = {'sent': 0, 'retrying': 0, 'failed': 0}
+    last_pk = 0
+    while True:
+        batch = list(NotificationOutbox.objects.filter(status='pending', pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            return counts
+        for notification in batch:
+            notification.attempts += 1
+            try:
+                sender.send(notification)
+            except Exception as e:
+                notification.last_error = f"{type(e).__name__}: {e}"
+                if notification.attempts >= max_attempts:
+                    notification.status = 'failed'
+                    counts['failed'] += 1
+                else:
+                    counts['retrying'] += 1
+                continue
+            notification.status = 'sent'
+            notification.sent_at = now
+            notification.last_error = ''
+            counts['sent'] += 1
+        NotificationOutbox.objects.bulk_update(batch, ['status', 'attempts', 'sent_at', 'last_error'])
+        last_pk = batch[-1].pk
@@ -0,0 +1,205 @@
+"""
+OCR helpers shared by the processing views.
+
+Uploads are split into page jobs: one per image, one per PDF page. Jobs are
+OCR'd in a process pool sized to the CPU count. PDF pages are rasterized
+inside the worker that OCRs them, so a long PDF is never rendered up front,
+and results can be yielded as soon as each page finishes.
+"""
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from . import capabilities, ocr_backends
+
+logger = logging.getLogger(__name__)
+
+# ``source`` is raw bytes for images and a temp-file path for PDFs, so a
+# multi-page PDF is not pickled once per page.
+PageJob = namedtuple('PageJob', 'file_index file_name page kind source')
+
+PDF_RENDER_DPI = 300
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _worker_init(backend_name, lang, tessdata):
+    # Tesseract spawns OpenMP threads per process; with one process per core
+    # that oversubscribes the CPU and makes every page slower.
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+    # Initialise the engine once per worker so pages never pay for it.
+    backend = None
+    if backend_name:
+        try:
+            backend = ocr_backends.create_backend(backend_name, pool_size=1, lang=lang, tessdata=tessdata)
+            backend.warm()
+        except Exception:
+            backend = None
+    ocr_backends.set_backend(backend)
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from django.conf import settings
+            workers = getattr(settings, 'CLINIC_OCR_WORKERS', None) or os.cpu_count() or 1
+            backend = ocr_backends.get_backend()
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_worker_init,
+                initargs=(
+                    backend.name if backend else None,
+                    getattr(settings, 'CLINIC_OCR_LANG', 'eng'),
+                    getattr(settings, 'CLINIC_OCR_TESSDATA', None),
+                ),
+            )
+        return _pool
+
+
+def warm_up():
+    """Load the imaging library and OCR engine ahead of the first request.
+
+    Called from ClinicConfig.ready() when CLINIC_OCR_WARMUP is set, for
+    workers that serve OCR traffic.
+    """
+    started = time.perf_counter()
+    if capabilities.available('imaging'):
+        capabilities.load('imaging')
+    backend = ocr_backends.get_backend()
+    if backend is not None:
+        backend.warm()
+    logger.info("OCR warmed up", extra={
+        'backend': backend.name if backend else None,
+        'ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+    return backend
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def is_pdf(upload, head):
+    return (
+        upload.content_type == 'application/pdf'
+        or upload.name.lower().endswith('.pdf')
+        or head.startswith(b'%PDF')
+    )
+
+
+def pdf_page_count(path):
+    return int(capabilities.load('pdf').pdfinfo_from_path(path)['Pages'])
+
+
+def build_jobs(files):
+    """Turn uploaded files into page jobs.
+
+    Returns ``(jobs, errors, cleanup)``. ``errors`` holds page results for
+    files that could not be split (e.g. PDFs without poppler); ``cleanup``
+    removes temporary PDF copies and must be called once all jobs finished.
+    """
+    jobs, temp_paths, errors = [], [], []
+    for index, upload in enumerate(files):
+        head = upload.read(5)
+        upload.seek(0)
+        if not is_pdf(upload, head):
+            jobs.append(PageJob(index, upload.name, 1, 'image', upload.read()))
+            continue
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+            for chunk in upload.chunks():
+                tmp.write(chunk)
+        temp_paths.append(tmp.name)
+        try:
+            pages = pdf_page_count(tmp.name)
+        except Exception as e:
+            logger.warning("Could not read PDF", extra={'file_name': upload.name, 'error': str(e)})
+            errors.append(page_result(PageJob(index, upload.name, 1, 'pdf', tmp.name),
+                                      error=f"PDF support unavailable: {type(e).__name__}: {e}"))
+            continue
+        jobs.extend(PageJob(index, upload.name, page, 'pdf', tmp.name) for page in range(1, pages + 1))
+
+    def cleanup():
+        for path in temp_paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    return jobs, errors, cleanup
+
+
+def page_result(job, text='', error=None, decode_ms=0.0, recognize_ms=0.0):
+    return {
+        'file': job.file_name,
+        'file_index': job.file_index,
+        'page': job.page,
+        'text': text,
+        'error': error,
+        'decode_ms': round(decode_ms, 2),
+        'recognize_ms': round(recognize_ms, 2),
+    }
+
+
+def load_page_image(job):
+    if job.kind == 'pdf':
+        pdf2image = capabilities.load('pdf')
+        return pdf2image.convert_from_path(job.source, dpi=PDF_RENDER_DPI, first_page=job.page, last_page=job.page)[0]
+    return capabilities.load('imaging').open(io.BytesIO(job.source))
+
+
+def ocr_page(job):
+    """OCR a single page job. Runs in a pool worker; never raises."""
+    backend = ocr_backends.get_backend()
+    if backend is None:
+        return page_result(job, error='No OCR engine installed')
+    try:
+        started = time.perf_counter()
+        image = load_page_image(job).convert('RGB')
+        decode_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        text = backend.image_to_text(image)
+        recognize_ms = (time.perf_counter() - started) * 1000
+    except Exception as e:
+        return page_result(job, error=f"{type(e).__name__}: {e}")
+    return page_result(job, text=text, decode_ms=decode_ms, recognize_ms=recognize_ms)
+
+
+def iter_page_results(jobs):
+    """Yield page results in completion order.
+
+    A single job runs inline: shipping one image to a worker process only adds
+    IPC latency.
+    """
+    if len(jobs) <= 1:
+        for job in jobs:
+            yield ocr_page(job)
+        return
+    try:
+        futures = {get_pool().submit(ocr_page, job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                yield page_result(futures[future], error=f"{type(e).__name__}: {e}")
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge page). Drop the pool so the next
+        # request gets a fresh one.
+        _reset_pool()
+        raise
+
+
+def join_pages(results):
+    ordered = sorted(results, key=lambda r: (r['file_index'], r['page']))
+    return '\n\n'.join(r['text'].strip() for r in ordered if r['text'] and r['text'].strip())
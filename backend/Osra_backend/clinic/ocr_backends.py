@@ -0,0 +1,170 @@
+"""
+Pluggable OCR engines.
+
+``pytesseract`` shells out to the ``tesseract`` binary for every image, which
+re-reads the language data and round-trips the image through a temp file each
+time. ``tesserocr`` binds libtesseract directly; its initialised API objects
+are kept in a small pool and reused, so that fixed cost is paid once per
+process. CLINIC_OCR_BACKEND selects the engine ('auto' prefers tesserocr and
+falls back to pytesseract).
+"""
+import logging
+import os
+import platform
+import queue
+import threading
+
+from . import capabilities
+
+logger = logging.getLogger(__name__)
+
+
+class OCRBackend:
+    name = None
+
+    def image_to_text(self, image):
+        raise NotImplementedError
+
+    def warm(self):
+        """Pay one-off initialisation cost ahead of the first request."""
+
+    def close(self):
+        pass
+
+
+class PytesseractBackend(OCRBackend):
+    name = 'pytesseract'
+
+    def __init__(self):
+        pytesseract = capabilities.load('pytesseract')
+        if platform.system() == 'Windows':
+            possible_paths = [
+                r'C:\Program Files\Tesseract-OCR\tesseract.exe',
+                r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
+            ]
+            for path in possible_paths:
+                if os.path.exists(path):
+                    pytesseract.pytesseract.tesseract_cmd = path
+                    logger.info("Tesseract configured", extra={'tesseract_cmd': path})
+                    break
+        self._pytesseract = pytesseract
+
+    def image_to_text(self, image):
+        return self._pytesseract.image_to_string(image)
+
+
+class TesserocrBackend(OCRBackend):
+    name = 'tesserocr'
+
+    def __init__(self, size=1, lang='eng', path=None):
+        self._tesserocr = capabilities.load('tesserocr')
+        self._lang = lang
+        self._path = path
+        self._size = max(1, size)
+        self._apis = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        # Fail fast (and let get_backend fall back) if tessdata is missing.
+        self._apis.put(self._new_api())
+
+    def _new_api(self):
+        kwargs = {'lang': self._lang}
+        if self._path:
+            kwargs['path'] = self._path
+        api = self._tesserocr.PyTessBaseAPI(**kwargs)
+        self._created += 1
+        return api
+
+    def _acquire(self):
+        try:
+            return self._apis.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self._size:
+                return self._new_api()
+        return self._apis.get()
+
+    def warm(self):
+        with self._lock:
+            while self._created < self._size:
+                self._apis.put(self._new_api())
+
+    def image_to_text(self, image):
+        api = self._acquire()
+        try:
+            api.SetImage(image)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+            self._apis.put(api)
+
+    def close(self):
+        while True:
+            try:
+                self._apis.get_nowait().End()
+            except queue.Empty:
+                break
+
+
+_backend = None
+_backend_name = None
+_resolved = False
+_backend_lock = threading.Lock()
+
+
+def _settings():
+    from django.conf import settings
+    if not settings.configured:
+        return {}
+    return {
+        'backend': getattr(settings, 'CLINIC_OCR_BACKEND', 'auto'),
+        'pool_size': getattr(settings, 'CLINIC_OCR_ENGINE_POOL_SIZE', 2),
+        'lang': getattr(settings, 'CLINIC_OCR_LANG', 'eng'),
+        'tessdata': getattr(settings, 'CLINIC_OCR_TESSDATA', None),
+    }
+
+
+def create_backend(name, pool_size=1, lang='eng', tessdata=None):
+    if name == 'tesserocr':
+        return TesserocrBackend(size=pool_size, lang=lang, path=tessdata)
+    if name == 'pytesseract':
+        return PytesseractBackend()
+    raise ValueError(f"Unknown OCR backend {name!r}")
+
+
+def get_backend():
+    """Return the process-wide OCR backend, or None if no engine is installed."""
+    global _backend, _backend_name, _resolved
+    with _backend_lock:
+        if _resolved:
+            return _backend
+        opts = _settings()
+        requested = opts.get('backend', 'auto')
+        candidates = ['tesserocr', 'pytesseract'] if requested == 'auto' else [requested]
+        for candidate in candidates:
+            try:
+                backend = create_backend(
+                    candidate, pool_size=opts.get('pool_size', 1),
+                    lang=opts.get('lang', 'eng'), tessdata=opts.get('tessdata'),
+                )
+            except ImportError:
+                continue
+            except Exception as e:
+                logger.warning("OCR backend failed to initialise", extra={'backend': candidate, 'error': str(e)})
+                continue
+            _backend, _backend_name, _resolved = backend, candidate, True
+            logger.info("OCR backend ready", extra={'backend': candidate})
+            return backend
+        logger.warning("No OCR backend installed; OCR will use simulated text")
+        _backend, _backend_name, _resolved = None, None, True
+        return None
+
+
+def set_backend(backend):
+    """Install ``backend`` as the process-wide engine (used by pool workers and tests)."""
+    global _backend, _backend_name, _resolved
+    with _backend_lock:
+        _backend = backend
+        _backend_name = backend.name if backend is not None else None
+        _resolved = True
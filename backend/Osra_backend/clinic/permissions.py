@@ -0,0 +1,24 @@
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+def is_clinic_admin(request):
+    """True for Django staff sessions or requests carrying CLINIC_ADMIN_TOKEN.
+
+    The mobile app's own login does not issue credentials, so operational
+    endpoints use either the Django admin session or a shared token sent as
+    the ``X-Admin-Token`` header.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return True
+    token = getattr(settings, 'CLINIC_ADMIN_TOKEN', '')
+    supplied = request.headers.get('X-Admin-Token', '')
+    return bool(token) and hmac.compare_digest(token, supplied)
+
+
+class IsClinicAdmin(BasePermission):
+    def has_permission(self, request, view):
+        return is_clinic_admin(request)
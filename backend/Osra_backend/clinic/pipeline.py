@@ -0,0 +1,125 @@
+"""
+Composable document-processing pipeline.
+
+A pipeline is an ordered list of stages sharing one context dict. OCR runs at
+most once per document; every later stage reads ``ctx['text']``. Each stage's
+wall time is recorded in ``ctx['timings_ms']`` and in the
+clinic_ocr_stage_duration_seconds metric.
+"""
+import logging
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from . import drug_index, metrics, ocr
+from .extraction import extract_clinical_entities, extract_medications
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    name = None
+
+    def run(self, ctx):
+        raise NotImplementedError
+
+
+class OCRStage(Stage):
+    """Reads ``ctx['files']`` and sets ``ctx['text']`` and ``ctx['pages']``.
+
+    ``fallback(file_name)`` supplies simulated text when no engine produced
+    any, mirroring the behaviour the endpoints have always had.
+    """
+    name = 'ocr'
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+
+    def run(self, ctx):
+        files = ctx.get('files') or []
+        if not files:
+            return
+        jobs, errors, cleanup = ocr.build_jobs(files)
+        results = list(errors)
+        try:
+            try:
+                for result in ocr.iter_page_results(jobs):
+                    record_page(ctx['endpoint'], result)
+                    results.append(result)
+            except BrokenProcessPool as e:
+                for result in unfinished_pages(jobs, results, e):
+                    record_page(ctx['endpoint'], result)
+                    results.append(result)
+        finally:
+            cleanup()
+        results.sort(key=lambda r: (r['file_index'], r['page']))
+        ctx['pages'] = results
+        text = ocr.join_pages(results)
+        if not text and self.fallback is not None:
+            reason = next((r['error'] for r in results if r['error']), 'empty result')
+            logger.info("OCR using fallback text", extra={'reason': reason})
+            text = self.fallback(files[0].name)
+        ctx['text'] = text
+
+
+def unfinished_pages(jobs, results, error):
+    """Failed page results for the jobs a broken OCR pool never returned."""
+    done = {(r['file_index'], r['page']) for r in results}
+    logger.warning("OCR worker pool broke", extra={'pages': len(jobs) - len(done)})
+    return [ocr.page_result(job, error=f"{type(error).__name__}: {error}")
+            for job in jobs if (job.file_index, job.page) not in done]
+
+
+class MedicationStage(Stage):
+    name = 'medications'
+
+    def run(self, ctx):
+        ctx['medications'] = extract_medications(
+            ctx.get('text') or '',
+            index=drug_index.get_index(),
+            min_confidence=getattr(settings, 'CLINIC_DRUG_MATCH_MIN_CONFIDENCE', 0.75),
+        )
+        logger.info("Extracted medications", extra={'medications': len(ctx['medications'])})
+
+
+class ClinicalEntityStage(Stage):
+    name = 'entities'
+
+    def run(self, ctx):
+        ctx['entities'] = extract_clinical_entities(ctx.get('text') or '')
+
+
+STAGES = {
+    'ocr': OCRStage,
+    'medications': MedicationStage,
+    'entities': ClinicalEntityStage,
+}
+
+
+def record_page(endpoint, result):
+    metrics.OCR_STAGE_DURATION.observe(result['decode_ms'] / 1000, endpoint, 'decode')
+    metrics.OCR_STAGE_DURATION.observe(result['recognize_ms'] / 1000, endpoint, 'recognize')
+    if result['error']:
+        logger.warning("OCR page failed", extra={
+            'file_name': result['file'], 'page': result['page'], 'error': result['error'],
+        })
+    else:
+        logger.info("OCR extracted text", extra={
+            'file_name': result['file'], 'page': result['page'], 'chars': len(result['text']),
+        })
+        logger.debug("OCR text preview", extra={'preview': result['text'][:100]})
+
+
+def run(stages, endpoint, files=None, text=None):
+    """Run ``stages`` in order and return the shared context."""
+    ctx = {'endpoint': endpoint, 'files': files or [], 'text': text or '', 'timings_ms': {}}
+    total = time.perf_counter()
+    for stage in stages:
+        started = time.perf_counter()
+        stage.run(ctx)
+        elapsed = time.perf_counter() - started
+        ctx['timings_ms'][stage.name] = round(elapsed * 1000, 2)
+        metrics.OCR_STAGE_DURATION.observe(elapsed, endpoint, stage.name)
+    ctx['timings_ms']['total'] = round((time.perf_counter() - total) * 1000, 2)
+    return ctx
@@ -0,0 +1,188 @@
+"""
+Opt-in per-request profiling.
+
+Admins can add ``X-Clinic-Profile: 1`` (or ``?__profile=1``) to any ``/api/``
+request to capture a cProfile run, a sampled collapsed-stack profile (ready for
+flamegraph.pl / speedscope) and the full SQL trace of that request. Separately,
+CLINIC_PROFILE_SAMPLE_RATE samples a fraction of all requests with the cheap
+stack sampler only, keeping artifacts for those slower than CLINIC_PROFILE_SLOW_MS.
+"""
+import cProfile
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+from .permissions import is_clinic_admin
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS = {
+    'pstats': ('.pstats', 'application/octet-stream'),
+    'collapsed': ('.collapsed', 'text/plain'),
+    'sql': ('.sql.json', 'application/json'),
+    'meta': ('.json', 'application/json'),
+}
+
+
+def profile_dir():
+    return Path(getattr(settings, 'CLINIC_PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+class StackSampler:
+    """Samples one thread's stack on a timer and counts collapsed stacks."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='clinic-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class SQLTrace:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': repr(params)[:500],
+                'many': many,
+                'ms': round((time.perf_counter() - start) * 1000, 3),
+            })
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith('/api/'):
+            return self.get_response(request)
+        requested = request.headers.get('X-Clinic-Profile') == '1' or request.GET.get('__profile') == '1'
+        if requested and is_clinic_admin(request):
+            return self._profile(request, full=True)
+        rate = getattr(settings, 'CLINIC_PROFILE_SAMPLE_RATE', 0.0)
+        if rate and random.random() < rate:
+            return self._profile(request, full=False)
+        return self.get_response(request)
+
+    def _profile(self, request, full):
+        interval = getattr(settings, 'CLINIC_PROFILE_INTERVAL', 0.005)
+        sampler = StackSampler(threading.get_ident(), interval)
+        trace = SQLTrace()
+        profiler = cProfile.Profile() if full else None
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(trace))
+            sampler.start()
+            try:
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+            finally:
+                sampler.stop()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        if not full and elapsed_ms < getattr(settings, 'CLINIC_PROFILE_SLOW_MS', 1000):
+            return response
+        profile_id = save_profile(request, response, elapsed_ms, sampler, trace, profiler)
+        logger.info("Request profiled", extra={
+            'profile_id': profile_id, 'path': request.path, 'elapsed_ms': round(elapsed_ms, 2),
+        })
+        # Sampled requests come from anyone; only admins may see artifact ids.
+        if full or is_clinic_admin(request):
+            response['X-Profile-Id'] = profile_id
+        return response
+
+
+def save_profile(request, response, elapsed_ms, sampler, trace, profiler):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    base = directory / profile_id
+    if profiler is not None:
+        profiler.dump_stats(f"{base}{ARTIFACTS['pstats'][0]}")
+    Path(f"{base}{ARTIFACTS['collapsed'][0]}").write_text(sampler.collapsed())
+    Path(f"{base}{ARTIFACTS['sql'][0]}").write_text(json.dumps(trace.queries, indent=1))
+    meta = {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'elapsed_ms': round(elapsed_ms, 2),
+        'queries': len(trace.queries),
+        'sql_ms': round(sum(q['ms'] for q in trace.queries), 2),
+        'samples': sum(sampler.stacks.values()),
+        'mode': 'full' if profiler is not None else 'sampled',
+    }
+    Path(f"{base}{ARTIFACTS['meta'][0]}").write_text(json.dumps(meta))
+    _prune(directory)
+    return profile_id
+
+
+def _prune(directory):
+    keep = getattr(settings, 'CLINIC_PROFILE_MAX_ARTIFACTS', 200)
+    metas = sorted(p for p in directory.glob('*.json') if not p.name.endswith('.sql.json'))
+    for meta in metas[:-keep] if len(metas) > keep else []:
+        stem = meta.name[:-len('.json')]
+        for suffix, _ in ARTIFACTS.values():
+            (directory / f"{stem}{suffix}").unlink(missing_ok=True)
+
+
+def list_profiles():
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    metas = sorted((p for p in directory.glob('*.json') if not p.name.endswith('.sql.json')), reverse=True)
+    return [json.loads(p.read_text()) for p in metas]
+
+
+def artifact_path(profile_id, kind):
+    if kind not in ARTIFACTS or not profile_id.replace('-', '').isalnum():
+        return None, None
+    suffix, content_type = ARTIFACTS[kind]
+    path = profile_dir() / f"{profile_id}{suffix}"
+    return (path, content_type) if path.exists() else (None, None)
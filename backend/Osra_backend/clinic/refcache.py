@@ -0,0 +1,171 @@
+"""
+Read-through cache for reference data: dentists, treatments, drugs and the
+treatment-drug links.
+
+Cached entries are namespaced by a per-group version token kept in the
+``reference`` cache. Saving or deleting a row of a group replaces its token
+(see clinic.signals), so every entry of that group becomes unreachable at once
+and is rebuilt on the next read, from the primary database so a lagging
+replica cannot put the old rows back; other groups are untouched.
+
+Pointing ``CLINIC_REFERENCE_CACHE_DIR`` at a directory shared by all workers
+switches to the file-based backend, so a change made by one worker reaches all
+of them. The default local-memory backend keeps tokens per process, so there
+entries also expire after CLINIC_REFERENCE_LOCAL_SECONDS, which bounds how long
+another worker can serve data changed elsewhere.
+
+Two kinds of entries are kept: serialized API responses (ReferenceCacheMixin,
+never for dentists, whose rows hold credentials) and in-process lookup maps
+(``local``), which hold live Python objects and are rebuilt when their group's
+token changes.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import db_router, metrics
+
+CACHE_ALIAS = 'reference'
+
+# Model name -> cache group.
+GROUPS = {
+    'Dentist': 'dentists',
+    'Treatment': 'treatments',
+    'Drug': 'drugs',
+    'TreatmentDrug': 'treatment_drugs',
+}
+
+REQUESTS = metrics.registry.counter(
+    'clinic_reference_cache_requests_total', 'Reference data cache lookups.',
+    ('group', 'result'),
+)
+
+_local = {}
+_lock = threading.Lock()
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version_key(group):
+    return f'ref:version:{group}'
+
+
+def version(group):
+    """The current version token of ``group``."""
+    cache = _cache()
+    key = _version_key(group)
+    token = cache.get(key)
+    if token is None:
+        # First use, or the token was evicted: start a new generation, which
+        # also orphans anything cached under a previous token.
+        cache.add(key, time.time_ns(), timeout=None)
+        token = cache.get(key)
+    return token
+
+
+def _ttl():
+    """Entry lifetime in seconds, or None for the cache's own timeout."""
+    if isinstance(_cache(), LocMemCache):
+        return getattr(settings, 'CLINIC_REFERENCE_LOCAL_SECONDS', 60)
+    return None
+
+
+def _build(build):
+    # Right after an invalidation a replica may not have the change yet.
+    with db_router.read_from(None):
+        return build()
+
+
+def invalidate(*groups):
+    cache = _cache()
+    for group in groups:
+        cache.set(_version_key(group), time.time_ns(), timeout=None)
+
+
+def get_or_set(group, name, build):
+    """Cached value of ``build()`` for ``name`` in the current ``group`` version."""
+    cache = _cache()
+    key = f'ref:{group}:{version(group)}:{name}'
+    value = cache.get(key)
+    if value is not None:
+        REQUESTS.inc(group, 'hit')
+        return value
+    REQUESTS.inc(group, 'miss')
+    value = _build(build)
+    ttl = _ttl()
+    if ttl is None:
+        cache.set(key, value)
+    else:
+        cache.set(key, value, timeout=ttl)
+    return value
+
+
+def local(group, name, build):
+    """Process-local ``build()`` result, rebuilt when ``group`` changes.
+
+    For lookup maps holding objects not worth pickling into the cache.
+    """
+    token = version(group)
+    ttl = _ttl()
+    now = time.monotonic()
+    with _lock:
+        entry = _local.get((group, name))
+    if entry is not None and entry[0] == token and (ttl is None or now - entry[2] < ttl):
+        REQUESTS.inc(group, 'hit')
+        return entry[1]
+    REQUESTS.inc(group, 'miss')
+    value = _build(build)
+    with _lock:
+        _local[(group, name)] = (token, value, now)
+    return value
+
+
+def dentist_names():
+    """``{dentist id: display name}``, as rendered in appointment payloads."""
+    from .models import Dentist
+
+    return local('dentists', 'names', lambda: {d.pk: str(d) for d in Dentist.objects.all()})
+
+
+class ReferenceCacheMixin:
+    """Serve ``list`` and ``retrieve`` of a ModelViewSet from the reference cache.
+
+    The key covers the full query string, so filtered or paginated lists are
+    cached separately. Only successful responses are stored.
+    """
+    cache_group = None
+
+    def _cached(self, name, view, request, *args, **kwargs):
+        # Not at module level: clinic.signals imports this module, and
+        # management commands should not have to load DRF.
+        from rest_framework.response import Response
+
+        def build():
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                raise _Uncacheable(response)
+            return response.data
+
+        try:
+            data = get_or_set(self.cache_group, name, build)
+        except _Uncacheable as e:
+            return e.response
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        name = f'list?{request.META.get("QUERY_STRING", "")}'
+        return self._cached(name, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        name = f'detail:{kwargs.get(self.lookup_url_kwarg or self.lookup_field)}'
+        return self._cached(name, super().retrieve, request, *args, **kwargs)
+
+
+class _Uncacheable(Exception):
+    def __init__(self, response):
+        self.response = response
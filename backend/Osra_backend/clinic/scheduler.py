@@ -0,0 +1,235 @@
+"""
+Periodic background jobs with their state in the ScheduledJob table.
+
+Each registered job has a row holding its interval, next due time, a lease and
+the outcome of its last run. ``run_due`` claims a due job with a conditional
+UPDATE on the lease, so several runners (``manage.py run_scheduler``) can
+share one database without running a job twice; a runner that dies leaves a
+lease that simply expires.
+
+Jobs only touch the rows they concern: the appointment queries are ranges over
+``appointment_date`` for given statuses, served by appointment_status_date_idx,
+and rows are handled in batches of CLINIC_SCHEDULER_BATCH_SIZE.
+
+* ``flag_unfinished``: appointments still ``upcoming`` (neither completed nor
+  canceled) after their date are reported to their dentist through the outbox.
+* ``mark_no_shows``: only when CLINIC_NO_SHOW_AFTER_DAYS is set, appointments
+  still ``upcoming`` that many days after their date become ``no-show``. Off
+  by default: the dentist is asked to update them instead.
+* ``queue_reminders``: open appointments in the next CLINIC_REMINDER_DAYS_AHEAD
+  days get a reminder in the outbox.
+* ``send_notifications``: delivers pending outbox rows (clinic.notifications).
+* ``purge_idempotency_keys``: deletes expired Idempotency-Key records
+  (clinic.idempotency).
+
+Status sweeps use UPDATE, so no appointment change events are published; the
+scheduler usually runs in its own process, whose event broker has no clients.
+"""
+import logging
+import time
+from collections import namedtuple
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from . import notifications, refcache
+from .models import Appointment, IdempotencyKey, NotificationOutbox, ScheduledJob
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = (Appointment.UPCOMING,)
+
+# How long a claimed job may run before another runner may take it over.
+LEASE_SECONDS = 600
+
+Job = namedtuple('Job', 'func interval')
+JOBS = {}
+
+
+def job(name, interval):
+    def register(func):
+        JOBS[name] = Job(func, interval)
+        return func
+    return register
+
+
+def _batch_size():
+    return getattr(settings, 'CLINIC_SCHEDULER_BATCH_SIZE', 500)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _contact(person):
+    if person.email:
+        return 'email', person.email
+    if person.phone:
+        return 'sms', person.phone
+    return None, None
+
+
+def _not_queued(kind):
+    return ~Exists(NotificationOutbox.objects.filter(
+        kind=kind, appointment=OuterRef('pk'), appointment_date=OuterRef('appointment_date'),
+    ))
+
+
+def _queue(kind, appointments, make):
+    """Insert outbox rows built by ``make(appointment)``; returns ``(queued, skipped)``."""
+    queued = skipped = 0
+    for batch in _batches(appointments, _batch_size()):
+        rows = [row for row in map(make, batch) if row is not None]
+        skipped += len(batch) - len(rows)
+        # A concurrent run may have queued some meanwhile; the unique
+        # constraint makes those inserts no-ops.
+        NotificationOutbox.objects.bulk_create(rows, ignore_conflicts=True)
+        queued += len(rows)
+    return queued, skipped
+
+
+@job('mark_no_shows', interval=3600)
+def mark_no_shows(now):
+    after_days = getattr(settings, 'CLINIC_NO_SHOW_AFTER_DAYS', None)
+    if after_days is None:
+        return {'marked': 0, 'enabled': False}
+    cutoff = timezone.localdate(now) - timedelta(days=after_days)
+    due = Appointment.objects.filter(status__in=OPEN_STATUSES, appointment_date__lt=cutoff)
+    marked = 0
+    while True:
+        # Updated rows leave the filter, so each batch is simply the next one.
+        with transaction.atomic():
+            ids = list(due.values_list('pk', flat=True)[:_batch_size()])
+            if not ids:
+                return {'marked': marked, 'before': cutoff.isoformat()}
+            marked += due.filter(pk__in=ids).update(status=Appointment.NO_SHOW)
+
+
+@job('flag_unfinished', interval=3600)
+def flag_unfinished(now):
+    today = timezone.localdate(now)
+    appointments = (
+        Appointment.objects.filter(status__in=OPEN_STATUSES, appointment_date__lt=today)
+        .filter(_not_queued('unfinished')).select_related('patient', 'dentist')
+        .iterator(chunk_size=_batch_size())
+    )
+
+    def make(appointment):
+        channel, recipient = _contact(appointment.dentist)
+        if recipient is None:
+            return None
+        return NotificationOutbox(
+            kind='unfinished', appointment=appointment, appointment_date=appointment.appointment_date,
+            channel=channel, recipient=recipient,
+            subject=f"Appointment on {appointment.appointment_date} not completed",
+            body=(f"The appointment with {appointment.patient} on {appointment.appointment_date} at "
+                  f"{appointment.appointment_time:%H:%M} has not been marked completed. "
+                  f"Please complete, cancel or update it."),
+        )
+
+    queued, skipped = _queue('unfinished', appointments, make)
+    return {'queued': queued, 'no_contact': skipped}
+
+
+@job('queue_reminders', interval=900)
+def queue_reminders(now):
+    start = timezone.localdate(now) + timedelta(days=1)
+    end = start + timedelta(days=getattr(settings, 'CLINIC_REMINDER_DAYS_AHEAD', 1))
+    appointments = (
+        Appointment.objects.filter(status__in=OPEN_STATUSES, appointment_date__gte=start, appointment_date__lt=end)
+        .filter(_not_queued('reminder')).select_related('patient')
+        .iterator(chunk_size=_batch_size())
+    )
+    dentists = refcache.dentist_names()
+
+    def make(appointment):
+        channel, recipient = _contact(appointment.patient)
+        if recipient is None:
+            return None
+        when = f"{appointment.appointment_date:%A %d %B %Y} at {appointment.appointment_time:%H:%M}"
+        return NotificationOutbox(
+            kind='reminder', appointment=appointment, appointment_date=appointment.appointment_date,
+            channel=channel, recipient=recipient,
+            subject="Appointment reminder",
+            body=(f"Dear {appointment.patient}, this is a reminder of your appointment with "
+                  f"{dentists.get(appointment.dentist_id, 'your dentist')} on {when}."),
+        )
+
+    queued, skipped = _queue('reminder', appointments, make)
+    return {'queued': queued, 'no_contact': skipped, 'from': start.isoformat(), 'to': end.isoformat()}
+
+
+@job('send_notifications', interval=60)
+def send_notifications(now):
+    return notifications.deliver_pending(now, _batch_size())
+
+
+@job('purge_idempotency_keys', interval=3600)
+def purge_idempotency_keys(now):
+    expired = IdempotencyKey.objects.filter(expires_at__lt=now)
+    purged = 0
+    while ids := list(expired.values_list('pk', flat=True)[:_batch_size()]):
+        purged += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+    return {'purged': purged}
+
+
+def ensure_jobs(now):
+    existing = set(ScheduledJob.objects.filter(name__in=JOBS).values_list('name', flat=True))
+    ScheduledJob.objects.bulk_create(
+        [ScheduledJob(name=name, interval_seconds=spec.interval, next_run_at=now)
+         for name, spec in JOBS.items() if name not in existing],
+        ignore_conflicts=True,
+    )
+
+
+def _claim(row, now):
+    free = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    return ScheduledJob.objects.filter(pk=row.pk).filter(free).update(
+        locked_until=now + timedelta(seconds=LEASE_SECONDS), last_started_at=now,
+    ) == 1
+
+
+def _run(row, now):
+    started = time.perf_counter()
+    try:
+        result, status, error = JOBS[row.name].func(now), 'ok', ''
+    except Exception as e:
+        logger.exception("Scheduled job failed", extra={'job': row.name})
+        result, status, error = {}, 'error', f"{type(e).__name__}: {e}"
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    ScheduledJob.objects.filter(pk=row.pk).update(
+        locked_until=None, last_finished_at=timezone.now(), last_status=status,
+        last_result={**result, 'ms': elapsed_ms}, last_error=error,
+        next_run_at=now + timedelta(seconds=row.interval_seconds),
+    )
+    logger.info("Scheduled job finished", extra={'job': row.name, 'status': status, 'ms': elapsed_ms, 'result': result})
+    return status, result
+
+
+def run_due(now=None, force=()):
+    """Run every enabled job that is due (or named in ``force``).
+
+    Returns ``{name: (status, result)}`` for the jobs this runner executed.
+    """
+    now = now or timezone.now()
+    ensure_jobs(now)
+    due = ScheduledJob.objects.filter(enabled=True, name__in=JOBS).filter(
+        Q(next_run_at__lte=now) | Q(name__in=force)
+    ).order_by('next_run_at')
+    ran = {}
+    for row in due:
+        if _claim(row, now):
+            ran[row.name] = _run(row, now)
+    return ran
+
+
+def next_due():
+    """When the next enabled job is due, or None."""
+    row = ScheduledJob.objects.filter(enabled=True, name__in=JOBS).order_by('next_run_at').first()
+    return row.next_run_at if row else None
@@ -1,10 +1,12 @@
 from rest_framework import serializers
 from .models import *
+from . import refcache, series
 
 class PatientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Patient
         fields = "__all__"
+        read_only_fields = ("allergy_terms", "medication_terms", "outstanding_balance")
 
 class DentistSerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,12 +14,56 @@ class DentistSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 class AppointmentSerializer(serializers.ModelSerializer):
-    dentist_name = serializers.CharField(source='dentist.__str__', read_only=True)
+    dentist_name = serializers.SerializerMethodField()
     patient_name = serializers.CharField(source='patient.__str__', read_only=True)
     
     class Meta:
         model = Appointment
         fields = "__all__"
+
+    def get_dentist_name(self, obj):
+        # From the cached dentist map rather than a query per appointment.
+        # Lists pass the map in the context so it is resolved once.
+        names = self.context.get('dentist_names')
+        if names is None:
+            names = refcache.dentist_names()
+        return names.get(obj.dentist_id) or str(obj.dentist)
+
+class AppointmentEventSerializer(AppointmentSerializer):
+    """Payload of appointment change events. The stream is open to any client,
+    so it carries ids only: no patient name and no notes."""
+    patient_name = None
+
+    class Meta(AppointmentSerializer.Meta):
+        fields = ('id', 'patient', 'dentist', 'dentist_name', 'appointment_date', 'appointment_time', 'status')
+
+class AppointmentSeriesSerializer(serializers.Serializer):
+    """Input of ``POST /api/appointments/series/`` (see clinic.series)."""
+    patient = serializers.PrimaryKeyRelatedField(queryset=Patient.objects.all())
+    dentist = serializers.PrimaryKeyRelatedField(queryset=Dentist.objects.all())
+    start_date = serializers.DateField()
+    appointment_time = serializers.TimeField()
+    frequency = serializers.ChoiceField(choices=series.FREQUENCIES)
+    interval = serializers.IntegerField(min_value=1, max_value=52, default=1)
+    count = serializers.IntegerField(min_value=1, required=False)
+    until = serializers.DateField(required=False)
+    status = serializers.CharField(max_length=50, default='upcoming')
+    notes = serializers.CharField(allow_blank=True, default='')
+    skip_conflicts = serializers.BooleanField(default=False)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if ('count' in data) == ('until' in data):
+            raise serializers.ValidationError("Give exactly one of count and until.")
+        if data.get('until') and data['until'] < data['start_date']:
+            raise serializers.ValidationError("until must not be before start_date.")
+        try:
+            data['dates'] = series.expand(data['start_date'], data['frequency'], data['interval'],
+                                          data.get('count'), data.get('until'))
+        except series.SeriesError as e:
+            raise serializers.ValidationError(str(e))
+        return data
+
 class AppointmentTreatmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = AppointmentTreatment
@@ -32,6 +78,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Invoice
         fields = "__all__"
+        read_only_fields = Invoice.LEDGER_FIELDS
 
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -42,8 +89,19 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
     class Meta:
         model = MedicalRecord
         fields = "__all__"
+        read_only_fields = ("structured_data", "structured_at")
 
 class AdminSerializer(serializers.ModelSerializer):
     class Meta:
         model = Admin
         fields = "__all__"
+
+class DrugSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Drug
+        fields = "__all__"
+
+class TreatmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Treatment
+        fields = "__all__"
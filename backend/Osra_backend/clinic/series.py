@@ -0,0 +1,120 @@
+"""
+Recurring appointment series.
+
+A rule (start date, time, daily/weekly/monthly frequency, interval, count or
+end date) is expanded into occurrence dates in memory. All occurrences are
+checked against the dentist's bookings on those dates with one query on
+appointment_dentist_date_idx, and the accepted ones are inserted with a
+single bulk_create inside one transaction. Two appointments conflict when
+they start less than CLINIC_APPOINTMENT_SLOT_MINUTES apart; canceled ones
+never do.
+
+bulk_create bypasses post_save, so the appointment.created events are
+published here once the transaction commits.
+"""
+import calendar
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from . import events, refcache
+from .models import Appointment, Dentist
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+
+Occurrence = namedtuple('Occurrence', 'date conflicts')
+
+
+class SeriesError(ValueError):
+    pass
+
+
+def _add_months(day, months, anchor):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    # The 31st of a month falls on the last day of shorter months.
+    return date(year, month, min(anchor, calendar.monthrange(year, month)[1]))
+
+
+def expand(start, frequency, interval=1, count=None, until=None):
+    """Occurrence dates of a rule; stops after ``count`` dates or past ``until``."""
+    if frequency not in FREQUENCIES:
+        raise SeriesError(f"frequency must be one of {', '.join(FREQUENCIES)}")
+    if count is None and until is None:
+        raise SeriesError("give either count or until")
+    limit = getattr(settings, 'CLINIC_SERIES_MAX_OCCURRENCES', 104)
+    dates = []
+    n = 0
+    while True:
+        if frequency == 'monthly':
+            day = _add_months(start, n * interval, start.day)
+        else:
+            day = start + timedelta(days=n * interval * (7 if frequency == 'weekly' else 1))
+        if (until is not None and day > until) or (count is not None and n >= count):
+            return dates
+        if n >= limit:
+            raise SeriesError(f"a series may have at most {limit} occurrences")
+        dates.append(day)
+        n += 1
+
+
+def _minutes(at):
+    return at.hour * 60 + at.minute
+
+
+def find_conflicts(dentist_id, dates, at):
+    """``[Occurrence(date, [conflicting appointment ids])]`` with one query."""
+    slot = getattr(settings, 'CLINIC_APPOINTMENT_SLOT_MINUTES', 30)
+    booked = defaultdict(list)
+    existing = (
+        Appointment.objects.filter(dentist_id=dentist_id, appointment_date__in=dates)
+        .exclude(status__in=Appointment.CANCELED_STATUSES)
+        .values_list('pk', 'appointment_date', 'appointment_time')
+    )
+    for pk, day, booked_at in existing:
+        booked[day].append((pk, _minutes(booked_at)))
+    start = _minutes(at)
+    return [
+        Occurrence(day, [pk for pk, minute in booked[day] if abs(minute - start) < slot])
+        for day in dates
+    ]
+
+
+def lock_dentist(dentist_id):
+    """Serialize bookings for one dentist until the current transaction ends.
+
+    Taken by every path that adds an appointment, so a series' conflict check
+    cannot miss one booked concurrently (a no-op on SQLite, whose writers are
+    serialized anyway).
+    """
+    Dentist.objects.select_for_update().filter(pk=dentist_id).first()
+
+
+def create(patient, dentist, dates, at, status='upcoming', notes='', skip_conflicts=False, dry_run=False):
+    """Check and insert a series.
+
+    Returns ``(occurrences, created)``. Unless ``skip_conflicts``, any conflict
+    means nothing is inserted; ``dry_run`` never inserts.
+    """
+    from .serializers import AppointmentEventSerializer
+
+    with transaction.atomic():
+        lock_dentist(dentist.pk)
+        occurrences = find_conflicts(dentist.pk, dates, at)
+        accepted = [o.date for o in occurrences if not o.conflicts]
+        if dry_run or (len(accepted) < len(occurrences) and not skip_conflicts):
+            return occurrences, []
+        created = Appointment.objects.bulk_create([
+            Appointment(patient=patient, dentist=dentist, appointment_date=day, appointment_time=at,
+                        status=status, notes=notes)
+            for day in accepted
+        ])
+        payloads = AppointmentEventSerializer(
+            created, many=True, context={'dentist_names': refcache.dentist_names()},
+        ).data
+        transaction.on_commit(lambda: [
+            events.broker.publish('appointment.created', payload, {dentist.pk}) for payload in payloads
+        ])
+    return occurrences, created
@@ -0,0 +1,95 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import contraindications, drug_index, events, ledger, refcache
+from .models import (
+    Appointment, Dentist, Drug, DrugClass, DrugClassMember, Invoice, Payment, Treatment, TreatmentDrug,
+)
+
+
+_muted = contextvars.ContextVar('clinic_appointment_events_muted', default=False)
+
+
+@contextmanager
+def appointment_events_muted():
+    """Suppress appointment change events, e.g. while archiving history."""
+    token = _muted.set(True)
+    try:
+        yield
+    finally:
+        _muted.reset(token)
+
+
+def _dentist_ids(instance):
+    # A reassigned appointment must also reach the previous dentist's stream
+    # so it disappears from their dashboard.
+    return {instance.dentist_id, getattr(instance, '_loaded_dentist_id', None)}
+
+
+@receiver(post_save, sender=Appointment)
+def publish_appointment_saved(sender, instance, created, **kwargs):
+    if _muted.get():
+        return
+    from .serializers import AppointmentEventSerializer
+
+    payload = AppointmentEventSerializer(instance).data
+    event_type = 'appointment.created' if created else 'appointment.updated'
+    dentist_ids = _dentist_ids(instance)
+    instance._loaded_dentist_id = instance.dentist_id
+    transaction.on_commit(lambda: events.broker.publish(event_type, payload, dentist_ids))
+
+
+@receiver(post_delete, sender=Appointment)
+def publish_appointment_deleted(sender, instance, **kwargs):
+    if _muted.get():
+        return
+    payload = {'id': instance.pk, 'dentist': instance.dentist_id}
+    dentist_ids = _dentist_ids(instance)
+    transaction.on_commit(lambda: events.broker.publish('appointment.deleted', payload, dentist_ids))
+
+
+@receiver(post_save, sender=Drug)
+@receiver(post_delete, sender=Drug)
+def invalidate_drug_index(sender, **kwargs):
+    drug_index.invalidate()
+
+
+@receiver(post_save, sender=Dentist)
+@receiver(post_delete, sender=Dentist)
+@receiver(post_save, sender=Treatment)
+@receiver(post_delete, sender=Treatment)
+@receiver(post_save, sender=Drug)
+@receiver(post_delete, sender=Drug)
+@receiver(post_save, sender=TreatmentDrug)
+@receiver(post_delete, sender=TreatmentDrug)
+def invalidate_reference_cache(sender, **kwargs):
+    group = refcache.GROUPS[sender.__name__]
+    refcache.invalidate(group)
+    # A reader may repopulate the cache from the pre-commit state before the
+    # change is visible; bump again once it is.
+    transaction.on_commit(lambda: refcache.invalidate(group))
+
+
+@receiver(post_save, sender=DrugClass)
+@receiver(post_delete, sender=DrugClass)
+@receiver(post_save, sender=DrugClassMember)
+@receiver(post_delete, sender=DrugClassMember)
+@receiver(m2m_changed, sender=DrugClass.contraindicated_with.through)
+def invalidate_class_map(sender, **kwargs):
+    contraindications.invalidate()
+
+
+@receiver(post_delete, sender=Payment)
+def credit_deleted_payment(sender, instance, **kwargs):
+    # Runs inside the deletion's transaction.
+    invoice_id, amount = getattr(instance, '_loaded', (instance.invoice_id, instance.amount_paid))
+    ledger.apply(invoice_id, paid_delta=-amount)
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_deleted_invoice(sender, instance, **kwargs):
+    ledger.invoice_deleted(instance)
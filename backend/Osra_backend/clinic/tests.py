@@ -2,6 +2,7 @@ from django.test import TestCase, Client
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 import json
+import os
 
 
 class OCRACRNLPTests(TestCase):
@@ -36,3 +37,1416 @@ class OCRACRNLPTests(TestCase):
 		data = resp.json()
 		self.assertEqual(data.get('word_count'), 4)
 		self.assertIn('summary', data)
+
+
+class AppointmentEventTests(TestCase):
+	def setUp(self):
+		from .models import Patient, Dentist
+		self.patient = Patient.objects.create(first_name='Sara', last_name='Ali', gender='F', address='x', phone='1')
+		self.dentist = Dentist.objects.create(first_name='Omar', last_name='Nabil', specialty='General', phone='2')
+		self.other = Dentist.objects.create(first_name='Mona', last_name='Adel', specialty='General', phone='3')
+
+	def _create_appointment(self):
+		from .models import Appointment
+		with self.captureOnCommitCallbacks(execute=True):
+			return Appointment.objects.create(
+				patient=self.patient, dentist=self.dentist,
+				appointment_date='2026-01-05', appointment_time='10:00', status='upcoming',
+			)
+
+	def test_broker_filters_by_dentist_and_resets_slow_clients(self):
+		from .events import EventBroker
+		broker = EventBroker(max_events=3)
+		broker.publish('appointment.created', {'id': 1}, {1})
+		broker.publish('appointment.created', {'id': 2}, {2})
+		cursor, batch = broker.events_since(0, dentist_id=2)
+		self.assertEqual(cursor, 2)
+		self.assertEqual([e[0] for e in batch], [2])
+		for i in range(5):
+			broker.publish('appointment.updated', {'id': i}, {1})
+		_, batch = broker.events_since(cursor, dentist_id=1)
+		self.assertEqual(batch[0][1], 'reset')
+
+	def test_model_signals_publish_events(self):
+		from . import events
+		start = events.broker.last_id
+		appt = self._create_appointment()
+		with self.captureOnCommitCallbacks(execute=True):
+			appt.dentist = self.other
+			appt.save()
+		with self.captureOnCommitCallbacks(execute=True):
+			appt.delete()
+		_, batch = events.broker.events_since(start, dentist_id=self.dentist.id)
+		self.assertEqual([e[1] for e in batch], ['appointment.created', 'appointment.updated'])
+		_, batch = events.broker.events_since(start, dentist_id=self.other.id)
+		self.assertEqual([e[1] for e in batch], ['appointment.updated', 'appointment.deleted'])
+
+	def test_stream_replays_from_last_event_id(self):
+		from . import events
+		start = events.broker.last_id
+		self._create_appointment()
+		resp = self.client.get(
+			reverse('appointment-events'), {'dentist': self.dentist.id}, HTTP_LAST_EVENT_ID=str(start),
+		)
+		self.assertEqual(resp['Content-Type'], 'text/event-stream')
+		stream = iter(resp.streaming_content)
+		next(stream)
+		chunk = next(stream).decode()
+		self.assertIn('event: appointment.created', chunk)
+		self.assertIn(f'"patient": {self.patient.id}', chunk)
+		self.assertNotIn('Sara', chunk)
+
+
+	def test_foreign_events_do_not_trigger_keep_alives(self):
+		import time
+		from . import events
+		from .views import _sync_event_stream
+		start = events.broker.last_id
+		for i in range(5):
+			events.broker.publish('appointment.updated', {'id': i}, {self.other.id})
+		stream = _sync_event_stream(self.dentist.id, start, heartbeat=0.2, max_age=0.3)
+		next(stream)
+		started = time.monotonic()
+		self.assertEqual(next(stream), ': keep-alive\n\n')
+		self.assertGreaterEqual(time.monotonic() - started, 0.15)
+		self.assertEqual(list(stream), [])
+
+class MetricsTests(TestCase):
+	def test_histogram_merges_thread_shards(self):
+		import threading
+		from .metrics import Histogram
+		hist = Histogram('t_seconds', 'test', ('route',), buckets=(0.1, 1.0))
+		threads = [threading.Thread(target=lambda: [hist.observe(0.5, 'a') for _ in range(100)]) for _ in range(4)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		hist.observe(5, 'a')
+		text = '\n'.join(hist.render())
+		self.assertIn('t_seconds_bucket{route="a",le="1.0"} 400', text)
+		self.assertIn('t_seconds_bucket{route="a",le="+Inf"} 401', text)
+		self.assertIn('t_seconds_count{route="a"} 401', text)
+
+	def test_finished_threads_shards_are_folded(self):
+		import threading
+		from .metrics import Counter
+		counter = Counter('t_total', 'test', ('route',))
+		for _ in range(50):
+			t = threading.Thread(target=lambda: counter.inc('a', amount=2))
+			t.start()
+			t.join()
+		counter.inc('a')
+		self.assertLessEqual(len(counter._shards), 2)
+		self.assertEqual(counter.value('a'), 101)
+		self.assertEqual(len(counter._shards), 1)
+
+	def test_metrics_endpoint_reports_requests_and_queries(self):
+		from .metrics import REQUEST_QUERIES
+		self.client.get('/api/patients/')
+		self.assertGreaterEqual(REQUEST_QUERIES.count('api/patients/$', 'GET'), 1)
+		resp = self.client.get(reverse('metrics'))
+		self.assertEqual(resp.status_code, 200)
+		body = resp.content.decode()
+		self.assertIn('# TYPE clinic_http_request_duration_seconds histogram', body)
+		self.assertIn('clinic_http_request_queries_sum{route="api/patients/$",method="GET"}', body)
+
+
+class GenerateClinicDataTests(TestCase):
+	def test_generates_linked_rows(self):
+		from io import StringIO
+		from django.core.management import call_command
+		from .models import Appointment, Invoice, MedicalRecord, Patient, Payment
+		call_command(
+			'generate_clinic_data', patients=30, dentists=3, appointments=200, records=40,
+			batch_size=50, stdout=StringIO(),
+		)
+		self.assertEqual(Patient.objects.count(), 30)
+		self.assertEqual(Appointment.objects.count(), 200)
+		self.assertGreater(MedicalRecord.objects.count(), 0)
+		self.assertLessEqual(MedicalRecord.objects.count(), 40)
+		self.assertEqual(Invoice.objects.count(), Payment.objects.count())
+		record = MedicalRecord.objects.select_related('appointment').first()
+		self.assertEqual(record.patient_id, record.appointment.patient_id)
+
+
+class ProfilingTests(TestCase):
+	def setUp(self):
+		import tempfile
+		from django.test import override_settings
+		self.tmp = tempfile.TemporaryDirectory()
+		self.override = override_settings(CLINIC_PROFILE_DIR=self.tmp.name, CLINIC_ADMIN_TOKEN='s3cret')
+		self.override.enable()
+
+	def tearDown(self):
+		self.override.disable()
+		self.tmp.cleanup()
+
+	def test_profile_requires_admin(self):
+		resp = self.client.get('/api/patients/', HTTP_X_CLINIC_PROFILE='1')
+		self.assertEqual(resp.status_code, 200)
+		self.assertNotIn('X-Profile-Id', resp)
+		self.assertEqual(self.client.get(reverse('profile-list')).status_code, 403)
+
+	def test_admin_profile_produces_downloadable_artifacts(self):
+		resp = self.client.get('/api/patients/?__profile=1', HTTP_X_ADMIN_TOKEN='s3cret')
+		profile_id = resp['X-Profile-Id']
+		listing = self.client.get(reverse('profile-list'), HTTP_X_ADMIN_TOKEN='s3cret').json()
+		self.assertEqual(listing[0]['id'], profile_id)
+		self.assertGreaterEqual(listing[0]['queries'], 1)
+		sql = self.client.get(reverse('profile-download', args=[profile_id, 'sql']), HTTP_X_ADMIN_TOKEN='s3cret')
+		self.assertIn('clinic_patient', b''.join(sql.streaming_content).decode())
+		pstats = self.client.get(reverse('profile-download', args=[profile_id, 'pstats']), HTTP_X_ADMIN_TOKEN='s3cret')
+		self.assertEqual(pstats.status_code, 200)
+		missing = self.client.get(reverse('profile-download', args=['..etc', 'sql']), HTTP_X_ADMIN_TOKEN='s3cret')
+		self.assertEqual(missing.status_code, 404)
+
+	def test_sampled_profile_id_is_hidden_from_non_admins(self):
+		from django.test import override_settings
+		with override_settings(CLINIC_PROFILE_SAMPLE_RATE=1.0, CLINIC_PROFILE_SLOW_MS=0):
+			resp = self.client.get('/api/patients/')
+			self.assertNotIn('X-Profile-Id', resp)
+			admin = self.client.get('/api/patients/', HTTP_X_ADMIN_TOKEN='s3cret')
+		listing = self.client.get(reverse('profile-list'), HTTP_X_ADMIN_TOKEN='s3cret').json()
+		self.assertEqual(len(listing), 2)
+		self.assertIn(admin['X-Profile-Id'], [meta['id'] for meta in listing])
+
+
+class StructuredLoggingTests(TestCase):
+	def test_async_handler_writes_json_lines_off_thread(self):
+		import io
+		import logging
+		from .log import AsyncStreamHandler
+		stream = io.StringIO()
+		handler = AsyncStreamHandler(stream=stream)
+		logger = logging.getLogger('clinic.tests.async')
+		logger.setLevel(logging.INFO)
+		self.addCleanup(logger.setLevel, logging.NOTSET)
+		logger.addHandler(handler)
+		logger.propagate = False
+		try:
+			logger.warning('OCR extracted %d chars', 12, extra={'file_name': 'rx.png'})
+			try:
+				raise ValueError('boom')
+			except ValueError:
+				logger.exception('failed')
+		finally:
+			handler.stop()
+			logger.removeHandler(handler)
+		first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+		self.assertEqual(first['msg'], 'OCR extracted 12 chars')
+		self.assertEqual(first['file_name'], 'rx.png')
+		self.assertEqual(first['level'], 'WARNING')
+		self.assertIn('ValueError: boom', second['exc'])
+
+	def test_full_queue_drops_instead_of_blocking(self):
+		import logging
+		from .log import AsyncStreamHandler
+		from .log import DROPPED
+		handler = AsyncStreamHandler(queue_size=1)
+		handler.stop()
+		before = DROPPED.value()
+		record = logging.makeLogRecord({'msg': 'x'})
+		handler.emit(record)
+		handler.emit(record)
+		self.assertEqual(handler.dropped, 1)
+		self.assertEqual(DROPPED.value(), before + 1)
+
+	def test_forked_child_gets_its_own_listener(self):
+		import logging
+		import os
+		import tempfile
+		from .log import AsyncStreamHandler
+		with tempfile.TemporaryFile('w+') as stream:
+			handler = AsyncStreamHandler(stream=stream)
+			logger = logging.getLogger('clinic.tests.fork')
+			logger.setLevel(logging.INFO)
+			self.addCleanup(logger.setLevel, logging.NOTSET)
+			logger.addHandler(handler)
+			logger.propagate = False
+			try:
+				pid = os.fork()
+				if pid == 0:
+					logger.warning('from the child')
+					handler.stop()
+					os._exit(0)
+				os.waitpid(pid, 0)
+			finally:
+				handler.stop()
+				logger.removeHandler(handler)
+			stream.seek(0)
+			self.assertEqual(json.loads(stream.read())['msg'], 'from the child')
+
+
+class MultiPageOCRTests(TestCase):
+	def _uploads(self):
+		return [
+			SimpleUploadedFile('intake_1.png', b'not an image', content_type='image/png'),
+			SimpleUploadedFile('intake_2.png', b'still not an image', content_type='image/png'),
+		]
+
+	def test_multiple_files_return_page_results(self):
+		resp = self.client.post(reverse('process-ocr'), {'file': self._uploads()})
+		self.assertEqual(resp.status_code, 200)
+		data = resp.json()
+		self.assertEqual([p['file'] for p in data['pages']], ['intake_1.png', 'intake_2.png'])
+		self.assertTrue(all(p['error'] for p in data['pages']))
+		self.assertTrue(data['text'].startswith('Simulated OCR extracted text from intake_1.png'))
+
+	def test_stream_emits_each_page_then_summary(self):
+		resp = self.client.post(reverse('process-ocr') + '?stream=1', {'files': self._uploads()})
+		self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+		lines = [json.loads(l) for l in b''.join(resp.streaming_content).decode().splitlines()]
+		self.assertEqual(len(lines), 3)
+		self.assertEqual({l['file'] for l in lines[:2]}, {'intake_1.png', 'intake_2.png'})
+		self.assertTrue(lines[-1]['done'])
+
+	def test_broken_pool_reports_remaining_pages_as_failed(self):
+		from unittest import mock
+		from concurrent.futures.process import BrokenProcessPool
+		from . import ocr
+
+		def first_then_break(jobs):
+			yield ocr.page_result(jobs[0], text='Page one')
+			raise BrokenProcessPool('worker died')
+
+		with mock.patch.object(ocr, 'iter_page_results', first_then_break):
+			resp = self.client.post(reverse('process-ocr'), {'file': self._uploads()})
+		pages = resp.json()['pages']
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual([p['file'] for p in pages], ['intake_1.png', 'intake_2.png'])
+		self.assertIsNone(pages[0]['error'])
+		self.assertIn('BrokenProcessPool', pages[1]['error'])
+
+	def test_pdf_pages_become_separate_jobs(self):
+		from unittest import mock
+		from . import ocr
+		pdf = SimpleUploadedFile('referral.pdf', b'%PDF-1.4 fake', content_type='application/pdf')
+		with mock.patch.object(ocr, 'pdf_page_count', return_value=3):
+			jobs, errors, cleanup = ocr.build_jobs([pdf])
+		try:
+			self.assertEqual([(j.page, j.kind) for j in jobs], [(1, 'pdf'), (2, 'pdf'), (3, 'pdf')])
+			self.assertEqual(len({j.source for j in jobs}), 1)
+			self.assertEqual(errors, [])
+		finally:
+			cleanup()
+
+
+class OCRBackendTests(TestCase):
+	def test_pages_use_installed_backend(self):
+		from . import ocr, ocr_backends
+
+		class FakeBackend(ocr_backends.OCRBackend):
+			name = 'fake'
+			def image_to_text(self, image):
+				return f'{image.size[0]}x{image.size[1]}'
+
+		import io
+		from PIL import Image
+		buf = io.BytesIO()
+		Image.new('RGB', (40, 20), 'white').save(buf, format='PNG')
+		previous = ocr_backends.get_backend()
+		ocr_backends.set_backend(FakeBackend())
+		try:
+			resp = self.client.post(reverse('process-ocr'), {'file': SimpleUploadedFile('scan.png', buf.getvalue())})
+		finally:
+			ocr_backends.set_backend(previous)
+		self.assertEqual(resp.json()['text'], '40x20')
+
+	def test_tesserocr_pool_reuses_api_objects(self):
+		import sys
+		import types
+		from unittest import mock
+		from .ocr_backends import TesserocrBackend
+		created = []
+
+		class FakeAPI:
+			def __init__(self, **kwargs):
+				created.append(self)
+			def SetImage(self, image):
+				self.image = image
+			def GetUTF8Text(self):
+				return 'text'
+			def Clear(self):
+				pass
+			def End(self):
+				pass
+
+		with mock.patch.dict(sys.modules, {'tesserocr': types.SimpleNamespace(PyTessBaseAPI=FakeAPI)}):
+			backend = TesserocrBackend(size=2)
+			for _ in range(5):
+				self.assertEqual(backend.image_to_text(object()), 'text')
+			backend.warm()
+		self.assertEqual(len(created), 2)
+
+
+class DocumentPipelineTests(TestCase):
+	NOTE = 'Diagnosis: Pulpitis\nHistory: Pain for 3 days\nPRESCRIPTION: Amoxicillin 500mg'
+
+	def test_document_runs_ocr_once_and_all_stages(self):
+		from unittest import mock
+		from . import ocr
+		f = SimpleUploadedFile('rx_scan.png', b'not an image')
+		with mock.patch.object(ocr, 'iter_page_results', wraps=ocr.iter_page_results) as run_ocr:
+			resp = self.client.post(reverse('process-document'), {'file': f})
+		self.assertEqual(run_ocr.call_count, 1)
+		data = resp.json()
+		self.assertEqual(data['entities']['diagnosis'], 'Chronic Sinusitis')
+		self.assertEqual(data['medications'][0]['medication'], 'Amoxicillin')
+		self.assertEqual(set(data['timings_ms']), {'ocr', 'medications', 'entities', 'total'})
+
+	def test_document_text_with_selected_stages(self):
+		resp = self.client.post(
+			reverse('process-document') + '?stages=entities',
+			json.dumps({'text': self.NOTE}), content_type='application/json',
+		)
+		data = resp.json()
+		self.assertIsNone(data['medications'])
+		self.assertEqual(data['entities']['history'], 'Pain for 3 days')
+		bad = self.client.post(
+			reverse('process-document') + '?stages=ocr',
+			json.dumps({'text': self.NOTE}), content_type='application/json',
+		)
+		self.assertEqual(bad.status_code, 400)
+
+	def test_acr_text_wrapper_keeps_response_shape(self):
+		resp = self.client.post(reverse('process-acr'), json.dumps({'text': self.NOTE}), content_type='application/json')
+		data = resp.json()
+		self.assertEqual(data['raw_text'], self.NOTE)
+		self.assertEqual(data['found'], [{'medication': 'Amoxicillin', 'dosage': '500mg'}])
+
+
+class ClinicalNoteParserTests(TestCase):
+	NOTE = (
+		'Chief Complaint: pain, swelling\n'
+		'Diagnosis: Pulpitis of 36\n'
+		'Diagnosis: Gingivitis\n'
+		'History: Diabetic for 5 years.\nControlled with metformin.\n'
+		'Allergies: Penicillin, latex\n'
+		'Treatment Plan:\n- Root canal on 36\n- Scaling next week\n'
+	)
+
+	def test_parses_all_sections_in_one_pass(self):
+		from .extraction import parse_sections
+		sections = parse_sections(self.NOTE)
+		self.assertEqual(sections['diagnosis'], ['Pulpitis of 36', 'Gingivitis'])
+		self.assertEqual(sections['symptoms'], ['pain', 'swelling'])
+		self.assertEqual(sections['history'], ['Diabetic for 5 years', 'Controlled with metformin'])
+		self.assertEqual(sections['allergies'], ['Penicillin', 'latex'])
+		self.assertEqual(sections['plan'], ['Root canal on 36', 'Scaling next week'])
+
+	def test_numbered_items_lose_their_markers(self):
+		from .extraction import parse_sections
+		sections = parse_sections('Plan: Fill tooth\n1. Scale\n2) Polish\nMedications: Amoxicillin 2.5 mg\n- Ibuprofen')
+		self.assertEqual(sections['plan'], ['Fill tooth', 'Scale', 'Polish'])
+		self.assertEqual(sections['medications'], ['Amoxicillin 2.5 mg', 'Ibuprofen'])
+
+	def test_batch_endpoint_reports_throughput(self):
+		from django.test import override_settings
+		notes = [{'id': f'n{i}', 'text': self.NOTE} for i in range(40)]
+		with override_settings(CLINIC_NLP_PARALLEL_THRESHOLD=10, CLINIC_NLP_WORKERS=2):
+			resp = self.client.post(reverse('process-nlp-batch'), json.dumps({'notes': notes}), content_type='application/json')
+		data = resp.json()
+		self.assertEqual(data['count'], 40)
+		self.assertEqual(data['workers'], 2)
+		self.assertEqual(data['results'][39]['id'], 'n39')
+		self.assertEqual(data['results'][39]['diagnosis'], 'Pulpitis of 36')
+		self.assertGreater(data['notes_per_second'], 0)
+
+	def test_broken_pool_is_reset_and_batch_runs_inline(self):
+		from unittest import mock
+		from concurrent.futures.process import BrokenProcessPool
+		from django.test import override_settings
+		from . import extraction
+		pool = mock.Mock()
+		pool.map.side_effect = BrokenProcessPool('worker died')
+		with override_settings(CLINIC_NLP_WORKERS=2), mock.patch.object(extraction, '_pool', pool):
+			results, workers = extraction.extract_clinical_entities_batch([self.NOTE] * 4, parallel_threshold=2)
+			self.assertIsNone(extraction._pool)
+		self.assertEqual(workers, 1)
+		self.assertEqual(results[3]['diagnosis'], 'Pulpitis of 36')
+
+	def test_batch_rejects_empty_payload(self):
+		resp = self.client.post(reverse('process-nlp-batch'), json.dumps({'notes': []}), content_type='application/json')
+		self.assertEqual(resp.status_code, 400)
+
+
+class DrugIndexTests(TestCase):
+	def setUp(self):
+		from .models import Drug
+		for name in ['Amoxicillin', 'Amoxicillin Clavulanate', 'Ibuprofen', 'Metronidazole', 'Paracetamol']:
+			Drug.objects.create(name=name, description='', dosage='', price=1)
+
+	def tearDown(self):
+		# Rows vanish on rollback without signals; don't leak the index.
+		from .drug_index import invalidate
+		invalidate()
+
+	def test_lookup_tolerates_ocr_noise(self):
+		from .drug_index import get_index
+		index = get_index()
+		self.assertEqual(index.lookup('Am0xicillin').name, 'Amoxicillin')
+		match = index.lookup('Amoxicilin')
+		self.assertEqual((match.name, match.distance), ('Amoxicillin', 1))
+		self.assertLess(match.confidence, 1)
+		self.assertIsNone(index.lookup('PRESCRIPTION'))
+		self.assertEqual(index.lookup('Metronidazol').name, 'Metronidazole')
+
+	def test_first_word_alias_never_shadows_a_full_name(self):
+		from .drug_index import DrugIndex
+		index = DrugIndex([(1, 'Amoxicillin Clavulanate'), (2, 'Amoxicillin'), (3, 'Metronidazole Benzoate')])
+		self.assertEqual(index.lookup('Amoxicillin').drug_id, 2)
+		self.assertEqual(index.lookup('Metronidazole').drug_id, 3)
+
+	def test_repeated_trigrams_count_towards_the_bound(self):
+		from .drug_index import DrugIndex
+		# 'zol' occurs twice in the name; a set of trigrams undercounts it.
+		match = DrugIndex([(1, 'Zolratetminzol')]).lookup('Zolraetmizol', max_distance=2)
+		self.assertEqual((match.drug_id, match.distance), (1, 2))
+
+	def test_index_rebuilds_after_drug_changes(self):
+		from .drug_index import get_index
+		from .models import Drug
+		self.assertIsNone(get_index().lookup('Clindamycin'))
+		Drug.objects.create(name='Clindamycin', description='', dosage='', price=1)
+		self.assertEqual(get_index().lookup('Clindamycn').name, 'Clindamycin')
+
+	def test_acr_returns_canonical_drugs_only(self):
+		text = 'PRESCRIPTION: Amoxicilin 500mg one tablet daily\nIbuprofn as needed'
+		resp = self.client.post(reverse('process-acr'), json.dumps({'text': text}), content_type='application/json')
+		found = resp.json()['found']
+		self.assertEqual([m['medication'] for m in found], ['Amoxicillin', 'Ibuprofen'])
+		self.assertEqual(found[0]['dosage'], '500mg')
+		self.assertEqual(found[0]['raw_name'], 'Amoxicilin')
+
+
+class BackfillStructuredRecordsTests(TestCase):
+	def setUp(self):
+		from .models import MedicalRecord, Patient
+		patient = Patient.objects.create(first_name='A', last_name='B', gender='F', address='x', phone='1')
+		self.records = [
+			MedicalRecord.objects.create(
+				patient=patient, diagnosis=f'Pulpitis; Gingivitis {i}', prescribed_drugs='Amoxicillin 500mg',
+				treatment_notes='Plan: Root canal\nNote: review',
+			) for i in range(5)
+		]
+
+	def test_backfill_is_resumable(self):
+		import tempfile
+		from io import StringIO
+		from pathlib import Path
+		from django.core.management import call_command
+		from .models import MedicalRecord
+		with tempfile.TemporaryDirectory() as tmp:
+			checkpoint = Path(tmp) / 'cp.json'
+			call_command('backfill_structured_records', chunk_size=2, workers=1, limit=2,
+				checkpoint=str(checkpoint), stdout=StringIO())
+			self.assertEqual(json.loads(checkpoint.read_text())['last_pk'], self.records[1].pk)
+			self.assertEqual(MedicalRecord.objects.filter(structured_at__isnull=False).count(), 2)
+			call_command('backfill_structured_records', chunk_size=2, workers=1,
+				checkpoint=str(checkpoint), stdout=StringIO())
+			self.assertFalse(checkpoint.exists())
+		self.assertEqual(MedicalRecord.objects.filter(structured_at__isnull=True).count(), 0)
+		data = MedicalRecord.objects.get(pk=self.records[4].pk).structured_data
+		self.assertEqual(data['diagnoses'], ['Pulpitis', 'Gingivitis 4'])
+		self.assertEqual(data['medications'][0]['medication'], 'Amoxicillin')
+		self.assertEqual(data['sections']['plan'], ['Root canal'])
+
+
+class PrescriptionCheckTests(TestCase):
+	def setUp(self):
+		from .models import Patient
+		self.patient = Patient.objects.create(
+			first_name='A', last_name='B', gender='F', address='x', phone='1',
+			allergies='Penicillin allergy; latex', medications='Warfarin 5mg daily',
+		)
+
+	def tearDown(self):
+		from .contraindications import invalidate
+		invalidate()
+
+	def _check(self, drugs):
+		url = reverse('patient-check-prescription', args=[self.patient.pk])
+		return self.client.post(url, json.dumps({'drugs': drugs}), content_type='application/json')
+
+	def test_terms_are_precomputed_on_save(self):
+		from .contraindications import parse_terms
+		self.assertEqual(self.patient.allergy_terms, ['latex', 'penicillin'])
+		self.assertEqual(self.patient.medication_terms, ['warfarin'])
+		self.assertEqual(parse_terms('None'), [])
+		self.assertEqual(parse_terms('NKDA'), [])
+
+	def test_check_flags_allergy_class_and_interaction(self):
+		resp = self._check(['Amoxicillin 500mg', 'Ibuprofen 400mg', 'Paracetamol'])
+		self.assertEqual(resp.status_code, 200)
+		data = resp.json()
+		self.assertFalse(data['safe'])
+		amox, ibu, para = data['results']
+		self.assertEqual([a['type'] for a in amox['alerts']], ['allergy_class'])
+		self.assertEqual(amox['classes'], ['Penicillins'])
+		self.assertEqual([(a['type'], a['matched']) for a in ibu['alerts']], [('interaction', 'Anticoagulants')])
+		self.assertTrue(para['safe'])
+
+	def test_check_uses_class_table_changes(self):
+		from .models import DrugClass
+		self.assertTrue(self._check(['Latexin']).json()['safe'])
+		DrugClass.objects.get(name='Penicillins').members.create(name='Latexin')
+		self.assertEqual(self._check(['Latexin']).json()['results'][0]['alerts'][0]['type'], 'allergy_class')
+
+	def test_check_validates_input(self):
+		self.assertEqual(self._check([]).status_code, 400)
+		url = reverse('patient-check-prescription', args=[999999])
+		resp = self.client.post(url, json.dumps({'drugs': ['Ibuprofen']}), content_type='application/json')
+		self.assertEqual(resp.status_code, 404)
+
+
+class PatientTimelineTests(TestCase):
+	def setUp(self):
+		from datetime import date, time
+		from .models import Appointment, AppointmentTreatment, Dentist, Invoice, MedicalRecord, Patient, Payment, Treatment
+		self.patient = Patient.objects.create(first_name='A', last_name='B', gender='F', address='x', phone='1')
+		dentist = Dentist.objects.create(first_name='D', last_name='E', specialty='General', phone='2')
+		treatment = Treatment.objects.create(name='Filling', description='', cost=100)
+		for day in range(1, 6):
+			appointment = Appointment.objects.create(
+				patient=self.patient, dentist=dentist, appointment_date=date(2024, 1, day),
+				appointment_time=time(10), status='completed',
+			)
+			AppointmentTreatment.objects.create(appointment=appointment, treatment=treatment, quantity=2)
+			invoice = Invoice.objects.create(appointment=appointment, total_amount=200, payment_status='paid')
+			Payment.objects.create(invoice=invoice, amount_paid=200)
+			MedicalRecord.objects.create(patient=self.patient, appointment=appointment, diagnosis='d',
+				prescribed_drugs='', treatment_notes='')
+
+	def _get(self, **params):
+		return self.client.get(reverse('patient-timeline', args=[self.patient.pk]), params)
+
+	def test_timeline_pages_through_every_entry_in_order(self):
+		seen, cursor = [], None
+		while True:
+			params = {'limit': 3}
+			if cursor:
+				params['cursor'] = cursor
+			data = self._get(**params).json()
+			seen.extend(data['results'])
+			cursor = data['next_cursor']
+			if not cursor:
+				break
+		self.assertEqual(len(seen), 20)
+		self.assertEqual(len({(e['type'], e['id']) for e in seen}), 20)
+		timestamps = [e['timestamp'] for e in seen]
+		self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+		appointment = next(e for e in seen if e['type'] == 'appointment')
+		self.assertEqual(appointment['data']['treatments'][0]['subtotal'], '200.00')
+
+	def test_timeline_query_count_is_fixed(self):
+		with self.assertNumQueries(6):
+			self._get(limit=2)
+		with self.assertNumQueries(6):
+			self._get(limit=200)
+
+	def test_timeline_includes_archive_on_request(self):
+		from datetime import date, time
+		from .archive import archive_chunk
+		from .models import Appointment, AppointmentTreatment, MedicalRecord, NotificationOutbox, Treatment
+		old = Appointment.objects.create(patient=self.patient, dentist_id=Appointment.objects.first().dentist_id,
+			appointment_date=date(2020, 1, 1), appointment_time=time(9), status='completed')
+		AppointmentTreatment.objects.create(appointment=old, treatment=Treatment.objects.first(), quantity=1)
+		MedicalRecord.objects.create(patient=self.patient, appointment=old, diagnosis='old',
+			prescribed_drugs='', treatment_notes='')
+		sent = NotificationOutbox.objects.create(kind='reminder', appointment=old, appointment_date=old.appointment_date,
+			channel='sms', recipient='1', subject='s', body='b', status='sent')
+		self.assertEqual(archive_chunk(date(2021, 1, 1))[:2], (1, 1))
+		sent.refresh_from_db()
+		self.assertIsNone(sent.appointment_id)
+
+		self.assertEqual(len(self._get(limit=200).json()['results']), 20)
+		with self.assertNumQueries(9):
+			results = self._get(limit=200, include_archived=1).json()['results']
+		self.assertEqual(len(results), 22)
+		archived = next(e for e in results if e['type'] == 'appointment' and e['id'] == old.pk)
+		self.assertEqual(archived['data']['treatments'][0]['subtotal'], '100.00')
+		self.assertIn(('medical_record', 'old'), [(e['type'], e['data'].get('diagnosis')) for e in results])
+
+	def test_timeline_rejects_bad_cursor(self):
+		self.assertEqual(self._get(cursor='nope').status_code, 400)
+
+
+class RunningBalanceTests(TestCase):
+	def setUp(self):
+		from datetime import date, time
+		from .models import Appointment, Dentist, Invoice, Patient
+		self.patient = Patient.objects.create(first_name='A', last_name='B', gender='F', address='x', phone='1')
+		dentist = Dentist.objects.create(first_name='D', last_name='E', specialty='General', phone='2')
+		appointment = Appointment.objects.create(patient=self.patient, dentist=dentist,
+			appointment_date=date(2024, 1, 1), appointment_time=time(10), status='completed')
+		self.invoice = Invoice.objects.create(appointment=appointment, total_amount='300.00', payment_status='paid')
+
+	def _state(self):
+		self.invoice.refresh_from_db()
+		self.patient.refresh_from_db()
+		return (str(self.invoice.amount_paid), str(self.invoice.balance), self.invoice.payment_status,
+			str(self.patient.outstanding_balance))
+
+	def test_balances_follow_payments(self):
+		from decimal import Decimal
+		from .models import Payment
+		self.assertEqual(self._state(), ('0.00', '300.00', 'unpaid', '300.00'))
+		first = Payment.objects.create(invoice=self.invoice, amount_paid=Decimal('100.10'))
+		self.assertEqual(self._state(), ('100.10', '199.90', 'partial', '199.90'))
+		second = Payment.objects.create(invoice=self.invoice, amount_paid=Decimal('199.90'))
+		self.assertEqual(self._state(), ('300.00', '0.00', 'paid', '0.00'))
+		second.amount_paid = Decimal('99.90')
+		second.save()
+		self.assertEqual(self._state(), ('200.00', '100.00', 'partial', '100.00'))
+		first.delete()
+		Payment.objects.filter(pk=second.pk).delete()
+		self.assertEqual(self._state(), ('0.00', '300.00', 'unpaid', '300.00'))
+
+	def test_invoice_total_edit_and_delete_update_patient(self):
+		from .models import Payment
+		Payment.objects.create(invoice=self.invoice, amount_paid=100)
+		resp = self.client.patch(reverse('invoice-detail', args=[self.invoice.pk]),
+			json.dumps({'total_amount': '150.00', 'amount_paid': '999'}), content_type='application/json')
+		self.assertEqual(resp.json()['balance'], '50.00')
+		self.assertEqual(self._state(), ('100.00', '50.00', 'partial', '50.00'))
+		self.invoice.appointment.delete()
+		self.patient.refresh_from_db()
+		self.assertEqual(str(self.patient.outstanding_balance), '0.00')
+
+	def test_rebuild_and_aged_receivables(self):
+		from datetime import date, timedelta
+		from django.core.management import call_command
+		from django.test import override_settings
+		from .models import Invoice, Patient
+		Invoice.objects.filter(pk=self.invoice.pk).update(date_issued=date.today() - timedelta(days=45), balance=0)
+		Patient.objects.update(outstanding_balance=0)
+		call_command('rebuild_balances', stdout=open(os.devnull, 'w'))
+		self.assertEqual(self._state(), ('0.00', '300.00', 'unpaid', '300.00'))
+		url = reverse('aged-receivables')
+		with override_settings(CLINIC_ADMIN_TOKEN='s3cret'):
+			self.assertEqual(self.client.get(url).status_code, 403)
+			data = self.client.get(url, HTTP_X_ADMIN_TOKEN='s3cret').json()
+		self.assertEqual(data['totals']['days_31_60'], '300.00')
+		self.assertEqual(data['totals']['current'], '0.00')
+		self.assertEqual(data['patients'][0]['total'], '300.00')
+		self.assertEqual(data['patients'][0]['name'], 'A B')
+
+
+class CSVExportTests(TestCase):
+	def setUp(self):
+		from django.test import override_settings
+		from .models import Patient
+		self.override = override_settings(CLINIC_ADMIN_TOKEN='s3cret')
+		self.override.enable()
+		Patient.objects.bulk_create(
+			Patient(first_name=f'P{i}', last_name='Doe', gender='F' if i % 3 else 'M',
+				address='1 Nile St, "Cairo"', phone='1', password='hunter2')
+			for i in range(1203)
+		)
+
+	def tearDown(self):
+		self.override.disable()
+
+	def _get(self, model, **params):
+		return self.client.get(reverse('export-csv', args=[model]), params, HTTP_X_ADMIN_TOKEN='s3cret')
+
+	def test_export_streams_all_rows(self):
+		import csv
+		import io
+		resp = self._get('patients')
+		self.assertEqual(resp.status_code, 200)
+		self.assertTrue(resp.streaming)
+		rows = list(csv.reader(io.StringIO(b''.join(resp.streaming_content).decode())))
+		self.assertEqual(rows[0][:3], ['id', 'first_name', 'last_name'])
+		self.assertNotIn('password', rows[0])
+		self.assertEqual(len(rows), 1204)
+		self.assertEqual(rows[1][5], '1 Nile St, "Cairo"')
+
+	def test_export_filters_and_gzip(self):
+		import gzip
+		resp = self._get('patients', gender='M', gzip='1')
+		self.assertEqual(resp['Content-Type'], 'application/gzip')
+		lines = gzip.decompress(b''.join(resp.streaming_content)).decode().splitlines()
+		self.assertEqual(len(lines), 1 + 401)
+
+	def test_export_requires_admin_and_known_model(self):
+		self.assertEqual(self.client.get(reverse('export-csv', args=['patients'])).status_code, 403)
+		self.assertEqual(self._get('drugs').status_code, 400)
+		self.assertEqual(self._get('appointments', date_from='yesterday').status_code, 400)
+
+
+class CSVImportTests(TestCase):
+	def setUp(self):
+		from django.test import override_settings
+		self.override = override_settings(CLINIC_ADMIN_TOKEN='s3cret')
+		self.override.enable()
+
+	def tearDown(self):
+		self.override.disable()
+		from .drug_index import invalidate
+		invalidate()
+
+	def _upload(self, model, content, **params):
+		url = reverse('import-csv', args=[model])
+		if params:
+			url += '?' + '&'.join(f'{k}={v}' for k, v in params.items())
+		f = SimpleUploadedFile(f'{model}.csv', content.encode(), content_type='text/csv')
+		return self.client.post(url, {'file': f}, HTTP_X_ADMIN_TOKEN='s3cret')
+
+	def test_patient_import_upserts_on_email_and_reports_errors(self):
+		from .models import Patient
+		Patient.objects.create(first_name='Old', last_name='Name', gender='F', address='x', phone='1', email='a@x.com')
+		content = (
+			'first_name,last_name,gender,address,phone,email,date_of_birth,allergies\n'
+			'Sara,Hassan,F,Cairo,010,a@x.com,1990-02-03,Penicillin\n'
+			'Omar,Adel,M,Giza,011,,,\n'
+			'Bad,Date,M,Giza,012,b@x.com,03/02/1990,\n'
+			'Mona,Saleh,F,Alex,013,,,\n'
+		)
+		resp = self._upload('patients', content, dry_run=1)
+		self.assertEqual((resp.json()['valid'], resp.json()['created']), (3, 0))
+		self.assertEqual(Patient.objects.count(), 1)
+		report = self._upload('patients', content).json()
+		self.assertEqual((report['rows'], report['created'], report['updated'], report['failed']), (4, 2, 1, 1))
+		self.assertEqual(report['errors'][0]['row'], 4)
+		self.assertIn('date_of_birth', report['errors'][0]['errors'])
+		sara = Patient.objects.get(email='a@x.com')
+		self.assertEqual((sara.first_name, sara.allergy_terms), ('Sara', ['penicillin']))
+		self.assertEqual(Patient.objects.filter(email__isnull=True).count(), 2)
+
+	def test_drug_import_command_upserts_by_name(self):
+		import tempfile
+		from io import StringIO
+		from django.core.management import call_command
+		from .drug_index import get_index
+		from .models import Drug
+		Drug.objects.create(name='Amoxicillin', description='old', dosage='250mg', price=1)
+		get_index()
+		with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+			f.write('name,description,dosage,price\nAmoxicillin,Antibiotic,500mg,12.50\nClindamycin,Antibiotic,300mg,20\n')
+		try:
+			call_command('import_csv', 'drugs', f.name, chunk_size=1, stdout=StringIO(), stderr=StringIO())
+		finally:
+			os.unlink(f.name)
+		self.assertEqual(Drug.objects.get(name='Amoxicillin').dosage, '500mg')
+		self.assertEqual(Drug.objects.count(), 2)
+		self.assertEqual(get_index().lookup('Clindamycn').name, 'Clindamycin')
+
+	def test_import_requires_admin(self):
+		f = SimpleUploadedFile('t.csv', b'name\nx\n')
+		self.assertEqual(self.client.post(reverse('import-csv', args=['drugs']), {'file': f}).status_code, 403)
+		self.assertEqual(self._upload('appointments', 'a\n1\n').status_code, 400)
+
+
+class ReplicaRoutingTests(TestCase):
+	def _run(self, request):
+		from django.db import router
+		from .middleware import ReplicaRoutingMiddleware
+		from .models import Patient
+		seen = {}
+
+		def view(req):
+			from django.http import HttpResponse
+			seen['read'] = router.db_for_read(Patient)
+			seen['write'] = router.db_for_write(Patient)
+			return HttpResponse()
+
+		response = ReplicaRoutingMiddleware(view)(request)
+		return seen, response
+
+	def test_reads_go_to_replica_and_writes_pin_primary(self):
+		from django.test import RequestFactory, override_settings
+		factory = RequestFactory()
+		with override_settings(CLINIC_DB_REPLICAS=['replica1'], CLINIC_DB_STICKY_SECONDS=5):
+			seen, _ = self._run(factory.get('/api/patients/'))
+			self.assertEqual(seen, {'read': 'replica1', 'write': 'default'})
+			seen, response = self._run(factory.post('/api/patients/'))
+			self.assertEqual(seen['read'], 'default')
+			cookie = response.cookies['clinic_primary_until']
+			pinned = factory.get('/api/patients/')
+			pinned.COOKIES['clinic_primary_until'] = cookie.value
+			self.assertEqual(self._run(pinned)[0]['read'], 'default')
+			expired = factory.get('/api/patients/')
+			expired.COOKIES['clinic_primary_until'] = '1'
+			self.assertEqual(self._run(expired)[0]['read'], 'replica1')
+			self.assertEqual(self._run(factory.get('/', HTTP_X_READ_PRIMARY='1'))[0]['read'], 'default')
+
+	def test_without_replicas_everything_uses_primary(self):
+		from django.test import RequestFactory, override_settings
+		from .db_router import ReadReplicaRouter
+		_, response = self._run(RequestFactory().post('/api/patients/'))
+		self.assertNotIn('clinic_primary_until', response.cookies)
+		self.assertEqual(self._run(RequestFactory().get('/'))[0]['read'], 'default')
+		self.assertIsNone(ReadReplicaRouter().allow_migrate('default', 'clinic'))
+		with override_settings(CLINIC_DB_REPLICAS=['replica1']):
+			self.assertIs(ReadReplicaRouter().allow_migrate('replica1', 'clinic'), False)
+
+
+class ArchiveTests(TestCase):
+	def setUp(self):
+		from datetime import date, time
+		from .models import Appointment, AppointmentTreatment, Dentist, Invoice, MedicalRecord, Patient, Treatment
+		patient = Patient.objects.create(first_name='A', last_name='B', gender='F', address='x', phone='1')
+		dentist = Dentist.objects.create(first_name='D', last_name='E', specialty='General', phone='2')
+		treatment = Treatment.objects.create(name='Filling', description='', cost=100)
+
+		def appointment(day, status='completed'):
+			return Appointment.objects.create(patient=patient, dentist=dentist, appointment_date=day,
+				appointment_time=time(10), status=status)
+
+		self.old = [appointment(date(2015, 1, d)) for d in range(1, 4)]
+		for a in self.old:
+			AppointmentTreatment.objects.create(appointment=a, treatment=treatment, quantity=1)
+			MedicalRecord.objects.create(patient=patient, appointment=a, diagnosis='old', prescribed_drugs='', treatment_notes='')
+		self.invoiced = appointment(date(2015, 2, 1))
+		Invoice.objects.create(appointment=self.invoiced, total_amount=100)
+		self.canceled = appointment(date(2015, 3, 1), status='canceled')
+		self.recent = appointment(date.today())
+		MedicalRecord.objects.create(patient=patient, appointment=self.recent, diagnosis='new', prescribed_drugs='', treatment_notes='')
+
+	def test_archive_moves_old_completed_history(self):
+		from io import StringIO
+		from django.core.management import call_command
+		from .events import broker
+		from .models import Appointment, ArchivedAppointment, ArchivedAppointmentTreatment, ArchivedMedicalRecord
+		with self.captureOnCommitCallbacks(execute=True) as callbacks:
+			call_command('archive_appointments', chunk_size=2, stdout=StringIO())
+		self.assertEqual(callbacks, [])
+		self.assertEqual(sorted(ArchivedAppointment.objects.values_list('id', flat=True)), [a.pk for a in self.old])
+		self.assertEqual(ArchivedAppointmentTreatment.objects.count(), 3)
+		self.assertEqual(ArchivedMedicalRecord.objects.filter(appointment_id__in=[a.pk for a in self.old]).count(), 3)
+		self.assertEqual(set(Appointment.objects.values_list('id', flat=True)),
+			{self.invoiced.pk, self.canceled.pk, self.recent.pk})
+
+	def test_lists_union_archive_on_request(self):
+		from io import StringIO
+		from django.core.management import call_command
+		call_command('archive_appointments', stdout=StringIO())
+		hot = self.client.get(reverse('appointment-list')).json()
+		both = self.client.get(reverse('appointment-list'), {'include_archived': '1'}).json()
+		self.assertEqual(len(hot), 3)
+		self.assertEqual(len(both), 6)
+		self.assertEqual(both[0]['id'], self.recent.pk)
+		self.assertEqual(both[-1]['dentist_name'], 'Dr. D E')
+		records = self.client.get(reverse('medicalrecord-list'), {'include_archived': '1', 'dentist': self.old[0].dentist_id}).json()
+		self.assertEqual([r['diagnosis'] for r in records], ['new', 'old', 'old', 'old'])
+		self.assertEqual(len(self.client.get(reverse('medicalrecord-list')).json()), 1)
+
+
+class ReferenceCacheTests(TestCase):
+	def setUp(self):
+		from django.core.cache import caches
+		from .models import Drug, Treatment, TreatmentDrug
+		caches['reference'].clear()
+		self.treatment = Treatment.objects.create(name='Filling', description='', cost=100)
+		self.drug = Drug.objects.create(name='Ibuprofen', description='', dosage='400mg', price=10)
+		TreatmentDrug.objects.create(treatment=self.treatment, drug=self.drug, dosage_used='400mg')
+
+	def test_reads_are_served_from_cache_until_a_change(self):
+		from .models import Drug
+		from .refcache import REQUESTS
+		url = reverse('drug-list')
+		self.assertEqual(len(self.client.get(url).json()), 1)
+		self.client.get(reverse('drug-detail', args=[self.drug.pk]))
+		hits = REQUESTS.value('drugs', 'hit')
+		with self.assertNumQueries(0):
+			self.assertEqual(len(self.client.get(url).json()), 1)
+			self.assertEqual(self.client.get(reverse('drug-detail', args=[self.drug.pk])).json()['name'], 'Ibuprofen')
+		self.assertEqual(REQUESTS.value('drugs', 'hit'), hits + 2)
+		Drug.objects.create(name='Amoxicillin', description='', dosage='500mg', price=20)
+		self.assertEqual(len(self.client.get(url).json()), 2)
+		self.drug.delete()
+		self.assertEqual(self.client.get(reverse('drug-detail', args=[self.drug.pk])).status_code, 404)
+
+	def test_invalidation_is_per_group(self):
+		from .models import Dentist
+		self.client.get(reverse('treatment-list'))
+		self.client.get(reverse('treatmentdrug-list'))
+		Dentist.objects.create(first_name='D', last_name='E', specialty='General', phone='2')
+		with self.assertNumQueries(0):
+			self.client.get(reverse('treatment-list'))
+			self.client.get(reverse('treatmentdrug-list'))
+		self.treatment.name = 'Composite filling'
+		self.treatment.save()
+		self.assertEqual(self.client.get(reverse('treatment-list')).json()[0]['name'], 'Composite filling')
+
+	def test_dentist_responses_are_not_cached(self):
+		from django.core.cache import caches
+		from .models import Dentist
+		Dentist.objects.create(first_name='D', last_name='E', specialty='General', phone='2')
+		self.client.get(reverse('dentist-list'))
+		self.assertFalse([k for k in caches['reference']._cache if ':ref:dentists:' in k])
+
+	def test_dentist_names_map(self):
+		from .models import Dentist
+		from .refcache import dentist_names
+		dentist = Dentist.objects.create(first_name='D', last_name='E', specialty='General', phone='2')
+		self.assertEqual(dentist_names()[dentist.pk], 'Dr. D E')
+		with self.assertNumQueries(0):
+			dentist_names()
+		dentist.last_name = 'F'
+		dentist.save()
+		self.assertEqual(dentist_names()[dentist.pk], 'Dr. D F')
+
+
+	def test_entries_are_built_from_the_primary(self):
+		from . import db_router, refcache
+		seen = []
+		with db_router.read_from('replica1'):
+			refcache.get_or_set('drugs', 'probe', lambda: seen.append(db_router.current_read_alias()) or 1)
+		self.assertEqual(seen, [None])
+
+	def test_local_memory_entries_expire(self):
+		from django.test import override_settings
+		from .models import Dentist
+		from .refcache import dentist_names
+		Dentist.objects.create(first_name='D', last_name='E', specialty='General', phone='2')
+		dentist_names()
+		with override_settings(CLINIC_REFERENCE_LOCAL_SECONDS=0), self.assertNumQueries(1):
+			dentist_names()
+
+	def test_appointment_list_resolves_dentist_names_once(self):
+		from datetime import date, time
+		from unittest import mock
+		from . import refcache
+		from .models import Appointment, Dentist, Patient
+		patient = Patient.objects.create(first_name='A', last_name='B', gender='F', address='x', phone='1')
+		dentist = Dentist.objects.create(first_name='D', last_name='E', specialty='General', phone='2')
+		for day in range(1, 4):
+			Appointment.objects.create(patient=patient, dentist=dentist, appointment_date=date(2024, 1, day),
+				appointment_time=time(10), status='upcoming')
+		with mock.patch.object(refcache, 'dentist_names', wraps=refcache.dentist_names) as names:
+			data = self.client.get(reverse('appointment-list')).json()
+		self.assertEqual(names.call_count, 1)
+		self.assertEqual({a['dentist_name'] for a in data}, {'Dr. D E'})
+
+
+class AdmissionControlTests(TestCase):
+	def setUp(self):
+		from .admission import buckets
+		buckets.clear()
+
+	def test_gate_bounds_running_and_waiting_requests(self):
+		from .admission import Gate
+		gate = Gate(concurrency=1, queue=0)
+		self.assertTrue(gate.acquire(timeout=0))
+		self.assertFalse(gate.acquire(timeout=1))
+		gate.release()
+		self.assertTrue(gate.acquire(timeout=0))
+
+	def test_token_bucket_refills_over_time(self):
+		from .admission import TokenBuckets
+		buckets = TokenBuckets()
+		self.assertEqual(buckets.take('a', rate=1, burst=2, now=0), 0)
+		self.assertEqual(buckets.take('a', rate=1, burst=2, now=0), 0)
+		self.assertEqual(buckets.take('a', rate=1, burst=2, now=0), 1)
+		self.assertEqual(buckets.take('b', rate=1, burst=2, now=0), 0)
+		self.assertEqual(buckets.take('a', rate=1, burst=2, now=1.5), 0)
+
+	def test_middleware_rejects_oversized_and_throttled_requests(self):
+		from django.test import override_settings
+		url = reverse('process-nlp')
+		body = json.dumps({'text': 'Diagnosis: Pulpitis'})
+		with override_settings(CLINIC_MAX_UPLOAD_BYTES=10):
+			resp = self.client.post(url, body, content_type='application/json')
+		self.assertEqual(resp.status_code, 413)
+		with override_settings(CLINIC_CLIENT_RATE=0.5, CLINIC_CLIENT_BURST=1):
+			self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 200)
+			resp = self.client.post(url, body, content_type='application/json')
+			self.assertEqual(resp.status_code, 429)
+			self.assertEqual(resp['Retry-After'], '2')
+			# Other endpoints are not limited.
+			self.assertEqual(self.client.get(reverse('dentist-list')).status_code, 200)
+
+	def test_saturated_endpoint_answers_429(self):
+		from django.test import override_settings
+		from .admission import gate_for
+		limits = {'process-nlp': {'concurrency': 1, 'queue': 0}}
+		with override_settings(CLINIC_ADMISSION_LIMITS=limits):
+			gate = gate_for('process-nlp')
+			gate.acquire(timeout=0)
+			try:
+				resp = self.client.post(reverse('process-nlp'), json.dumps({'text': 'x'}), content_type='application/json')
+			finally:
+				gate.release()
+		self.assertEqual(resp.status_code, 429)
+		self.assertIn('Retry-After', resp)
+
+
+	def test_body_is_capped_when_length_is_understated(self):
+		from io import BytesIO
+		from django.test import RequestFactory
+		from .admission import AdmissionMiddleware, UploadTooLarge, cap_upload
+		request = RequestFactory().post(reverse('process-nlp'), b'x' * 100, content_type='application/json')
+		request._stream = BytesIO(b'x' * 100)
+		cap_upload(request, 10)
+		with self.assertRaises(UploadTooLarge):
+			request.body
+		resp = AdmissionMiddleware(None).process_exception(request, UploadTooLarge(10))
+		self.assertEqual(resp.status_code, 413)
+
+	def test_streamed_response_holds_its_slot_until_closed(self):
+		from django.core.files.uploadedfile import SimpleUploadedFile
+		from django.test import override_settings
+		from .admission import gate_for
+		limits = {'process-ocr': {'concurrency': 1, 'queue': 0}}
+		with override_settings(CLINIC_ADMISSION_LIMITS=limits):
+			upload = SimpleUploadedFile('scan.png', b'not an image', content_type='image/png')
+			resp = self.client.post(reverse('process-ocr') + '?stream=1', {'file': upload})
+			self.assertFalse(gate_for('process-ocr').acquire(timeout=0))
+			b''.join(resp.streaming_content)
+			self.assertTrue(gate_for('process-ocr').acquire(timeout=0))
+			gate_for('process-ocr').release()
+
+	def test_clients_behind_a_proxy_are_told_apart(self):
+		from django.test import override_settings
+		url = reverse('process-nlp')
+		body = json.dumps({'text': 'Diagnosis: Pulpitis'})
+
+		def post(forwarded):
+			return self.client.post(url, body, content_type='application/json', HTTP_X_FORWARDED_FOR=forwarded).status_code
+
+		with override_settings(CLINIC_CLIENT_RATE=0.5, CLINIC_CLIENT_BURST=1, CLINIC_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR'):
+			self.assertEqual(post('10.0.0.1'), 200)
+			self.assertEqual(post('10.0.0.2'), 200)
+			self.assertEqual(post('spoofed, 10.0.0.1'), 429)
+
+class CapabilityTests(TestCase):
+	def test_load_and_missing_dependency(self):
+		from unittest import mock
+		from . import capabilities
+		self.assertTrue(capabilities.available('http'))
+		self.assertEqual(capabilities.load('http').__name__, 'urllib.request')
+		with mock.patch.dict(capabilities.CAPABILITIES, {'nope': capabilities.Capability('clinic_no_such_module', 'Nothing')}):
+			self.assertFalse(capabilities.available('nope'))
+			with self.assertRaises(ImportError):
+				capabilities.load('nope')
+			self.assertIn('nope', capabilities.status())
+
+	def test_boot_does_not_import_ocr_dependencies(self):
+		import subprocess
+		import sys
+		from django.conf import settings
+		code = (
+			"import os, sys, django; os.environ['DJANGO_SETTINGS_MODULE'] = 'Osra_backend.settings'; "
+			"os.environ.pop('CLINIC_OCR_WARMUP', None); django.setup(); import clinic.urls; "
+			"print(','.join(m for m in ('PIL.Image', 'pytesseract', 'tesserocr', 'pdf2image') if m in sys.modules))"
+		)
+		result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True)
+		self.assertEqual(result.stdout.strip(), '')
+
+
+class SchedulerTests(TestCase):
+	def setUp(self):
+		from datetime import date, time, timedelta
+		from .models import Appointment, Dentist, Patient
+		self.today = date.today()
+		patient = Patient.objects.create(first_name='A', last_name='B', gender='F', address='x', phone='1', email='a@b.test')
+		no_contact = Patient.objects.create(first_name='C', last_name='D', gender='M', address='x', phone='')
+		dentist = Dentist.objects.create(first_name='D', last_name='E', specialty='General', phone='2')
+
+		def appointment(days, status='upcoming', who=patient):
+			return Appointment.objects.create(patient=who, dentist=dentist, appointment_date=self.today + timedelta(days=days),
+				appointment_time=time(10), status=status)
+
+		self.missed = appointment(-5)
+		self.yesterday = appointment(-1)
+		self.tomorrow = appointment(1)
+		self.tomorrow_no_contact = appointment(1, who=no_contact)
+		self.next_week = appointment(7)
+		appointment(-2, status='completed')
+		appointment(-3, status='canceled')
+
+	def _sender(self):
+		from .notifications import LocalSender, set_sender
+		sender = LocalSender()
+		set_sender(sender)
+		self.addCleanup(set_sender, None)
+		return sender
+
+	def test_jobs_sweep_queue_and_deliver(self):
+		from .models import NotificationOutbox, ScheduledJob
+		from .scheduler import run_due
+		sender = self._sender()
+		ran = run_due()
+		self.assertEqual(set(ran), {'mark_no_shows', 'flag_unfinished', 'queue_reminders', 'send_notifications',
+			'purge_idempotency_keys'})
+		self.missed.refresh_from_db()
+		self.assertEqual(self.missed.status, 'upcoming')
+		self.assertEqual(ran['queue_reminders'][1]['no_contact'], 1)
+		self.assertEqual(set(NotificationOutbox.objects.values_list('kind', 'appointment_id')),
+			{('reminder', self.tomorrow.pk), ('unfinished', self.missed.pk), ('unfinished', self.yesterday.pk)})
+		self.assertEqual(ran['send_notifications'][1]['sent'], 3)
+		self.assertEqual({m['to'] for m in sender.sent}, {'a@b.test', '2'})
+		self.assertFalse(ScheduledJob.objects.filter(locked_until__isnull=False).exists())
+		# Nothing is due again yet; forced runs queue no duplicates.
+		self.assertEqual(run_due(), {})
+		self.assertEqual(run_due(force=['queue_reminders'])['queue_reminders'][1]['queued'], 0)
+
+	def test_no_shows_are_marked_only_when_enabled(self):
+		from django.test import override_settings
+		from django.utils import timezone
+		from .scheduler import mark_no_shows
+		self.assertEqual(mark_no_shows(timezone.now())['marked'], 0)
+		with override_settings(CLINIC_NO_SHOW_AFTER_DAYS=3):
+			self.assertEqual(mark_no_shows(timezone.now())['marked'], 1)
+		self.missed.refresh_from_db()
+		self.yesterday.refresh_from_db()
+		self.assertEqual((self.missed.status, self.yesterday.status), ('no-show', 'upcoming'))
+
+	def test_failed_sends_are_retried_then_given_up(self):
+		from django.test import override_settings
+		from django.utils import timezone
+		from .models import NotificationOutbox
+		from .notifications import Sender, deliver_pending
+		from .scheduler import queue_reminders
+
+		class Down(Sender):
+			def send(self, notification):
+				raise ConnectionError('offline')
+
+		queue_reminders(timezone.now())
+		with override_settings(CLINIC_NOTIFICATION_MAX_ATTEMPTS=2):
+			self.assertEqual(deliver_pending(timezone.now(), sender=Down())['retrying'], 1)
+			self.assertEqual(deliver_pending(timezone.now(), sender=Down())['failed'], 1)
+		notification = NotificationOutbox.objects.get()
+		self.assertEqual((notification.status, notification.attempts), ('failed', 2))
+		self.assertIn('offline', notification.last_error)
+
+	def test_leased_job_is_not_run_twice(self):
+		from datetime import timedelta
+		from django.utils import timezone
+		from .models import ScheduledJob
+		from .scheduler import ensure_jobs, run_due
+		now = timezone.now()
+		ensure_jobs(now)
+		ScheduledJob.objects.filter(name='mark_no_shows').update(locked_until=now + timedelta(minutes=5))
+		self._sender()
+		self.assertNotIn('mark_no_shows', run_due(now))
+		self.assertIn('mark_no_shows', run_due(now + timedelta(minutes=10)))
+
+
+class UtilizationReportTests(TestCase):
+	def setUp(self):
+		from datetime import date, time
+		from django.core.cache import cache
+		from .models import Appointment, Dentist, Patient
+		cache.clear()
+		patient = Patient.objects.create(first_name='A', last_name='B', gender='F', address='x', phone='1')
+		self.dentist = Dentist.objects.create(first_name='D', last_name='E', specialty='General', phone='2')
+		other = Dentist.objects.create(first_name='F', last_name='G', specialty='General', phone='3')
+
+		def appointment(day, at, status='completed', dentist=self.dentist):
+			Appointment.objects.create(patient=patient, dentist=dentist, appointment_date=day, appointment_time=at, status=status)
+
+		# Monday 2024-01-01 and Monday 2024-01-08.
+		appointment(date(2024, 1, 1), time(9, 0))
+		appointment(date(2024, 1, 1), time(10, 0))
+		appointment(date(2024, 1, 1), time(10, 30), status='no-show')
+		appointment(date(2024, 1, 8), time(9, 30), status='canceled')
+		appointment(date(2024, 1, 8), time(14, 0), dentist=other)
+		self.url = reverse('utilization') + '?start=2024-01-01&end=2024-01-14'
+
+	def _get(self, url=None):
+		from django.test import override_settings
+		with override_settings(CLINIC_ADMIN_TOKEN='s3cret', CLINIC_APPOINTMENT_SLOT_MINUTES=30):
+			return self.client.get(url or self.url, HTTP_X_ADMIN_TOKEN='s3cret')
+
+	def test_report_aggregates(self):
+		from . import capabilities
+		if not capabilities.available('numpy'):
+			self.skipTest('NumPy is not installed')
+		response = self._get()
+		self.assertEqual(response.status_code, 200)
+		report = response.json()
+		self.assertEqual(report['hours'], list(range(9, 15)))
+		self.assertEqual(report['totals']['appointments'], 5)
+		mine = next(d for d in report['dentists'] if d['dentist'] == self.dentist.pk)
+		self.assertEqual((mine['appointments'], mine['canceled'], mine['no_shows']), (4, 1, 1))
+		self.assertEqual(mine['no_show_rate'], round(1 / 3, 4))
+		# 9:00-9:30 then 10:00 (30 idle minutes), then 10:30 right after.
+		self.assertEqual(mine['avg_gap_minutes'], 15.0)
+		# Two Mondays with two 30-minute slots an hour: the 10 o'clock hour
+		# was booked twice out of four slots; the canceled 9:30 does not count.
+		self.assertEqual(mine['occupancy'][0][:2], [0.25, 0.5])
+		self.assertEqual(mine['occupancy'][1], [0.0] * 6)
+
+	def test_report_is_cached(self):
+		from . import capabilities
+		if not capabilities.available('numpy'):
+			self.skipTest('NumPy is not installed')
+		self.assertEqual(self._get().status_code, 200)
+		with self.assertNumQueries(0):
+			self.assertEqual(self._get().status_code, 200)
+
+	def test_validation_and_missing_numpy(self):
+		from unittest import mock
+		from . import capabilities
+		self.assertEqual(self.client.get(self.url).status_code, 403)
+		self.assertEqual(self._get(reverse('utilization') + '?start=2024-02-01&end=2024-01-01').status_code, 400)
+		self.assertEqual(self._get(reverse('utilization') + '?start=yesterday').status_code, 400)
+		missing = capabilities.Capability('clinic_no_such_module', 'NumPy')
+		with mock.patch.dict(capabilities.CAPABILITIES, {'numpy': missing}), \
+				mock.patch.dict('sys.modules', {'clinic_no_such_module': None}):
+			self.assertEqual(self._get().status_code, 503)
+
+
+class AppointmentSeriesTests(TestCase):
+	def setUp(self):
+		from datetime import date, time
+		from .models import Appointment, Dentist, Patient
+		self.patient = Patient.objects.create(first_name='A', last_name='B', gender='F', address='x', phone='1')
+		self.dentist = Dentist.objects.create(first_name='D', last_name='E', specialty='Ortho', phone='2')
+		# Mondays 2030-01-07 and 2030-01-14 are taken at 10:15; the 21st is canceled.
+		for day, state in ((7, 'upcoming'), (14, 'completed'), (21, 'canceled')):
+			Appointment.objects.create(patient=self.patient, dentist=self.dentist, appointment_date=date(2030, 1, day),
+				appointment_time=time(10, 15), status=state)
+		self.url = reverse('appointment-series')
+
+	def _post(self, **overrides):
+		body = {'patient': self.patient.pk, 'dentist': self.dentist.pk, 'start_date': '2030-01-07',
+			'appointment_time': '10:00', 'frequency': 'weekly', 'count': 52, **overrides}
+		return self.client.post(self.url, body, content_type='application/json')
+
+	def test_single_booking_takes_the_dentist_lock(self):
+		from unittest import mock
+		from . import series
+		with mock.patch.object(series, 'lock_dentist', wraps=series.lock_dentist) as lock:
+			response = self.client.post(reverse('appointment-list'), {
+				'patient': self.patient.pk, 'dentist': self.dentist.pk, 'appointment_date': '2030-02-04',
+				'appointment_time': '10:00', 'status': 'upcoming',
+			}, content_type='application/json')
+		self.assertEqual(response.status_code, 201)
+		lock.assert_called_once_with(self.dentist.pk)
+
+	def test_expand_rules(self):
+		from datetime import date
+		from .series import SeriesError, expand
+		self.assertEqual(expand(date(2030, 1, 31), 'monthly', count=3), [date(2030, 1, 31), date(2030, 2, 28), date(2030, 3, 31)])
+		self.assertEqual(expand(date(2030, 1, 1), 'weekly', 2, until=date(2030, 1, 29)),
+			[date(2030, 1, 1), date(2030, 1, 15), date(2030, 1, 29)])
+		with self.assertRaises(SeriesError):
+			expand(date(2030, 1, 1), 'daily', count=1000)
+
+	def test_conflicts_reject_the_series(self):
+		from .models import Appointment
+		response = self._post()
+		self.assertEqual(response.status_code, 409)
+		body = response.json()
+		self.assertEqual((body['created'], body['conflicting']), (0, 2))
+		self.assertEqual(len(body['occurrences']), 52)
+		self.assertEqual(len(body['occurrences'][0]['conflicts']), 1)
+		self.assertEqual(body['occurrences'][2]['conflicts'], [])
+		self.assertEqual(Appointment.objects.count(), 3)
+		self.assertEqual(self._post(dry_run=True).status_code, 200)
+		self.assertEqual(Appointment.objects.count(), 3)
+
+	def test_skip_conflicts_bulk_inserts_in_constant_queries(self):
+		from .events import broker
+		from .models import Appointment
+		start = broker.last_id
+		# Validation (patient, dentist), savepoint, lock, conflict check, insert, release.
+		with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(7):
+			response = self._post(skip_conflicts=True, appointment_time='10:30')
+		self.assertEqual(response.status_code, 201)
+		body = response.json()
+		self.assertEqual((body['created'], body['conflicting']), (50, 2))
+		self.assertIsNone(body['occurrences'][1]['appointment'])
+		self.assertIsNotNone(body['occurrences'][2]['appointment'])
+		self.assertEqual(Appointment.objects.filter(appointment_time='10:30').count(), 50)
+		_, published = broker.events_since(start, dentist_id=self.dentist.pk)
+		self.assertEqual(len(published), 50)
+
+	def test_validation(self):
+		self.assertEqual(self._post(until='2030-06-01').status_code, 400)
+		self.assertEqual(self._post(count=None).status_code, 400)
+		self.assertEqual(self._post(frequency='yearly').status_code, 400)
+
+
+class IdempotencyTests(TestCase):
+	def setUp(self):
+		from .models import Dentist, Patient
+		patient = Patient.objects.create(first_name='A', last_name='B', gender='F', address='x', phone='1')
+		dentist = Dentist.objects.create(first_name='D', last_name='E', specialty='General', phone='2')
+		self.body = {'patient': patient.pk, 'dentist': dentist.pk, 'appointment_date': '2030-01-07',
+			'appointment_time': '10:00', 'status': 'upcoming'}
+
+	def _post(self, key, body=None, url=None):
+		return self.client.post(url or reverse('appointment-list'), json.dumps(body or self.body),
+			content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+	def test_retry_replays_without_running_the_view(self):
+		from .models import Appointment
+		first = self._post('k-1')
+		self.assertEqual(first.status_code, 201)
+		with self.assertNumQueries(1):
+			retry = self._post('k-1')
+		self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (201, 'true'))
+		self.assertEqual(retry.json(), first.json())
+		self.assertEqual(Appointment.objects.count(), 1)
+		self.assertEqual(self._post('k-2').status_code, 201)
+		self.assertEqual(Appointment.objects.count(), 2)
+		self.assertEqual(self._post('k-1', {**self.body, 'notes': 'changed'}).status_code, 422)
+
+	def test_replay_keeps_headers_and_pins_reads_to_the_primary(self):
+		from unittest import mock
+		from django.test import override_settings
+		with override_settings(CLINIC_DB_REPLICAS=['replica1']), \
+				mock.patch('clinic.views.AppointmentViewSet.get_success_headers', return_value={'Location': '/api/appointments/1/'}):
+			self._post('k-6')
+			retry = self._post('k-6')
+		self.assertEqual((retry['Idempotent-Replayed'], retry['Location']), ('true', '/api/appointments/1/'))
+		self.assertIn('clinic_primary_until', retry.cookies)
+
+	def test_lost_claim_race_waits_for_the_deadline(self):
+		from unittest import mock
+		from django.test import override_settings
+		with override_settings(CLINIC_IDEMPOTENCY_WAIT_SECONDS=0), \
+				mock.patch('clinic.idempotency._claim', return_value=(None, False)):
+			self.assertEqual(self._post('k-7').status_code, 409)
+
+	def test_in_progress_and_expired_claims(self):
+		from datetime import timedelta
+		from django.test import override_settings
+		from django.utils import timezone
+		from .models import Appointment, IdempotencyKey
+		from .scheduler import purge_idempotency_keys
+		held = IdempotencyKey.objects.create(key='k-3', fingerprint=self._fingerprint(), route='appointment-list',
+			expires_at=timezone.now() + timedelta(minutes=1))
+		with override_settings(CLINIC_IDEMPOTENCY_WAIT_SECONDS=0):
+			response = self._post('k-3')
+		self.assertEqual(response.status_code, 409)
+		self.assertIn('Retry-After', response)
+		# A claim whose request died lapses and is taken over.
+		IdempotencyKey.objects.filter(pk=held.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+		self.assertEqual(self._post('k-3').status_code, 201)
+		self.assertEqual(Appointment.objects.count(), 1)
+		self.assertEqual(purge_idempotency_keys(timezone.now() + timedelta(days=2)), {'purged': 1})
+
+	def _fingerprint(self):
+		from django.test import RequestFactory
+		from .idempotency import fingerprint
+		return fingerprint(RequestFactory().post(reverse('appointment-list'), json.dumps(self.body),
+			content_type='application/json'))
+
+	def test_uploads_are_fingerprinted_by_content(self):
+		from django.test import RequestFactory
+		from .idempotency import fingerprint
+
+		def upload(content):
+			return RequestFactory().post(reverse('process-ocr'), {'file': SimpleUploadedFile('a.png', content)})
+
+		self.assertEqual(fingerprint(upload(b'scan')), fingerprint(upload(b'scan')))
+		self.assertNotEqual(fingerprint(upload(b'scan')), fingerprint(upload(b'other')))
+		request = upload(b'scan')
+		fingerprint(request)
+		self.assertEqual(request.FILES['file'].read(), b'scan')
+
+	def test_other_routes_and_server_errors_are_not_stored(self):
+		from unittest import mock
+		from .models import IdempotencyKey
+		self._post('k-4', url=reverse('login'))
+		with mock.patch('clinic.views.AppointmentViewSet.create', side_effect=RuntimeError('boom')):
+			with self.assertRaises(RuntimeError):
+				self._post('k-5')
+		self.assertFalse(IdempotencyKey.objects.exists())
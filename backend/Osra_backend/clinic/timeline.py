@@ -0,0 +1,171 @@
+"""
+Merged, date-ordered history of one patient.
+
+Each source (appointments, medical records, invoices, payments) is queried
+once, already filtered to entries older than the cursor and limited to one
+page, and the sorted streams are merged in Python. A page therefore costs a
+fixed number of queries however many rows it contains.
+
+Entries sort newest first by ``(timestamp, type rank, id)``. The cursor is that
+key of the last entry returned, as ``<iso timestamp>|<type>|<id>``.
+"""
+import heapq
+from datetime import datetime, time
+
+from django.db.models import Q, prefetch_related_objects
+from django.utils import timezone
+
+from . import archive, refcache
+from .models import (
+    Appointment, AppointmentTreatment, ArchivedAppointment, ArchivedAppointmentTreatment, ArchivedMedicalRecord,
+    Invoice, MedicalRecord, Payment,
+)
+from .serializers import (
+    AppointmentSerializer, InvoiceSerializer, MedicalRecordSerializer, PaymentSerializer,
+)
+
+# Tie-break between entries at the same timestamp: higher ranks come first.
+RANKS = {'payment': 0, 'invoice': 1, 'medical_record': 2, 'appointment': 3}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(entry):
+    return f"{entry['timestamp']}|{entry['type']}|{entry['id']}"
+
+
+def decode_cursor(value):
+    try:
+        ts, kind, pk = value.split('|')
+        return datetime.fromisoformat(ts), RANKS[kind], int(pk)
+    except (KeyError, ValueError):
+        raise InvalidCursor(f"Invalid cursor {value!r}")
+
+
+def _local(value):
+    return timezone.localtime(value).replace(tzinfo=None) if timezone.is_aware(value) else value
+
+
+def _older_q(cursor, rank, date_field, time_field=None, datetime_field=None):
+    """Q matching rows whose sort key is below ``cursor``."""
+    ts, cursor_rank, cursor_id = cursor
+    if rank < cursor_rank:
+        tie = Q()
+    elif rank == cursor_rank:
+        tie = Q(pk__lt=cursor_id)
+    else:
+        tie = None
+    if datetime_field:
+        value = timezone.make_aware(ts) if timezone.is_naive(ts) else ts
+        older, same = Q(**{f'{datetime_field}__lt': value}), Q(**{datetime_field: value})
+    elif time_field:
+        older = Q(**{f'{date_field}__lt': ts.date()}) | Q(**{date_field: ts.date(), f'{time_field}__lt': ts.time()})
+        same = Q(**{date_field: ts.date(), time_field: ts.time()})
+    else:
+        # Date-only rows sort at midnight.
+        if ts.time() != time.min:
+            return Q(**{f'{date_field}__lte': ts.date()})
+        older, same = Q(**{f'{date_field}__lt': ts.date()}), Q(**{date_field: ts.date()})
+    return older if tie is None else older | (same & tie)
+
+
+def _treatment_lines(appointment_ids, archived):
+    """Treatment lines of the given appointments, grouped by appointment id."""
+    hot = AppointmentTreatment.objects.filter(appointment_id__in=appointment_ids)
+    if archived:
+        cold = ArchivedAppointmentTreatment.objects.filter(appointment_id__in=appointment_ids)
+        lines = list(archive.with_archived(hot, cold, ('id',)))
+        prefetch_related_objects(lines, 'treatment')
+    else:
+        lines = hot.select_related('treatment').order_by('id')
+    grouped = {}
+    for line in lines:
+        grouped.setdefault(line.appointment_id, []).append(line)
+    return grouped
+
+
+def _appointments(patient_id, cursor, limit, archived):
+    hot = Appointment.objects.filter(patient_id=patient_id)
+    cold = ArchivedAppointment.objects.filter(patient_id=patient_id)
+    if cursor:
+        older = _older_q(cursor, RANKS['appointment'], 'appointment_date', time_field='appointment_time')
+        hot, cold = hot.filter(older), cold.filter(older)
+    ordering = ('-appointment_date', '-appointment_time', '-id')
+    if archived:
+        appointments = list(archive.with_archived(hot, cold, ordering)[:limit])
+        prefetch_related_objects(appointments, 'patient', 'dentist')
+    else:
+        appointments = list(hot.select_related('patient', 'dentist').order_by(*ordering)[:limit])
+    lines = _treatment_lines([a.id for a in appointments], archived)
+    context = {'dentist_names': refcache.dentist_names()}
+    for appointment in appointments:
+        data = AppointmentSerializer(appointment, context=context).data
+        data['treatments'] = [
+            {
+                'id': item.id,
+                'treatment': item.treatment_id,
+                'name': item.treatment.name,
+                'quantity': item.quantity,
+                'cost': str(item.treatment.cost),
+                'subtotal': str(item.subtotal()),
+                'notes': item.notes,
+            }
+            for item in lines.get(appointment.id, ())
+        ]
+        yield datetime.combine(appointment.appointment_date, appointment.appointment_time), 'appointment', appointment.id, data
+
+
+def _medical_records(patient_id, cursor, limit, archived):
+    hot = MedicalRecord.objects.filter(patient_id=patient_id)
+    cold = ArchivedMedicalRecord.objects.filter(patient_id=patient_id)
+    if cursor:
+        older = _older_q(cursor, RANKS['medical_record'], None, datetime_field='record_date')
+        hot, cold = hot.filter(older), cold.filter(older)
+    ordering = ('-record_date', '-id')
+    qs = archive.with_archived(hot, cold, ordering) if archived else hot.order_by(*ordering)
+    for record in qs[:limit]:
+        yield _local(record.record_date), 'medical_record', record.id, MedicalRecordSerializer(record).data
+
+
+def _invoices(patient_id, cursor, limit, archived):
+    qs = Invoice.objects.filter(appointment__patient_id=patient_id).order_by('-date_issued', '-id')
+    if cursor:
+        qs = qs.filter(_older_q(cursor, RANKS['invoice'], 'date_issued'))
+    for invoice in qs[:limit]:
+        yield datetime.combine(invoice.date_issued, time.min), 'invoice', invoice.id, InvoiceSerializer(invoice).data
+
+
+def _payments(patient_id, cursor, limit, archived):
+    qs = Payment.objects.filter(invoice__appointment__patient_id=patient_id).order_by('-payment_date', '-id')
+    if cursor:
+        qs = qs.filter(_older_q(cursor, RANKS['payment'], 'payment_date'))
+    for payment in qs[:limit]:
+        yield datetime.combine(payment.payment_date, time.min), 'payment', payment.id, PaymentSerializer(payment).data
+
+
+SOURCES = (_appointments, _medical_records, _invoices, _payments)
+
+
+def patient_timeline(patient_id, cursor=None, limit=50, include_archived=False):
+    """Return ``(entries, next_cursor)`` for one page of the patient's history.
+
+    With ``include_archived`` appointments and medical records also come from
+    the archive tables (see clinic.archive); invoices and payments never move.
+    """
+    if isinstance(cursor, str):
+        cursor = decode_cursor(cursor)
+    # Each source needs at most ``limit + 1`` rows to fill the page and tell
+    # whether another one follows.
+    streams = [
+        [(ts, RANKS[kind], pk, kind, data) for ts, kind, pk, data in source(patient_id, cursor, limit + 1, include_archived)]
+        for source in SOURCES
+    ]
+    merged = heapq.merge(*streams, key=lambda row: row[:3], reverse=True)
+    entries = []
+    for ts, _, pk, kind, data in merged:
+        if len(entries) == limit:
+            return entries, encode_cursor(entries[-1])
+        entries.append({'type': kind, 'id': pk, 'timestamp': ts.isoformat(), 'data': data})
+    return entries, None
@@ -1,17 +1,22 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 from .views import (
-    PatientViewSet, DentistViewSet, AppointmentViewSet,
+    PatientViewSet, DentistViewSet, TreatmentViewSet, DrugViewSet, AppointmentViewSet,
     AppointmentTreatmentViewSet, TreatmentDrugViewSet,
     InvoiceViewSet, PaymentViewSet, MedicalRecordViewSet, AdminViewSet,
     patient_signup, dentist_signup, login_view,
     change_patient_password, change_dentist_password, change_admin_password,
-    ocr_process_view, acr_process_view, nlp_process_view, disease_search_proxy
+    ocr_process_view, acr_process_view, nlp_process_view, disease_search_proxy,
+    document_process_view, nlp_batch_process_view,
+    appointment_events_view, metrics_view, profile_list_view, profile_download_view,
+    aged_receivables_view, utilization_view, export_csv_view, import_csv_view,
 )
 
 router = DefaultRouter()
 router.register("patients", PatientViewSet)
 router.register("dentists", DentistViewSet)
+router.register("treatments", TreatmentViewSet)
+router.register("drugs", DrugViewSet)
 router.register("appointments", AppointmentViewSet)
 router.register("appointment-treatments", AppointmentTreatmentViewSet)
 router.register("treatment-drugs", TreatmentDrugViewSet)
@@ -33,5 +38,21 @@ urlpatterns = router.urls + [
     path("process/ocr/", ocr_process_view, name="process-ocr"),
     path("process/acr/", acr_process_view, name="process-acr"),
     path("process/nlp/", nlp_process_view, name="process-nlp"),
+    path("process/nlp/batch/", nlp_batch_process_view, name="process-nlp-batch"),
+    path("process/document/", document_process_view, name="process-document"),
     path("process/disease-search/", disease_search_proxy, name="disease-search"),
+
+    # 🔹 Live updates
+    path("events/appointments/", appointment_events_view, name="appointment-events"),
+
+    # 🔹 Reports
+    path("reports/aged-receivables/", aged_receivables_view, name="aged-receivables"),
+    path("reports/utilization/", utilization_view, name="utilization"),
+    path("export/<str:model>.csv", export_csv_view, name="export-csv"),
+    path("import/<str:model>/", import_csv_view, name="import-csv"),
+
+    # 🔹 Monitoring
+    path("metrics", metrics_view, name="metrics"),
+    path("profiles/", profile_list_view, name="profile-list"),
+    path("profiles/<str:profile_id>/<str:kind>/", profile_download_view, name="profile-download"),
 ]
@@ -0,0 +1,181 @@
+"""
+Dentist utilization: occupancy by weekday and hour, idle gaps between
+appointments and no-show rates.
+
+``load()`` reads the four columns the report needs (dentist, date, time,
+status) in one query straight from the cursor into NumPy arrays, without
+building model instances or converting each row's date and time in Python.
+``summarize()`` then computes every aggregate with array operations: a
+bincount over a flattened dentist x weekday x hour index for occupancy and a
+lexsort plus diff for the gaps between consecutive appointments of a day.
+
+NumPy is optional (capability ``numpy``); ``report()`` raises
+MissingDependency without it. Results are cached in the ``default`` cache for
+CLINIC_UTILIZATION_CACHE_SECONDS.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from . import capabilities, refcache
+from .models import Appointment, ArchivedAppointment
+
+CANCELED = Appointment.CANCELED_STATUSES
+NO_SHOW = Appointment.NO_SHOW
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+CHUNK_SIZE = 50_000
+
+# dentist id, day number (days since 1970-01-01), minute of the day, status
+# code, and the status label of each code.
+Columns = namedtuple('Columns', 'dentist day minute status labels')
+
+
+def _row_dtype(np):
+    # Dates and times are selected as text: 'YYYY-MM-DD' parses straight into
+    # datetime64 and only the 'HH:MM' prefix of the time is kept, as bytes.
+    return np.dtype([('dentist', np.int64), ('day', 'datetime64[D]'), ('time', 'S5'), ('status', 'U50')])
+
+
+def _minutes(np, times):
+    digits = np.ascontiguousarray(times).view(np.uint8).reshape(-1, 5).astype(np.int16) - ord('0')
+    return (digits[:, 0] * 10 + digits[:, 1]) * 60 + digits[:, 3] * 10 + digits[:, 4]
+
+
+def _query(model, filters):
+    return (
+        model.objects.filter(**filters).order_by()
+        .annotate(date_text=Cast('appointment_date', CharField()), time_text=Cast('appointment_time', CharField()))
+        .values_list('dentist_id', 'date_text', 'time_text', 'status')
+    )
+
+
+def load(start, end, dentist=None, include_archived=False):
+    """Columns of the appointments dated ``start``..``end`` (inclusive)."""
+    np = capabilities.load('numpy')
+    filters = {'appointment_date__gte': start, 'appointment_date__lte': end}
+    if dentist is not None:
+        filters['dentist_id'] = dentist
+    qs = _query(Appointment, filters)
+    if include_archived:
+        qs = qs.union(_query(ArchivedAppointment, filters), all=True)
+    sql, params = qs.query.sql_with_params()
+
+    row_dtype = _row_dtype(np)
+    codes = {}
+    parts = []
+    with connections[qs.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        # Chunks keep the Python row tuples alive only briefly; each becomes
+        # one structured array, parsed in C.
+        while rows := cursor.fetchmany(CHUNK_SIZE):
+            chunk = np.array(rows, dtype=row_dtype)
+            labels, inverse = np.unique(chunk['status'], return_inverse=True)
+            chunk_codes = np.array([codes.setdefault(str(label), len(codes)) for label in labels], dtype=np.int16)
+            parts.append((chunk['dentist'], chunk['day'].astype(np.int64), _minutes(np, chunk['time']),
+                          chunk_codes[inverse]))
+
+    if not parts:
+        parts.append((np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int16), np.empty(0, np.int16)))
+    dentist, day, minute, status = (np.concatenate(column) for column in zip(*parts))
+    return Columns(dentist, day, minute, status, np.array(list(codes), dtype=str))
+
+
+def summarize(columns, start, end, today, slot_minutes):
+    """Per-dentist and clinic-wide aggregates of ``columns`` as plain Python values."""
+    np = capabilities.load('numpy')
+    dentists, dentist = np.unique(columns.dentist, return_inverse=True)
+    n_dentists = len(dentists)
+    canceled = np.isin(columns.status, np.flatnonzero(np.isin(columns.labels, CANCELED)))
+    no_show = np.isin(columns.status, np.flatnonzero(columns.labels == NO_SHOW))
+    booked = ~canceled
+    # 1970-01-01 was a Thursday; this makes Monday 0.
+    weekday = (columns.day + 3) % 7
+    hour = columns.minute // 60
+
+    # Occupancy: booked appointments per dentist, weekday and hour over the
+    # slots that hour offered in the period.
+    cells = (dentist[booked] * 7 + weekday[booked]) * 24 + hour[booked]
+    heat = np.bincount(cells, minlength=n_dentists * 7 * 24).reshape(n_dentists, 7, 24)
+    period = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1).astype(np.int64)
+    slots = np.bincount((period + 3) % 7, minlength=7)[:, None] * (60 / slot_minutes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        occupancy = np.where(slots > 0, heat / slots, 0.0)
+        clinic_occupancy = np.where(slots > 0, heat.sum(axis=0) / (slots * max(n_dentists, 1)), 0.0)
+    hours = np.flatnonzero(heat.sum(axis=(0, 1)))
+    first, last = (int(hours[0]), int(hours[-1]) + 1) if len(hours) else (0, 0)
+
+    # Gaps: idle minutes between the end of one booked appointment and the
+    # start of the next for the same dentist on the same day.
+    order = np.lexsort((columns.minute[booked], columns.day[booked], dentist[booked]))
+    d, day, minute = dentist[booked][order], columns.day[booked][order], columns.minute[booked][order]
+    same_day = (d[1:] == d[:-1]) & (day[1:] == day[:-1])
+    gap = np.maximum(minute[1:].astype(np.int32) - minute[:-1] - slot_minutes, 0)[same_day]
+    gap_owner = d[1:][same_day]
+    gap_total = np.bincount(gap_owner, weights=gap, minlength=n_dentists)
+    gap_count = np.bincount(gap_owner, minlength=n_dentists)
+
+    # No-shows: share of the non-canceled appointments already due.
+    due = booked & (columns.day < np.datetime64(today, 'D').astype(np.int64))
+    due_count = np.bincount(dentist[due], minlength=n_dentists)
+    no_show_count = np.bincount(dentist[no_show & due], minlength=n_dentists)
+    total = np.bincount(dentist, minlength=n_dentists)
+    canceled_count = np.bincount(dentist[canceled], minlength=n_dentists)
+
+    def ratio(a, b):
+        return round(float(a) / float(b), 4) if b else None
+
+    def grid(values):
+        return np.round(values[:, first:last], 3).tolist()
+
+    names = refcache.dentist_names()
+    return {
+        'weekdays': list(WEEKDAYS),
+        'hours': list(range(first, last)),
+        'totals': {
+            'appointments': int(total.sum()),
+            'canceled': int(canceled_count.sum()),
+            'no_shows': int(no_show_count.sum()),
+            'no_show_rate': ratio(no_show_count.sum(), due_count.sum()),
+            'avg_gap_minutes': ratio(gap_total.sum(), gap_count.sum()),
+            'occupancy': grid(clinic_occupancy),
+        },
+        'dentists': [
+            {
+                'dentist': int(dentist_id),
+                'name': names.get(int(dentist_id), ''),
+                'appointments': int(total[i]),
+                'canceled': int(canceled_count[i]),
+                'no_shows': int(no_show_count[i]),
+                'no_show_rate': ratio(no_show_count[i], due_count[i]),
+                'avg_gap_minutes': ratio(gap_total[i], gap_count[i]),
+                'occupancy': grid(occupancy[i]),
+            }
+            for i, dentist_id in enumerate(dentists)
+        ],
+    }
+
+
+def report(start, end, today, dentist=None, include_archived=False):
+    """The utilization report for ``start``..``end``, cached."""
+    slot_minutes = getattr(settings, 'CLINIC_APPOINTMENT_SLOT_MINUTES', 30)
+    key = f'utilization:{start}:{end}:{today}:{dentist}:{int(include_archived)}:{slot_minutes}'
+    result = cache.get(key)
+    if result is None:
+        columns = load(start, end, dentist, include_archived)
+        result = {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'slot_minutes': slot_minutes,
+            **summarize(columns, start, end, today, slot_minutes),
+        }
+        cache.set(key, result, getattr(settings, 'CLINIC_UTILIZATION_CACHE_SECONDS', 300))
+    return result
+
+
+def default_period(today):
+    return today - timedelta(days=getattr(settings, 'CLINIC_UTILIZATION_DAYS', 90)), today